@@ -0,0 +1,432 @@
+"""
+Microbenchmarks of the hot paths of essentials.caching, with functools.lru_cache
+and functools.cache as baselines:
+
+- hit: reading items that are in the cache;
+- miss: reading items that are not in the cache;
+- set: replacing items that are in the cache;
+- churn: reading items in a loop larger than the cache, setting items on misses
+  (every operation causes an eviction);
+- expiry: setting items with a short time to live and reading them after they
+  expired;
+- threads: reading and setting items from several threads.
+
+Each benchmark is repeated, and the best time is reported in nanoseconds per
+operation. Results can be written to a JSON file, and compared with the results
+of a previous run, for example of another commit:
+
+    python -m benchmarks.caching --json before.json
+    python -m benchmarks.caching --json after.json --compare before.json
+"""
+
+import argparse
+import functools
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable
+
+from essentials.caching import (
+    Cache,
+    CompactExpiringCache,
+    ExpiringCache,
+    ShardedCache,
+    lazy,
+)
+
+Benchmark = Callable[[int], Callable[[], None]]
+BENCHMARKS: dict[str, dict[str, Benchmark]] = {}
+
+
+def benchmark(case: str, implementation: str):
+    """
+    Registers a benchmark: a function called with the number of operations,
+    returning a function that runs them.
+    """
+
+    def decorator(fn: Benchmark) -> Benchmark:
+        BENCHMARKS.setdefault(case, {})[implementation] = fn
+        return fn
+
+    return decorator
+
+
+def identity(value):
+    return value
+
+
+# hit
+
+
+@benchmark("hit", "Cache")
+def cache_hit(ops: int):
+    cache: Cache = Cache(1000)
+    for key in range(1000):
+        cache[key] = key
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            cache[key]
+
+    return run
+
+
+@benchmark("hit", "ExpiringCache")
+def expiring_cache_hit(ops: int):
+    cache: ExpiringCache = ExpiringCache.with_max_age(3600, 1000)
+    for key in range(1000):
+        cache[key] = key
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            cache[key]
+
+    return run
+
+
+@benchmark("hit", "CompactExpiringCache")
+def compact_expiring_cache_hit(ops: int):
+    cache = CompactExpiringCache.with_max_age(3600, 1000)
+    for key in range(1000):
+        cache[key] = key
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            cache[key]
+
+    return run
+
+
+@benchmark("hit", "lazy")
+def lazy_hit(ops: int):
+    fn = lazy(3600, Cache(1000))(identity)
+    for key in range(1000):
+        fn(key)
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+@benchmark("hit", "lru_cache")
+def lru_cache_hit(ops: int):
+    fn = functools.lru_cache(1000)(identity)
+    for key in range(1000):
+        fn(key)
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+@benchmark("hit", "functools.cache")
+def functools_cache_hit(ops: int):
+    fn = functools.cache(identity)
+    for key in range(1000):
+        fn(key)
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+# miss
+
+
+@benchmark("miss", "Cache")
+def cache_miss(ops: int):
+    cache: Cache = Cache(1000)
+    keys = list(range(ops))
+
+    def run():
+        for key in keys:
+            cache.get(key)
+
+    return run
+
+
+@benchmark("miss", "ExpiringCache")
+def expiring_cache_miss(ops: int):
+    cache: ExpiringCache = ExpiringCache.with_max_age(3600, 1000)
+    keys = list(range(ops))
+
+    def run():
+        for key in keys:
+            cache.get(key)
+
+    return run
+
+
+# set
+
+
+@benchmark("set", "Cache")
+def cache_set(ops: int):
+    cache: Cache = Cache(1000)
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            cache[key] = key
+
+    return run
+
+
+@benchmark("set", "ExpiringCache")
+def expiring_cache_set(ops: int):
+    cache: ExpiringCache = ExpiringCache.with_max_age(3600, 1000)
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            cache[key] = key
+
+    return run
+
+
+# churn
+
+
+def get_or_set(cache, keys: list) -> Callable[[], None]:
+    def run():
+        for key in keys:
+            if cache.get(key) is None:
+                cache[key] = key
+
+    return run
+
+
+@benchmark("churn", "Cache")
+def cache_churn(ops: int):
+    return get_or_set(Cache(1000), [key % 1001 for key in range(ops)])
+
+
+@benchmark("churn", "ExpiringCache")
+def expiring_cache_churn(ops: int):
+    return get_or_set(
+        ExpiringCache.with_max_age(3600, 1000), [key % 1001 for key in range(ops)]
+    )
+
+
+@benchmark("churn", "CompactExpiringCache")
+def compact_expiring_cache_churn(ops: int):
+    return get_or_set(
+        CompactExpiringCache.with_max_age(3600, 1000),
+        [key % 1001 for key in range(ops)],
+    )
+
+
+@benchmark("churn", "lazy")
+def lazy_churn(ops: int):
+    fn = lazy(3600, Cache(1000))(identity)
+    keys = [key % 1001 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+@benchmark("churn", "lru_cache")
+def lru_cache_churn(ops: int):
+    fn = functools.lru_cache(1000)(identity)
+    keys = [key % 1001 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+# expiry
+
+
+@benchmark("expiry", "ExpiringCache")
+def expiring_cache_expiry(ops: int):
+    cache: ExpiringCache = ExpiringCache(max_size=1000)
+    keys = list(range(ops))
+
+    def run():
+        for key in keys:
+            cache.set(key, key, ttl=0)
+            cache.get(key)
+
+    return run
+
+
+@benchmark("expiry", "CompactExpiringCache")
+def compact_expiring_cache_expiry(ops: int):
+    cache: CompactExpiringCache = CompactExpiringCache(max_size=1000)
+    keys = list(range(ops))
+
+    def run():
+        for key in keys:
+            cache.set(key, key, ttl=0)
+            cache.get(key)
+
+    return run
+
+
+@benchmark("expiry", "lazy")
+def lazy_expiry(ops: int):
+    fn = lazy(1e-9, Cache(1000))(identity)  # type: ignore[arg-type]
+    keys = [key % 1000 for key in range(ops)]
+
+    def run():
+        for key in keys:
+            fn(key)
+
+    return run
+
+
+# threads
+
+
+class LockedCache:
+    def __init__(self, cache: Cache) -> None:
+        self._cache = cache
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+
+def threaded(work: Callable[[list], None], ops: int, threads: int = 4):
+    rnd = random.Random(0)
+    samples = [
+        [rnd.randrange(2000) for _ in range(ops // threads)] for _ in range(threads)
+    ]
+
+    def run():
+        workers = [threading.Thread(target=work, args=(sample,)) for sample in samples]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    return run
+
+
+@benchmark("threads", "Cache+Lock")
+def locked_cache_threads(ops: int):
+    cache = LockedCache(Cache(1000))
+    return threaded(lambda keys: get_or_set(cache, keys)(), ops)
+
+
+@benchmark("threads", "ShardedCache")
+def sharded_cache_threads(ops: int):
+    cache: ShardedCache = ShardedCache(1000)
+    return threaded(lambda keys: get_or_set(cache, keys)(), ops)
+
+
+@benchmark("threads", "lru_cache")
+def lru_cache_threads(ops: int):
+    fn = functools.lru_cache(1000)(identity)
+
+    def work(keys):
+        for key in keys:
+            fn(key)
+
+    return threaded(work, ops)
+
+
+def measure(fn: Benchmark, ops: int, repeat: int) -> float:
+    """Returns the best time of a benchmark, in nanoseconds per operation."""
+    best = float("inf")
+    for _ in range(repeat):
+        run = fn(ops)
+        start = time.perf_counter_ns()
+        run()
+        best = min(best, time.perf_counter_ns() - start)
+    return best / ops
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ops", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", default=",".join(BENCHMARKS))
+    parser.add_argument("--json", help="file where results are written")
+    parser.add_argument("--compare", help="results of a previous run")
+    args = parser.parse_args()
+
+    baseline: dict[tuple[str, str], float] = {}
+    if args.compare:
+        with open(args.compare, encoding="utf8") as baseline_file:
+            for result in json.load(baseline_file)["results"]:
+                key = (result["case"], result["implementation"])
+                baseline[key] = result["ns_per_op"]
+
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    report: dict[str, Any] = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "gil_enabled": gil_enabled,
+        "machine": platform.machine(),
+        "commit": get_commit(),
+        "ops": args.ops,
+        "repeat": args.repeat,
+        "results": [],
+    }
+    print(f"Python {report['python']}, GIL enabled: {gil_enabled}")
+    print(f"{'case':>8} {'implementation':>20} {'ns/op':>10} {'vs baseline':>12}")
+
+    for case in args.cases.split(","):
+        for implementation, fn in BENCHMARKS[case].items():
+            ns_per_op = measure(fn, args.ops, args.repeat)
+            report["results"].append(
+                {
+                    "case": case,
+                    "implementation": implementation,
+                    "ns_per_op": round(ns_per_op, 2),
+                    "ops_per_sec": round(1e9 / ns_per_op),
+                }
+            )
+            previous = baseline.get((case, implementation))
+            change = f"{ns_per_op / previous - 1:>+11.1%}" if previous else ""
+            print(f"{case:>8} {implementation:>20} {ns_per_op:>10.1f} {change:>12}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
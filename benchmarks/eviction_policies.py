@@ -0,0 +1,106 @@
+"""
+Replays access traces against caches configured with different eviction
+policies, reporting hit ratio and operations per second.
+
+Traces are either synthetic, or read from a text file containing one key per
+line (for example, extracted from access logs):
+
+    python -m benchmarks.eviction_policies [--size 1000] [--length 200000]
+    python -m benchmarks.eviction_policies --trace keys.txt --size 5000
+
+Synthetic traces:
+
+- zipf: keys follow a Zipf-like distribution (skewed popularity);
+- scan: zipf accesses interleaved with scans of keys that are never reused;
+- loop: keys accessed cyclically, in a loop slightly larger than the cache.
+"""
+
+import argparse
+import random
+import time
+from typing import Iterable
+
+from essentials.caching import Cache
+
+POLICIES = ["lru", "lfu", "sieve", "arc", "tinylfu"]
+
+
+def zipf_trace(length: int, keys: int, skew: float, seed: int) -> list[int]:
+    rnd = random.Random(seed)
+    weights = [1 / (rank**skew) for rank in range(1, keys + 1)]
+    population = list(range(keys))
+    rnd.shuffle(population)
+    return rnd.choices(population, weights, k=length)
+
+
+def scan_trace(length: int, keys: int, skew: float, seed: int) -> list[int]:
+    rnd = random.Random(seed)
+    base = zipf_trace(length, keys, skew, seed)
+    trace: list[int] = []
+    next_scan_key = keys
+    for index, key in enumerate(base):
+        trace.append(key)
+        if index % 1000 == 999:
+            scan_length = rnd.randint(keys // 20, keys // 5)
+            trace.extend(range(next_scan_key, next_scan_key + scan_length))
+            next_scan_key += scan_length
+    return trace[:length]
+
+
+def loop_trace(length: int, size: int) -> list[int]:
+    loop = int(size * 1.2)
+    return [index % loop for index in range(length)]
+
+
+def read_trace(path: str) -> list[str]:
+    with open(path, encoding="utf8") as trace_file:
+        return [line.strip() for line in trace_file if line.strip()]
+
+
+def replay(policy: str, size: int, trace: Iterable) -> tuple[float, float]:
+    """Replays a trace, returns the hit ratio and operations per second."""
+    cache: Cache = Cache(size, policy=policy)
+    hits = 0
+    count = 0
+    start = time.perf_counter()
+    for key in trace:
+        count += 1
+        if cache.get(key) is None:
+            cache[key] = True
+        else:
+            hits += 1
+    elapsed = time.perf_counter() - start
+    return hits / count, count / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1000, help="cache max size")
+    parser.add_argument("--length", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=20_000)
+    parser.add_argument("--skew", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", help="file with one key per line")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    args = parser.parse_args()
+
+    traces: dict[str, list]
+    if args.trace:
+        traces = {args.trace: read_trace(args.trace)}
+    else:
+        traces = {
+            "zipf": zipf_trace(args.length, args.keys, args.skew, args.seed),
+            "scan": scan_trace(args.length, args.keys, args.skew, args.seed),
+            "loop": loop_trace(args.length, args.size),
+        }
+
+    print(f"cache size: {args.size}")
+    print(f"{'trace':>8} {'policy':>8} {'hit ratio':>10} {'ops/sec':>12}")
+    for name, trace in traces.items():
+        for policy in args.policies.split(","):
+            hit_ratio, ops = replay(policy, args.size, trace)
+            print(f"{name:>8} {policy:>8} {hit_ratio:>10.2%} {ops:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the throughput of a Cache protected by a single global lock with the
+throughput of a ShardedCache, for an increasing number of threads.
+
+On CPython builds with the GIL no gain is expected: the GIL serializes bytecode
+execution, and selecting a shard costs more than the contention it avoids. On
+CPython 3.11 the ShardedCache measured 0.77x to 0.92x the throughput of the
+locked Cache, with 1 to 8 threads. Lock striping can only pay off on
+free-threaded builds (python3.13t and later), which were not measured: run this
+benchmark on such a build before relying on ShardedCache for throughput.
+
+Usage:
+
+    python -m benchmarks.sharded_cache [--ops 200000] [--threads 1,2,4,8]
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from essentials.caching import Cache, ShardedCache
+
+
+class LockedCache:
+    """Baseline: a Cache whose every operation is protected by one lock."""
+
+    def __init__(self, max_size: int) -> None:
+        self._cache: Cache = Cache(max_size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._cache[key] = value
+
+
+def run(cache, threads: int, ops: int, keys: int) -> float:
+    """Runs ops operations split across threads, returns ops per second."""
+    per_thread = ops // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def work(seed: int) -> None:
+        rnd = random.Random(seed)
+        sample = [rnd.randrange(keys) for _ in range(per_thread)]
+        barrier.wait()
+        for key in sample:
+            if cache.get(key) is None:
+                cache[key] = key
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=20_000)
+    parser.add_argument("--max-size", type=int, default=10_000)
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--threads", default="1,2,4,8")
+    args = parser.parse_args()
+
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL enabled: {gil_enabled}")
+    print(f"{'threads':>8} {'locked Cache':>16} {'ShardedCache':>16} {'ratio':>8}")
+
+    for threads in (int(value) for value in args.threads.split(",")):
+        locked = run(LockedCache(args.max_size), threads, args.ops, args.keys)
+        sharded = run(
+            ShardedCache(args.max_size, args.shards), threads, args.ops, args.keys
+        )
+        print(
+            f"{threads:>8} {locked:>12,.0f} op/s {sharded:>12,.0f} op/s "
+            f"{sharded / locked:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
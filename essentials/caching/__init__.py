@@ -0,0 +1,49 @@
+from .cache import Cache, CachedItem, ExpiringCache
+from .compact import CompactExpiringCache
+from .decorators import CachedMethod, cached_method, lazy, lazy_many
+from .disk import DiskCache, TieredCache
+from .keys import make_key
+from .loader import BatchLoader
+from .partitioned import CacheTransport, HashRing, LocalTransport, PartitionedCache
+from .policies import (
+    ARCPolicy,
+    EvictionPolicy,
+    LFUPolicy,
+    SievePolicy,
+    TinyLFUPolicy,
+)
+from .sharded import ShardedCache
+from .shared import SharedMemoryCache
+from .stats import CacheStats, FlushStats
+from .sweeper import ExpirationSweeper
+from .writebehind import WriteBehindCache
+
+__all__ = [
+    "ARCPolicy",
+    "BatchLoader",
+    "Cache",
+    "CachedItem",
+    "CachedMethod",
+    "CacheStats",
+    "CacheTransport",
+    "CompactExpiringCache",
+    "DiskCache",
+    "EvictionPolicy",
+    "ExpirationSweeper",
+    "ExpiringCache",
+    "FlushStats",
+    "HashRing",
+    "LFUPolicy",
+    "LocalTransport",
+    "PartitionedCache",
+    "ShardedCache",
+    "SharedMemoryCache",
+    "SievePolicy",
+    "TieredCache",
+    "TinyLFUPolicy",
+    "WriteBehindCache",
+    "cached_method",
+    "lazy",
+    "lazy_many",
+    "make_key",
+]
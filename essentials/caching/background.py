@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from inspect import iscoroutinefunction
+from typing import Any, Callable
+
+logger = logging.getLogger("essentials.caching")
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+# strong references to running tasks, the event loop only keeps weak ones
+_tasks: set[asyncio.Future] = set()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool used to run synchronous background work."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(thread_name_prefix="essentials-caching")
+    return _executor
+
+
+def _log_failure(future: "Future | asyncio.Future") -> None:
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Background cache operation failed", exc_info=exc)
+
+
+def _on_task_done(task: asyncio.Future) -> None:
+    _tasks.discard(task)
+    _log_failure(task)
+
+
+def run_in_background(fn: Callable[..., Any], *args: Any) -> None:
+    """
+    Runs fn(*args) without waiting for its completion: coroutine functions are
+    scheduled as tasks of the running event loop, other functions are submitted
+    to a thread pool. Exceptions are logged using the essentials.caching logger.
+    """
+    if iscoroutinefunction(fn):
+        task = asyncio.get_running_loop().create_task(fn(*args))
+        _tasks.add(task)
+        task.add_done_callback(_on_task_done)
+    else:
+        get_executor().submit(fn, *args).add_done_callback(_log_failure)
@@ -0,0 +1,1073 @@
+import asyncio
+import math
+import os
+import pickle
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from functools import partial
+from heapq import heapify, heappop, heappush
+from inspect import isawaitable, iscoroutinefunction
+from itertools import count
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    ContextManager,
+    Generic,
+    Iterable,
+    Iterator,
+    Mapping,
+    TypeVar,
+)
+
+from essentials.exceptions import InvalidOperation
+
+from .background import run_in_background
+from .locks import KeyLocks
+from .policies import EvictionPolicy, get_policy
+from .stats import CacheStats, StatsCounter
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+T = TypeVar("T")
+
+_SNAPSHOT_HEADER = b"essentials.caching\x01"
+
+# returned by get for missing keys, since None is a valid value
+_MISSING: Any = object()
+
+
+def default_weigher(key: Any, value: Any) -> int:
+    """
+    Returns the weight of a cached value: its length for bytes and strings, 1 for
+    any other kind of object.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    return 1
+
+
+class Cache(Generic[T]):
+    """
+    In-memory cache implementation, by default evicting the least recently used
+    items. Other eviction policies can be configured by instance, or by name:
+    "lfu", "sieve", "arc", "tinylfu" (see essentials.caching.policies).
+
+    The cache holds up to max_size items. When max_weight is specified, the
+    total weight of items is also limited to max_weight: the weight of each item
+    is calculated by the weigher function, called with key and value when the
+    item is set. By default, the weight of bytes and strings is their length,
+    and the weight of other objects is 1.
+
+    When track_stats is True, the cache counts hits, misses and evictions,
+    which can be read using the stats() method.
+
+    When on_evict is specified, it is called with the key and the value of each
+    item evicted to make room for other items (not for items deleted, or
+    expired), for example to move evicted items to a second tier cache.
+
+    Items can be set with tags, to remove all the items having a tag at once
+    using invalidate_tag(tag), at the cost of the number of items having the tag.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 500,
+        *,
+        max_weight: int | None = None,
+        weigher: "Callable[[Any, Any], int] | None" = None,
+        policy: "EvictionPolicy | str | dict | None" = None,
+        track_stats: bool = False,
+        on_evict: "Callable[[Any, T], None] | None" = None,
+    ) -> None:
+        self._bag: OrderedDict[Any, Any] = OrderedDict()
+        self.on_evict = on_evict
+        self._max_size = -1
+        self._policy = get_policy(policy)
+        self.max_size = max_size
+        self._stats: StatsCounter | None = StatsCounter() if track_stats else None
+        assert max_weight is not None or weigher is None, "weigher requires max_weight"
+        assert max_weight is None or max_weight > 0
+        self._max_weight = max_weight
+        self._weigher = weigher or default_weigher
+        # weights by key, only when weights are tracked
+        self._weights: dict[Any, int] | None = None if max_weight is None else {}
+        self._weight = 0
+        # tag -> keys of the items set with the tag, and key -> tags
+        self._tags: dict[Any, set[Any]] = {}
+        self._key_tags: dict[Any, frozenset[Any]] = {}
+        # keys whose values are being created by get_or_create, aget_or_create
+        self._key_locks = KeyLocks()
+        self._creating: dict[Any, asyncio.Future] = {}
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: int) -> None:
+        assert value > 0
+        self._max_size = int(value)
+        if self._policy is not None:
+            self._policy.resize(self._max_size)
+
+    @property
+    def policy(self) -> EvictionPolicy | None:
+        """Returns the eviction policy of the cache, or None for LRU."""
+        return self._policy
+
+    @property
+    def max_weight(self) -> int | None:
+        return self._max_weight
+
+    @max_weight.setter
+    def max_weight(self, value: int) -> None:
+        assert value > 0
+        if self._weights is None:
+            raise InvalidOperation("The cache was not created with max_weight.")
+        self._max_weight = int(value)
+
+    @property
+    def weight(self) -> int:
+        """
+        Returns the total weight of the items in the cache, if the cache is
+        bounded by max_weight, otherwise the number of items.
+        """
+        if self._weights is None:
+            return len(self._bag)
+        return self._weight
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self._bag) == 0
+
+    @property
+    def track_stats(self) -> bool:
+        return self._stats is not None
+
+    @track_stats.setter
+    def track_stats(self, value: bool) -> None:
+        if not value:
+            self._stats = None
+        elif self._stats is None:
+            self._stats = StatsCounter()
+
+    def stats(self) -> CacheStats:
+        """
+        Returns a snapshot of the statistics of the cache. All counters are zero
+        if statistics are not tracked.
+        """
+        if self._stats is None:
+            return CacheStats()
+        return self._stats.snapshot()
+
+    def reset_stats(self) -> None:
+        if self._stats is not None:
+            self._stats.reset()
+
+    def values(self) -> Iterable[T]:
+        for _, value in self:
+            yield value
+
+    def keys(self) -> Iterable[Any]:
+        for key, _ in self:
+            yield key
+
+    def __repr__(self) -> str:
+        return f"<Cache {len(self)} at {id(self)}>"
+
+    def __len__(self) -> int:
+        return len(self._bag)
+
+    def get(self, key, default=None) -> T:
+        value = self._bag.get(key, _MISSING)
+        if value is _MISSING:
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        try:
+            if self._policy is None:
+                self._bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+        except KeyError:
+            # removed by another thread after it was read
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        if self._stats is not None:
+            self._stats.hits += 1
+        return value
+
+    def get_or_create(self, key, factory: "Callable[[], T]", **options: Any) -> T:
+        """
+        Returns the value of a key, or creates it calling factory() and sets it
+        in the cache, with the given options of set (for example, tags).
+
+        Concurrent threads creating the value of the same key wait for the first
+        one to complete, so that factory is called once for a key at a time.
+        Exceptions raised by factory are propagated and nothing is cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._key_locks.acquire(key):
+            # another thread might have created the value while this one was
+            # waiting for the lock
+            if key in self:
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+            value = factory()
+            self.set(key, value, **options)
+        return value
+
+    async def aget_or_create(
+        self, key, factory: "Callable[[], Awaitable[T]]", **options: Any
+    ) -> T:
+        """
+        Returns the value of a key, or creates it awaiting factory() and sets it
+        in the cache, with the given options of set (for example, tags).
+
+        Concurrent calls creating the value of the same key await the same call
+        of factory. Exceptions raised by factory are propagated to all of them
+        and nothing is cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        task = self._creating.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._create(key, factory, options))
+            self._creating[key] = task
+            task.add_done_callback(partial(self._created, key))
+        # a caller being cancelled must not cancel the call other callers await
+        return await asyncio.shield(task)
+
+    async def _create(self, key, factory, options: dict[str, Any]) -> T:
+        value = factory()
+        if isawaitable(value):
+            value = await value
+        self.set(key, value, **options)
+        return value
+
+    def _created(self, key, task: asyncio.Future) -> None:
+        if self._creating.get(key) is task:
+            del self._creating[key]
+        if not task.cancelled():
+            # mark the exception as retrieved, callers already received it
+            task.exception()
+
+    def set(self, key, value, *, tags: Iterable[Any] | None = None) -> None:
+        """
+        Sets an item in the cache, optionally with tags that can be used to
+        remove it with invalidate_tag. Setting an existing item replaces its tags.
+        """
+        overflowing = self._store(key, value)
+        if tags is not None:
+            self._tag(key, tags)
+        if overflowing:
+            self._check_size()
+
+    def invalidate_tag(self, tag) -> int:
+        """
+        Removes the items set with the given tag, returning the number of removed
+        items.
+        """
+        keys = list(self._tags.get(tag, ()))
+        for key in keys:
+            del self[key]
+        return len(keys)
+
+    def _tag(self, key, tags: Iterable[Any]) -> None:
+        key_tags = frozenset(tags)
+        if key_tags:
+            self._key_tags[key] = key_tags
+            for tag in key_tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def _untag(self, key) -> None:
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+    def _weigh(self, key, value) -> None:
+        assert self._weights is not None
+        weight = self._weigher(key, value)
+        assert weight >= 0
+        self._weight += weight - self._weights.get(key, 0)
+        self._weights[key] = weight
+
+    def _unweigh(self, key) -> None:
+        assert self._weights is not None
+        self._weight -= self._weights.pop(key, 0)
+
+    def _overflowing(self) -> bool:
+        if len(self._bag) > self.max_size:
+            return True
+        return self._max_weight is not None and self._weight > self._max_weight
+
+    def _check_size(self) -> None:
+        while self._overflowing():
+            if self._policy is None:
+                key, value = self._bag.popitem(last=False)
+            else:
+                key = self._policy.evict()
+                value = self._bag.pop(key)
+            if self._weights is not None:
+                self._unweigh(key)
+            if self._key_tags:
+                self._untag(key)
+            if self._stats is not None:
+                self._stats.evictions += 1
+            self._evicted(key, value)
+
+    def _evicted(self, key, value) -> None:
+        """Called with the key and the stored value of each evicted item."""
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def __getitem__(self, key) -> T:
+        try:
+            value = self._bag[key]
+        except KeyError:
+            if self._stats is not None:
+                self._stats.misses += 1
+            raise
+        if self._policy is None:
+            self._bag.move_to_end(key, last=True)
+        else:
+            self._policy.access(key)
+        if self._stats is not None:
+            self._stats.hits += 1
+        return value
+
+    def get_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the items found in the cache, by key. Missing keys
+        are not included in the returned dictionary.
+        """
+        bag = self._bag
+        policy = self._policy
+        found = {}
+        requested = 0
+        for key in keys:
+            requested += 1
+            if key not in bag:
+                continue
+            if policy is None:
+                bag.move_to_end(key, last=True)
+            else:
+                policy.access(key)
+            found[key] = bag[key]
+        if self._stats is not None:
+            self._stats.hits += len(found)
+            self._stats.misses += requested - len(found)
+        return found
+
+    def set_many(
+        self,
+        items: Mapping[Any, T] | Iterable[tuple[Any, T]],
+        *,
+        tags: Iterable[Any] | None = None,
+    ) -> None:
+        """
+        Sets many items in the cache, from a mapping or from (key, value) pairs,
+        optionally with tags. Items are evicted once, after all items are set: if
+        more items than max_size are set at once, the first ones are evicted.
+        """
+        if isinstance(items, Mapping):
+            items = items.items()
+        if tags is not None:
+            tags = frozenset(tags)
+        overflowing = False
+        for key, value in items:
+            overflowing |= self._store(key, value)
+            if tags:
+                self._tag(key, tags)
+        if overflowing:
+            self._check_size()
+
+    def delete_many(self, keys: Iterable[Any]) -> int:
+        """
+        Removes many items from the cache, ignoring missing keys. Returns the
+        number of removed items.
+        """
+        removed = 0
+        for key in keys:
+            if key in self._bag:
+                del self[key]
+                removed += 1
+        return removed
+
+    def _store(self, key, value: T) -> bool:
+        """
+        Stores an item without evicting other items, returning a value indicating
+        whether the cache may need to evict items.
+        """
+        if self._key_tags:
+            self._untag(key)
+        if key in self._bag:
+            self._bag[key] = value
+            if self._policy is None:
+                self._bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+            if self._weights is not None:
+                self._weigh(key, value)
+                return True
+            return False
+        self._bag[key] = value
+        if self._policy is not None:
+            self._policy.insert(key)
+        if self._weights is not None:
+            self._weigh(key, value)
+        return True
+
+    def __setitem__(self, key, value: T) -> None:
+        if self._store(key, value):
+            self._check_size()
+
+    def __delitem__(self, key) -> None:
+        del self._bag[key]
+        if self._policy is not None:
+            self._policy.remove(key)
+        if self._weights is not None:
+            self._unweigh(key)
+        if self._key_tags:
+            self._untag(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._bag
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        return iter(self._bag.items())
+
+    def dump(self, path: str) -> None:
+        """
+        Saves the items of the cache to a file, least recently used first, so
+        that they can be restored using load(path), for example to start a new
+        process with a warm cache. Values are serialized using pickle.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as snapshot:
+            snapshot.write(_SNAPSHOT_HEADER)
+            pickle.dump(
+                (time.time(), self._dump_records()), snapshot, pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> int:
+        """
+        Sets the items saved by dump(path) in the cache, restoring their order,
+        and returns the number of restored items. Items that expired since the
+        file was saved are discarded. Never load files from untrusted sources:
+        values are deserialized using pickle.
+        """
+        with open(path, "rb") as snapshot:
+            if snapshot.read(len(_SNAPSHOT_HEADER)) != _SNAPSHOT_HEADER:
+                raise ValueError(f"The file {path} is not a cache snapshot.")
+            dumped_at, records = pickle.load(snapshot)
+        return self._load_records(records, max(0.0, time.time() - dumped_at))
+
+    def _dump_records(self) -> list[tuple]:
+        return list(self._bag.items())
+
+    def _load_records(self, records: list[tuple], elapsed: float) -> int:
+        overflowing = False
+        for record in records:
+            overflowing |= self._store(record[0], record[1])
+        if overflowing:
+            self._check_size()
+        return sum(1 for record in records if record[0] in self._bag)
+
+    def clear(self) -> None:
+        self._bag.clear()
+        if self._policy is not None:
+            self._policy.clear()
+        if self._weights is not None:
+            self._weights.clear()
+            self._weight = 0
+        self._tags.clear()
+        self._key_tags.clear()
+
+
+class CachedItem(Generic[T]):
+    """
+    Container for cached items with update timestamp and, optionally, a time to
+    live. The expiration deadline is measured with the monotonic clock, so it is
+    not affected by changes of the system time.
+    """
+
+    __slots__ = ("_value", "_time", "_ttl", "_expires")
+
+    def __init__(self, value: T, ttl: float | None = None) -> None:
+        self._value = value
+        self._time = time.time()
+        self.ttl = ttl
+
+    @property
+    def value(self) -> T:
+        return self._value
+
+    @value.setter
+    def value(self, value: T) -> None:
+        self._value = value
+        self._time = time.time()
+
+    @property
+    def time(self) -> float:
+        return self._time
+
+    @property
+    def ttl(self) -> float | None:
+        return self._ttl
+
+    @ttl.setter
+    def ttl(self, value: float | None) -> None:
+        """Sets the time to live of the item, starting from now."""
+        self._ttl = value
+        self._expires = math.inf if value is None else time.monotonic() + value
+
+    @property
+    def expires(self) -> float:
+        """
+        Returns the time.monotonic() value after which the item is expired, or
+        infinity if the item has no time to live.
+        """
+        return self._expires
+
+    def touch(self) -> None:
+        """Extends the expiration deadline of the item by its time to live."""
+        if self._ttl is not None:
+            self._expires = time.monotonic() + self._ttl
+
+
+class ExpiringCache(Cache[T]):
+    """
+    A cache whose items can expire after a time to live, or by a given function.
+
+    The time to live is max_age by default, and can be specified for each item
+    using set(key, value, ttl). Expiration deadlines are calculated when items are
+    set and indexed in a heap, so checking if an item is expired requires a single
+    comparison, and purging expired items touches only the items that actually
+    expired. Expiration policies instead require evaluating every item. Both can
+    be combined.
+
+    When sliding is True, reading an item extends its expiration deadline by its
+    time to live.
+
+    When stale_ttl and refresh are specified, expired items are still returned
+    for stale_ttl seconds after their deadline (or, for items expired by the
+    expiration policy, since they are first found expired), while the refresh
+    function is called in background with their key to obtain a new value: on a
+    thread pool for synchronous functions, in an asyncio task for coroutine
+    functions. Items set or deleted while they are refreshed are not overwritten
+    by the refreshed value. Items whose refresh cannot be scheduled, like items
+    with a coroutine refresh function read outside of a running event loop, are
+    treated as expired.
+
+    ExpiringCache is not thread-safe, and synchronous refresh functions run on
+    other threads: pass as lock the lock that protects the cache, which is held
+    while refreshed values are set. ShardedCache passes the locks of its shards
+    to shards that are instances of ExpiringCache.
+    """
+
+    def __init__(
+        self,
+        expiration_policy: "Callable[[CachedItem[T]], bool] | None" = None,
+        max_size: int = 500,
+        *,
+        max_age: float | None = None,
+        sliding: bool = False,
+        stale_ttl: float | None = None,
+        refresh: "Callable[[Any], Any] | None" = None,
+        lock: ContextManager | None = None,
+        max_weight: int | None = None,
+        weigher: "Callable[[Any, Any], int] | None" = None,
+        policy: "EvictionPolicy | str | dict | None" = None,
+        track_stats: bool = False,
+        on_evict: "Callable[[Any, T], None] | None" = None,
+    ) -> None:
+        super().__init__(
+            max_size,
+            max_weight=max_weight,
+            weigher=weigher,
+            policy=policy,
+            track_stats=track_stats,
+            on_evict=on_evict,
+        )
+        assert max_age is None or max_age >= 0
+        assert stale_ttl is None or refresh is not None, "stale_ttl requires refresh"
+        self.expiration_policy = expiration_policy
+        self._max_age = max_age
+        self._sliding = sliding
+        # min-heap of (deadline, sequence, key): an entry can be older than the
+        # deadline of its item, if the item was updated or read in sliding mode
+        self._deadlines: list[tuple[float, int, Any]] = []
+        self._sequence = count()
+        self.stale_ttl = stale_ttl
+        self.refresh = refresh
+        # key -> time when the expired item was first returned stale
+        self._stale_since: dict[Any, float] = {}
+        # key -> token of the refresh in progress, discarded when the item is set
+        # or deleted, so that the refreshed value does not overwrite it
+        self._refreshing: dict[Any, object] = {}
+        self._refresh_lock = lock
+        self._policy_scan: list[Any] = []
+
+    @property
+    def max_age(self) -> float | None:
+        """Returns the default time to live of items."""
+        return self._max_age
+
+    @property
+    def sliding(self) -> bool:
+        return self._sliding
+
+    @property
+    def full(self) -> bool:
+        if self.max_size <= len(self._bag):
+            return True
+        return self._max_weight is not None and self._weight > self._max_weight
+
+    def expired(self, item: CachedItem) -> bool:
+        if time.monotonic() > item._expires:
+            return True
+        return self.expiration_policy is not None and self.expiration_policy(item)
+
+    def _index_deadline(self, key, item: CachedItem) -> None:
+        deadlines = self._deadlines
+        if len(deadlines) > 2 * len(self._bag) + 64:
+            # too many entries of removed items: rebuild the heap
+            deadlines[:] = [
+                (item._expires, next(self._sequence), key)
+                for key, item in self._bag.items()
+                if item._expires != math.inf
+            ]
+            heapify(deadlines)
+        else:
+            heappush(deadlines, (item._expires, next(self._sequence), key))
+
+    def _remove_items_past_deadline(
+        self, grace: float = 0, stop_at: float = math.inf
+    ) -> int:
+        deadlines = self._deadlines
+        now = time.monotonic()
+        removed = 0
+        popped = 0
+        while deadlines and deadlines[0][0] + grace < now:
+            popped += 1
+            if popped % 64 == 0 and time.perf_counter() > stop_at:
+                break
+            _, _, key = heappop(deadlines)
+            item = self._bag.get(key)
+            if item is None:
+                continue
+            if now > item._expires + grace:
+                self._expire(key)
+                removed += 1
+            elif item._expires != math.inf:
+                # the deadline of the item was extended, or the item can still be
+                # served stale
+                heappush(deadlines, (item._expires, next(self._sequence), key))
+        return removed
+
+    def _remove_items_expired_by_policy(self, stop_at: float = math.inf) -> int:
+        # keys to evaluate, in reverse order, so that a scan interrupted by
+        # stop_at is resumed by the next call
+        if not self._policy_scan:
+            self._policy_scan = list(reversed(self._bag))
+        scan = self._policy_scan
+        removed = 0
+        while scan:
+            if len(scan) % 64 == 0 and time.perf_counter() > stop_at:
+                break
+            key = scan.pop()
+            item = self._bag.get(key)
+            if item is not None and self.expired(item):
+                self._expire(key)
+                removed += 1
+        return removed
+
+    def _remove_expired_items(self) -> None:
+        if self._deadlines:
+            self._remove_items_past_deadline()
+        if self.expiration_policy is not None:
+            for key, item in list(self._bag.items()):
+                if self.expired(item):
+                    self._expire(key)
+
+    def remove_expired(self, max_time: float | None = None) -> int:
+        """
+        Removes expired items and returns the number of removed items. Items
+        past their deadline by less than stale_ttl are kept, to be served stale.
+
+        When max_time is specified, stops after about max_time seconds, so that
+        expired items can be removed in small batches: items past their deadline
+        are removed first, then the items of the cache are evaluated by the
+        expiration policy, if any, continuing from where the previous call
+        stopped.
+        """
+        if max_time is None:
+            stop_at = math.inf
+            self._policy_scan.clear()
+        else:
+            stop_at = time.perf_counter() + max_time
+        removed = 0
+        if self._deadlines:
+            removed += self._remove_items_past_deadline(self.stale_ttl or 0, stop_at)
+        if self.expiration_policy is not None and time.perf_counter() < stop_at:
+            removed += self._remove_items_expired_by_policy(stop_at)
+        return removed
+
+    def _expire(self, key) -> None:
+        token = self._refreshing.get(key) if self._refreshing else None
+        if token is not None and key in self._key_tags:
+            # tagged items are not restored, since their tags could be
+            # invalidated while they are not in the cache
+            token = None
+        del self[key]
+        if token is not None:
+            # expired items are still replaced by their refreshed value
+            self._refreshing[key] = token
+        if self._stats is not None:
+            self._stats.expirations += 1
+
+    def _evicted(self, key, item: CachedItem) -> None:
+        if self.on_evict is not None:
+            self.on_evict(key, item.value)
+
+    def _check_size(self) -> None:
+        if self.full:
+            self._remove_expired_items()
+        super()._check_size()
+        if self._stale_since:
+            for key in [key for key in self._stale_since if key not in self._bag]:
+                del self._stale_since[key]
+
+    def _serve_stale(self, key, expires: float, now: float) -> bool:
+        """
+        Returns a value indicating whether the expired item with the given key
+        and deadline can still be returned, scheduling its refresh if necessary.
+        """
+        if self.stale_ttl is None:
+            return False
+
+        if now > expires:
+            expired_at = expires
+        else:
+            expired_at = self._stale_since.setdefault(key, now)
+        if now - expired_at > self.stale_ttl:
+            return False
+
+        if key not in self._refreshing:
+            refresh_item: "Callable[[Any, object], Any]"
+            if iscoroutinefunction(self.refresh):
+                refresh_item = self._refresh_item_async
+            else:
+                refresh_item = self._refresh_item
+            # the token is registered first, since threads can complete the
+            # refresh before run_in_background returns
+            token = self._refreshing[key] = object()
+            try:
+                run_in_background(refresh_item, key, token)
+            except RuntimeError:
+                # no running event loop, or the thread pool was shut down
+                del self._refreshing[key]
+                return False
+        return True
+
+    def _refreshed(self, key, token: object, value: Any) -> None:
+        with self._refresh_lock or nullcontext():
+            if self._refreshing.get(key) is not token:
+                # the item was set or deleted while refreshing
+                return
+            del self._refreshing[key]
+            if value is _MISSING:
+                return
+            # refreshed items keep their tags
+            tags = self._key_tags.get(key)
+            overflowing = self._store(key, value)
+            if tags is not None:
+                self._tag(key, tags)
+            if overflowing:
+                self._check_size()
+
+    def _refresh_item(self, key, token: object) -> None:
+        assert self.refresh is not None
+        value = _MISSING
+        try:
+            value = self.refresh(key)
+        finally:
+            self._refreshed(key, token, value)
+
+    async def _refresh_item_async(self, key, token: object) -> None:
+        assert self.refresh is not None
+        value = _MISSING
+        try:
+            value = await self.refresh(key)
+        finally:
+            self._refreshed(key, token, value)
+
+    def __getitem__(self, key) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None) -> T:
+        item = self._bag.get(key)
+        if item is None:
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        now = time.monotonic()
+        if (
+            now > item._expires
+            or (self.expiration_policy is not None and self.expiration_policy(item))
+        ) and not self._serve_stale(key, item._expires, now):
+            try:
+                self._expire(key)
+            except KeyError:
+                # removed by another thread after it was read
+                pass
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+
+        if self._sliding and item._ttl is not None:
+            item._expires = now + item._ttl
+        try:
+            if self._policy is None:
+                self._bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+        except KeyError:
+            # removed by another thread after it was read
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        if self._stats is not None:
+            self._stats.hits += 1
+        return item._value
+
+    def set(
+        self,
+        key,
+        value: T,
+        ttl: float | None = None,
+        *,
+        tags: Iterable[Any] | None = None,
+    ) -> None:
+        """
+        Sets an item in the cache, expiring after ttl seconds. If ttl is not
+        specified, the item expires after max_age seconds, if max_age is set.
+        Tags can be used to remove the item with invalidate_tag.
+        """
+        overflowing = self._store(key, value, ttl)
+        if tags is not None:
+            self._tag(key, tags)
+        if overflowing:
+            self._check_size()
+
+    def get_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the items found in the cache, by key. Missing and
+        expired keys are not included in the returned dictionary. The expiration
+        of all items is checked against the same reading of the clock.
+        """
+        bag = self._bag
+        expiration_policy = self.expiration_policy
+        now = time.monotonic()
+        found = {}
+        expired = []
+        requested = 0
+        for key in keys:
+            requested += 1
+            item = bag.get(key)
+            if item is None:
+                continue
+            if (
+                now > item._expires
+                or (expiration_policy is not None and expiration_policy(item))
+            ) and not self._serve_stale(key, item._expires, now):
+                expired.append(key)
+                continue
+            if self._sliding and item._ttl is not None:
+                item._expires = now + item._ttl
+            if self._policy is None:
+                bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+            found[key] = item.value
+        for key in expired:
+            self._expire(key)
+        if self._stats is not None:
+            self._stats.hits += len(found)
+            self._stats.misses += requested - len(found)
+        return found
+
+    def set_many(
+        self,
+        items: Mapping[Any, T] | Iterable[tuple[Any, T]],
+        ttl: float | None = None,
+        *,
+        tags: Iterable[Any] | None = None,
+    ) -> None:
+        """
+        Sets many items in the cache, from a mapping or from (key, value) pairs,
+        optionally with tags, expiring after ttl seconds, or after max_age seconds
+        if ttl is not specified. Items are evicted once, after all items are set.
+        """
+        if isinstance(items, Mapping):
+            items = items.items()
+        if tags is not None:
+            tags = frozenset(tags)
+        overflowing = False
+        for key, value in items:
+            overflowing |= self._store(key, value, ttl)
+            if tags:
+                self._tag(key, tags)
+        if overflowing:
+            self._check_size()
+
+    def _store(self, key, value: T, ttl: float | None = None) -> bool:
+        if self._key_tags:
+            self._untag(key)
+        if self._refreshing:
+            self._refreshing.pop(key, None)
+        if ttl is None:
+            ttl = self._max_age
+        else:
+            assert ttl >= 0
+
+        item = self._bag.get(key)
+        if item is not None:
+            previous_deadline = item._expires
+            item._value = value
+            item._time = time.time()
+            item._ttl = ttl
+            item._expires = math.inf if ttl is None else time.monotonic() + ttl
+            if self._policy is None:
+                self._bag.move_to_end(key)
+            else:
+                self._policy.access(key)
+            if self._stale_since:
+                self._stale_since.pop(key, None)
+            # entries with an older deadline are rescheduled when they are popped
+            if item._expires < previous_deadline:
+                self._index_deadline(key, item)
+            if self._weights is not None:
+                self._weigh(key, value)
+                return True
+            return False
+        item = self._bag[key] = CachedItem(value, ttl)
+        if self._policy is not None:
+            self._policy.insert(key)
+        if ttl is not None:
+            self._index_deadline(key, item)
+        if self._weights is not None:
+            self._weigh(key, value)
+        return True
+
+    def __setitem__(self, key, value: T) -> None:
+        if self._store(key, value):
+            self._check_size()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        if self._stale_since:
+            self._stale_since.pop(key, None)
+        if self._refreshing:
+            self._refreshing.pop(key, None)
+
+    def _dump_records(self) -> list[tuple]:
+        # (key, value, time, ttl, remaining time to live)
+        now = time.monotonic()
+        return [
+            (
+                key,
+                item.value,
+                item.time,
+                item.ttl,
+                None if item._expires == math.inf else item._expires - now,
+            )
+            for key, item in self._bag.items()
+            if not (
+                now > item._expires
+                or (self.expiration_policy is not None and self.expiration_policy(item))
+            )
+        ]
+
+    def _load_records(self, records: list[tuple], elapsed: float) -> int:
+        loaded = []
+        overflowing = False
+        for record in records:
+            if len(record) == 2:
+                # items saved by a Cache
+                overflowing |= self._store(record[0], record[1])
+                loaded.append(record[0])
+                continue
+
+            key, value, updated_at, ttl, remaining = record
+            if remaining is not None:
+                remaining -= elapsed
+                if remaining <= 0:
+                    continue
+            overflowing |= self._store(key, value, remaining)
+            item = self._bag[key]
+            item._time = updated_at
+            if remaining is not None:
+                # sliding expiration extends deadlines by the original ttl
+                item._ttl = ttl
+            if self.expiration_policy is not None and self.expiration_policy(item):
+                del self[key]
+                continue
+            loaded.append(key)
+        if overflowing:
+            self._check_size()
+        return sum(1 for key in loaded if key in self._bag)
+
+    def clear(self) -> None:
+        super().clear()
+        self._stale_since.clear()
+        self._refreshing.clear()
+        self._deadlines.clear()
+
+    @classmethod
+    def with_max_age(
+        cls, max_age: float, max_size: int = 500, **kwargs: Any
+    ) -> "ExpiringCache":
+        """
+        Returns an instance of ExpiringCache whose items are invalidated
+        when they were set more than a given number of seconds ago.
+        Other keyword arguments are passed to the constructor.
+        """
+        return cls(None, max_size, max_age=max_age, **kwargs)
+
+    def __contains__(self, key) -> bool:
+        item = self._bag.get(key)
+        if item is None:
+            return False
+        # remove if expired
+        now = time.monotonic()
+        if (
+            now > item._expires
+            or (self.expiration_policy is not None and self.expiration_policy(item))
+        ) and not self._serve_stale(key, item._expires, now):
+            self._expire(key)
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        """Iterates through cached items, discarding and removing expired ones."""
+        for key, item in list(self._bag.items()):
+            if self.expired(item):
+                self._expire(key)
+            else:
+                yield (key, item.value)
@@ -0,0 +1,358 @@
+"""
+ExpiringCache storing items in parallel arrays instead of CachedItem objects, to
+reduce the memory used by caches holding many items.
+"""
+
+import math
+import time
+from array import array
+from heapq import heapify, heappop, heappush
+from typing import Any, Iterable, Iterator, TypeVar
+
+from .cache import CachedItem, ExpiringCache
+
+T = TypeVar("T")
+
+# marks free slots, since None is a valid cache key
+_FREE: Any = object()
+# time to live of items that do not expire
+_NO_TTL = -1.0
+# entries of the deadlines heap are integers: the deadline in microseconds,
+# rounded up, followed by the slot in the lowest bits
+_SLOT_BITS = 32
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+
+
+class CompactExpiringCache(ExpiringCache[T]):
+    """
+    ExpiringCache with the same interface and behavior, storing items in slots
+    of parallel arrays instead of allocating a CachedItem for each item: values
+    and keys in lists, update times, time to live and deadlines in arrays of
+    doubles, and a free list of slots of removed items, reused by new items.
+
+    Each item costs a few machine words instead of an object with three floats,
+    about a quarter less memory per item, and the garbage collector has no
+    additional objects to traverse. Deadlines are indexed in a heap of integers
+    instead of tuples. Reading and setting items is slightly slower than with
+    ExpiringCache, since floats read from arrays are allocated at each read: use
+    this class when memory matters more than speed.
+
+    Expiration policies are called with a CachedItem created on demand, holding
+    a copy of the item: changes to it are not applied to the cache.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # the bag maps keys to slots
+        self._keys: list[Any] = []
+        self._values: list[Any] = []
+        self._times = array("d")
+        self._ttls = array("d")
+        self._expires = array("d")
+        self._free: list[int] = []
+        # min-heap of deadline entries: entries can be older than the deadline
+        # of the slot, or belong to an item previously stored in the slot
+        self._deadlines: list[int] = []  # type: ignore[assignment]
+
+    def _allocate(self, key) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            return slot
+        assert len(self._keys) <= _SLOT_MASK
+        self._keys.append(key)
+        self._values.append(None)
+        self._times.append(0.0)
+        self._ttls.append(_NO_TTL)
+        self._expires.append(math.inf)
+        return len(self._keys) - 1
+
+    def _release(self, slot: int) -> None:
+        self._keys[slot] = _FREE
+        self._values[slot] = None
+        self._free.append(slot)
+
+    def _item(self, slot: int) -> CachedItem[T]:
+        item: CachedItem[T] = CachedItem.__new__(CachedItem)
+        item._value = self._values[slot]
+        item._time = self._times[slot]
+        ttl = self._ttls[slot]
+        item._ttl = None if ttl == _NO_TTL else ttl
+        item._expires = self._expires[slot]
+        return item
+
+    def _is_expired(self, slot: int, now: float) -> bool:
+        return now > self._expires[slot] or (
+            self.expiration_policy is not None
+            and self.expiration_policy(self._item(slot))
+        )
+
+    def _index_slot(self, slot: int, deadline: float) -> None:
+        deadlines = self._deadlines
+        if len(deadlines) > 2 * len(self._bag) + 64:
+            # too many entries of removed or updated items: rebuild the heap
+            expires = self._expires
+            deadlines[:] = [
+                (int(expires[slot] * 1_000_000) + 1) << _SLOT_BITS | slot
+                for slot in self._bag.values()
+                if expires[slot] != math.inf
+            ]
+            heapify(deadlines)
+        else:
+            heappush(deadlines, (int(deadline * 1_000_000) + 1) << _SLOT_BITS | slot)
+
+    def _remove_items_past_deadline(
+        self, grace: float = 0, stop_at: float = math.inf
+    ) -> int:
+        deadlines = self._deadlines
+        expires = self._expires
+        now = time.monotonic()
+        limit = int((now - grace) * 1_000_000) << _SLOT_BITS
+        removed = 0
+        popped = 0
+        while deadlines and deadlines[0] < limit:
+            popped += 1
+            if popped % 64 == 0 and time.perf_counter() > stop_at:
+                break
+            slot = heappop(deadlines) & _SLOT_MASK
+            key = self._keys[slot]
+            if key is _FREE:
+                continue
+            if now > expires[slot] + grace:
+                self._expire(key)
+                removed += 1
+            elif expires[slot] != math.inf:
+                self._index_slot(slot, expires[slot])
+        return removed
+
+    def _remove_items_expired_by_policy(self, stop_at: float = math.inf) -> int:
+        if not self._policy_scan:
+            self._policy_scan = list(reversed(self._bag))
+        scan = self._policy_scan
+        now = time.monotonic()
+        removed = 0
+        while scan:
+            if len(scan) % 64 == 0 and time.perf_counter() > stop_at:
+                break
+            key = scan.pop()
+            slot = self._bag.get(key)
+            if slot is not None and self._is_expired(slot, now):
+                self._expire(key)
+                removed += 1
+        return removed
+
+    def _remove_expired_items(self) -> None:
+        if self._deadlines:
+            self._remove_items_past_deadline()
+        if self.expiration_policy is not None:
+            now = time.monotonic()
+            for key, slot in list(self._bag.items()):
+                if self._is_expired(slot, now):
+                    self._expire(key)
+
+    def _evicted(self, key, slot: int) -> None:  # type: ignore[override]
+        value = self._values[slot]
+        self._release(slot)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key, default=None) -> T:
+        slot = self._bag.get(key)
+        if slot is None:
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        now = time.monotonic()
+        expires = self._expires[slot]
+        if (
+            now > expires
+            or (
+                self.expiration_policy is not None
+                and self.expiration_policy(self._item(slot))
+            )
+        ) and not self._serve_stale(key, expires, now):
+            try:
+                self._expire(key)
+            except KeyError:
+                # removed by another thread after it was read
+                pass
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+
+        if self._sliding and self._ttls[slot] != _NO_TTL:
+            self._expires[slot] = now + self._ttls[slot]
+        value = self._values[slot]
+        try:
+            if self._policy is None:
+                self._bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+        except KeyError:
+            # removed by another thread after it was read
+            if self._stats is not None:
+                self._stats.misses += 1
+            return default
+        if self._stats is not None:
+            self._stats.hits += 1
+        return value
+
+    def get_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        bag = self._bag
+        now = time.monotonic()
+        found = {}
+        expired = []
+        requested = 0
+        for key in keys:
+            requested += 1
+            slot = bag.get(key)
+            if slot is None:
+                continue
+            if self._is_expired(slot, now) and not self._serve_stale(
+                key, self._expires[slot], now
+            ):
+                expired.append(key)
+                continue
+            if self._sliding and self._ttls[slot] != _NO_TTL:
+                self._expires[slot] = now + self._ttls[slot]
+            if self._policy is None:
+                bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+            found[key] = self._values[slot]
+        for key in expired:
+            self._expire(key)
+        if self._stats is not None:
+            self._stats.hits += len(found)
+            self._stats.misses += requested - len(found)
+        return found
+
+    def _store(self, key, value: T, ttl: float | None = None) -> bool:
+        if self._key_tags:
+            self._untag(key)
+        if self._refreshing:
+            self._refreshing.pop(key, None)
+        if ttl is None:
+            ttl = self._max_age
+        else:
+            assert ttl >= 0
+        expires = math.inf if ttl is None else time.monotonic() + ttl
+
+        bag = self._bag
+        slot = bag.get(key)
+        inserted = slot is None
+        if slot is not None:
+            previous_deadline = self._expires[slot]
+            if self._policy is None:
+                bag.move_to_end(key, last=True)
+            else:
+                self._policy.access(key)
+            if self._stale_since:
+                self._stale_since.pop(key, None)
+        else:
+            slot = bag[key] = self._allocate(key)
+            previous_deadline = math.inf
+            if self._policy is not None:
+                self._policy.insert(key)
+        self._values[slot] = value
+        self._times[slot] = time.time()
+        self._ttls[slot] = _NO_TTL if ttl is None else ttl
+        self._expires[slot] = expires
+        # entries with an older deadline are rescheduled when they are popped
+        if expires < previous_deadline:
+            self._index_slot(slot, expires)
+        if self._weights is not None:
+            self._weigh(key, value)
+            return True
+        return inserted
+
+    def __delitem__(self, key) -> None:
+        slot = self._bag[key]
+        super().__delitem__(key)
+        self._release(slot)
+
+    def _dump_records(self) -> list[tuple]:
+        now = time.monotonic()
+        return [
+            (
+                key,
+                self._values[slot],
+                self._times[slot],
+                None if self._ttls[slot] == _NO_TTL else self._ttls[slot],
+                (
+                    None
+                    if self._expires[slot] == math.inf
+                    else self._expires[slot] - now
+                ),
+            )
+            for key, slot in self._bag.items()
+            if not self._is_expired(slot, now)
+        ]
+
+    def _load_records(self, records: list[tuple], elapsed: float) -> int:
+        loaded = []
+        overflowing = False
+        now = time.monotonic()
+        for record in records:
+            if len(record) == 2:
+                # items saved by a Cache
+                overflowing |= self._store(record[0], record[1])
+                loaded.append(record[0])
+                continue
+
+            key, value, updated_at, ttl, remaining = record
+            if remaining is not None:
+                remaining -= elapsed
+                if remaining <= 0:
+                    continue
+            overflowing |= self._store(key, value, remaining)
+            slot = self._bag[key]
+            self._times[slot] = updated_at
+            if remaining is not None:
+                # sliding expiration extends deadlines by the original ttl
+                self._ttls[slot] = ttl
+            if self.expiration_policy is not None and self._is_expired(slot, now):
+                del self[key]
+                continue
+            loaded.append(key)
+        if overflowing:
+            self._check_size()
+        return sum(1 for key in loaded if key in self._bag)
+
+    def clear(self) -> None:
+        super().clear()
+        self._keys.clear()
+        self._values.clear()
+        del self._times[:]
+        del self._ttls[:]
+        del self._expires[:]
+        self._free.clear()
+
+    def __contains__(self, key) -> bool:
+        slot = self._bag.get(key)
+        if slot is None:
+            return False
+        now = time.monotonic()
+        expires = self._expires[slot]
+        if (
+            now > expires
+            or (
+                self.expiration_policy is not None
+                and self.expiration_policy(self._item(slot))
+            )
+        ) and not self._serve_stale(key, expires, now):
+            self._expire(key)
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        """Iterates through cached items, discarding and removing expired ones."""
+        now = time.monotonic()
+        for key, slot in list(self._bag.items()):
+            if self._bag.get(key) != slot:
+                # removed while iterating
+                continue
+            if self._is_expired(slot, now):
+                self._expire(key)
+            else:
+                yield (key, self._values[slot])
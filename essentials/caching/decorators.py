@@ -0,0 +1,745 @@
+import asyncio
+import functools
+import time
+import weakref
+from inspect import iscoroutinefunction
+from typing import TYPE_CHECKING, Any, NoReturn, TypeVar
+
+from .background import run_in_background
+from .cache import Cache
+from .keys import make_key
+from .locks import KeyLocks
+from .stats import CacheStats, StatsCounter
+
+if TYPE_CHECKING:
+    from typing import Callable, Hashable, TypeVarTuple, Unpack
+
+    PosArgsT = TypeVarTuple("PosArgsT")
+    T_Retval = TypeVar("T_Retval")
+    FuncType = Callable[[Unpack[PosArgsT]], T_Retval]
+    FuncDecoType = Callable[[FuncType], FuncType]
+
+
+class _CachedError:
+    """Exception raised by a function decorated by lazy, cached in place of a value."""
+
+    __slots__ = ("error", "traceback")
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+        self.traceback = error.__traceback__
+
+    def throw(self) -> NoReturn:
+        # restore the original traceback, so it does not grow at each raise
+        raise self.error.with_traceback(self.traceback)
+
+    def __reduce__(self):
+        # tracebacks cannot be pickled
+        return (_CachedError, (self.error,))
+
+
+def _unwrap(value):
+    if value.__class__ is _CachedError:
+        value.throw()
+    return value
+
+
+# states of cached values
+_MISSING = 0
+_FRESH = 1
+_STALE = 2
+# fresh, but to be refreshed ahead of expiration
+_EXPIRING = 3
+
+
+def _get_hot_check(max_seconds: float):
+    """
+    Returns a function telling whether a key, whose value was set at a given
+    time and is in the last refresh_ahead part of its lifetime, is hot: read at
+    least twice in this part of its lifetime.
+    """
+    # key -> (time when the value was set, time of the first read in the last
+    # part of its lifetime)
+    reads: dict[Any, tuple[float, float]] = {}
+    prune_size = 1024
+
+    def is_hot(key, updated_at: float, now: float) -> bool:
+        nonlocal prune_size
+        previous = reads.pop(key, None)
+        if previous is not None and previous[0] == updated_at:
+            return True
+        reads[key] = (updated_at, now)
+        if len(reads) > prune_size:
+            # forget keys that were not read again before their value expired
+            for other_key, (_, read_at) in list(reads.items()):
+                if now - read_at > max_seconds:
+                    reads.pop(other_key, None)
+            prune_size = max(1024, 2 * len(reads))
+        return False
+
+    return is_hot
+
+
+def _get_fresh_age(max_seconds: float, refresh_ahead: float | None) -> float:
+    """
+    Returns the age up to which cached values are returned without further
+    checks: max_seconds, or the start of the refresh_ahead part of it.
+    """
+    if refresh_ahead is None:
+        return max_seconds
+    return max_seconds * (1 - refresh_ahead)
+
+
+def _get_lookup(
+    max_seconds: float,
+    stale_ttl: float,
+    error_ttl: float,
+    stats: StatsCounter | None,
+    refresh_ahead: float | None = None,
+):
+    max_stale_age = max_seconds + stale_ttl
+    refresh_age = _get_fresh_age(max_seconds, refresh_ahead)
+    is_hot = _get_hot_check(max_seconds)
+
+    def lookup(key, entry, now: float) -> tuple[int, Any]:
+        """
+        Returns the state of the cached entry of a key and its value, raising
+        cached exceptions that did not expire.
+        """
+        if entry is None:
+            if stats is not None:
+                stats.misses += 1
+            return _MISSING, None
+
+        value, updated_at = entry
+        age = now - updated_at
+        if value.__class__ is not _CachedError:
+            if age <= max_seconds:
+                if stats is not None:
+                    stats.hits += 1
+                if age > refresh_age and is_hot(key, updated_at, now):
+                    return _EXPIRING, value
+                return _FRESH, value
+            if age <= max_stale_age:
+                if stats is not None:
+                    stats.hits += 1
+                return _STALE, value
+        elif age <= error_ttl:
+            if stats is not None:
+                stats.hits += 1
+            value.throw()
+        if stats is not None:
+            stats.misses += 1
+            stats.expirations += 1
+        return _MISSING, None
+
+    return lookup
+
+
+def _get_async_call(
+    fn, cache, stats: StatsCounter | None, errors: tuple[type[BaseException], ...]
+):
+    async def call(key, args, kwargs, now):
+        """Calls fn and caches its result, or its exception if it is cached."""
+        try:
+            if stats is None:
+                value = await fn(*args, **kwargs)
+            else:
+                value = await stats.measure_load_async(fn, *args, **kwargs)
+        except errors as error:
+            cache[key] = (_CachedError(error), now)
+            raise
+        cache[key] = (value, now)
+        return value
+
+    return call
+
+
+def _get_lazy_async_wrapper(
+    fn,
+    max_seconds: float,
+    cache,
+    stale_ttl: float,
+    stats: StatsCounter | None,
+    get_key: "Callable[..., Hashable]",
+    errors: tuple[type[BaseException], ...],
+    error_ttl: float,
+    refresh_ahead: float | None,
+) -> "FuncType":
+    # calls in progress, by key: concurrent misses for the same key await the
+    # same task instead of calling fn again
+    pending: dict[Any, asyncio.Future] = {}
+    lookup = _get_lookup(max_seconds, stale_ttl, error_ttl, stats, refresh_ahead)
+    fresh_age = _get_fresh_age(max_seconds, refresh_ahead)
+    # with the default key function, the tuple of positional arguments is the
+    # key of calls without keyword arguments, if it is hashable
+    args_are_keys = get_key is make_key
+
+    load = _get_async_call(fn, cache, stats, errors)
+
+    def on_done(key, task: asyncio.Future) -> None:
+        if pending.get(key) is task:
+            del pending[key]
+        if not task.cancelled():
+            # mark the exception as retrieved, callers already received it
+            task.exception()
+
+    def get_task(key, args, kwargs, now) -> asyncio.Future:
+        task = pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(load(key, args, kwargs, now))
+            pending[key] = task
+            task.add_done_callback(functools.partial(on_done, key))
+        return task
+
+    @functools.wraps(fn)
+    async def async_wrapper(*args, **kwargs):
+        now = time.time()
+        key = args if args_are_keys and not kwargs else get_key(args, kwargs)
+        try:
+            entry = cache[key]
+        except KeyError:
+            entry = None
+        except TypeError:
+            # unhashable arguments, converted by make_key
+            key = get_key(args, kwargs)
+            entry = cache.get(key)
+        if entry is not None:
+            value, updated_at = entry
+            if now - updated_at <= fresh_age and value.__class__ is not _CachedError:
+                if stats is not None:
+                    stats.hits += 1
+                return value
+        state, value = lookup(key, entry, now)
+        if state == _FRESH:
+            return value
+        if state != _MISSING:
+            # serve the stale or expiring value, refreshing it in background
+            get_task(key, args, kwargs, now)
+            return value
+        # a caller being cancelled must not cancel the call other callers await
+        return await asyncio.shield(get_task(key, args, kwargs, now))
+
+    return async_wrapper
+
+
+def _get_call(
+    fn, cache, stats: StatsCounter | None, errors: tuple[type[BaseException], ...]
+):
+    def call(key, args, kwargs):
+        """Calls fn and caches its result, or its exception if it is cached."""
+        now = time.time()
+        try:
+            if stats is None:
+                value = fn(*args, **kwargs)
+            else:
+                value = stats.measure_load(fn, *args, **kwargs)
+        except errors as error:
+            cache[key] = (_CachedError(error), now)
+            raise
+        cache[key] = (value, now)
+        return value
+
+    return call
+
+
+def _get_locked_call(
+    call, max_seconds: float, cache, wait_timeout: float | None, error_ttl: float
+):
+    key_locks = KeyLocks()
+
+    def locked_call(key, args, kwargs):
+        with key_locks.acquire(key, wait_timeout) as acquired:
+            if acquired:
+                # another thread might have refreshed the value while this one
+                # was waiting for the lock
+                try:
+                    value, updated_at = cache[key]
+                except KeyError:
+                    pass
+                else:
+                    if value.__class__ is _CachedError:
+                        max_age = error_ttl
+                    else:
+                        max_age = max_seconds
+                    if time.time() - updated_at <= max_age:
+                        return _unwrap(value)
+                return call(key, args, kwargs)
+
+        # the thread refreshing the value did not complete within wait_timeout:
+        # serve the previous value, if any, unless it is an expired error
+        try:
+            value, updated_at = cache[key]
+        except KeyError:
+            return call(key, args, kwargs)
+        if value.__class__ is _CachedError and time.time() - updated_at > error_ttl:
+            return call(key, args, kwargs)
+        return _unwrap(value)
+
+    return locked_call
+
+
+def _get_lazy_wrapper(
+    fn,
+    max_seconds: float,
+    cache,
+    stale_ttl: float,
+    lock: bool,
+    wait_timeout: float | None,
+    stats: StatsCounter | None,
+    get_key: "Callable[..., Hashable]",
+    errors: tuple[type[BaseException], ...],
+    error_ttl: float,
+    refresh_ahead: float | None,
+) -> "FuncType":
+    refreshing: set[Any] = set()
+    lookup = _get_lookup(max_seconds, stale_ttl, error_ttl, stats, refresh_ahead)
+    fresh_age = _get_fresh_age(max_seconds, refresh_ahead)
+    # with the default key function, the tuple of positional arguments is the
+    # key of calls without keyword arguments, if it is hashable
+    args_are_keys = get_key is make_key
+
+    call = _get_call(fn, cache, stats, errors)
+
+    if lock:
+        load = _get_locked_call(call, max_seconds, cache, wait_timeout, error_ttl)
+    else:
+        load = call
+
+    def refresh(key, args, kwargs, state):
+        try:
+            if state == _STALE:
+                load(key, args, kwargs)
+            else:
+                # the value is not expired: the lock of load would return it
+                call(key, args, kwargs)
+        finally:
+            refreshing.discard(key)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        now = time.time()
+        key = args if args_are_keys and not kwargs else get_key(args, kwargs)
+        try:
+            entry = cache[key]
+        except KeyError:
+            entry = None
+        except TypeError:
+            # unhashable arguments, converted by make_key
+            key = get_key(args, kwargs)
+            entry = cache.get(key)
+        if entry is not None:
+            value, updated_at = entry
+            if now - updated_at <= fresh_age and value.__class__ is not _CachedError:
+                if stats is not None:
+                    stats.hits += 1
+                return value
+        state, value = lookup(key, entry, now)
+        if state == _FRESH:
+            return value
+        if state != _MISSING:
+            # serve the stale or expiring value, refreshing it in background
+            if key not in refreshing:
+                refreshing.add(key)
+                run_in_background(refresh, key, args, kwargs, state)
+            return value
+        return load(key, args, kwargs)
+
+    if args_are_keys and not (
+        stale_ttl or lock or stats is not None or errors or refresh_ahead is not None
+    ):
+        return _get_plain_wrapper(fn, max_seconds, cache, wrapper)
+    return wrapper
+
+
+def _get_plain_wrapper(fn, max_seconds: float, cache, wrapper) -> "FuncType":
+    """
+    Returns the wrapper of lazy without options, which reads fresh values of
+    calls without keyword arguments at the cost of a cache lookup, and passes
+    other calls to the given wrapper.
+    """
+
+    @functools.wraps(fn)
+    def plain_wrapper(*args, **kwargs):
+        if not kwargs:
+            try:
+                # without cache_errors, cached values are never errors
+                value, updated_at = cache[args]
+            except (KeyError, TypeError):
+                pass
+            else:
+                if time.time() - updated_at <= max_seconds:
+                    return value
+        return wrapper(*args, **kwargs)
+
+    return plain_wrapper
+
+
+def lazy(
+    max_seconds: int = 1,
+    cache=None,
+    *,
+    key: "Callable[..., Hashable] | None" = None,
+    lock: bool = False,
+    wait_timeout: float | None = None,
+    stale_ttl: float | None = None,
+    cache_errors: "type[BaseException] | tuple[type[BaseException], ...]" = (),
+    error_ttl: float | None = None,
+    refresh_ahead: float | None = None,
+    track_stats: bool = False,
+) -> "FuncDecoType":
+    """
+    Wraps a function so that it is called up to once
+    every max_seconds, by input arguments.
+    Results are stored in a cache, by default a LRU cache of max size 500.
+
+    To have a cache without size limit, use a dictionary: @lazy(1, {})
+
+    Results are cached by a key calculated from the input arguments, by default
+    by make_key: the tuple of positional arguments, followed by keyword
+    arguments sorted by name, with lists, dictionaries and sets converted to
+    hashable equivalents. To calculate keys differently, pass a key function,
+    called with the same arguments of the decorated function.
+
+    Coroutine functions are supported: their results are awaited and cached,
+    and concurrent calls with the same arguments share a single pending call.
+
+    For synchronous functions, pass lock=True to protect against cache
+    stampedes in multi-threaded applications: when a value is missing or
+    expired, a single thread calls the function while the others wait for its
+    result. Threads waiting longer than wait_timeout seconds get the previous
+    value, if any, otherwise call the function themselves.
+
+    When stale_ttl is specified, values expired by less than stale_ttl seconds
+    are returned immediately, while they are refreshed in background: on a
+    thread pool for synchronous functions, in an asyncio task for coroutine
+    functions.
+
+    When cache_errors is specified (an exception type, or a tuple of exception
+    types), exceptions of those types raised by the function are cached too, for
+    error_ttl seconds (by default, max_seconds), and raised again to callers
+    without calling the function: this protects a failing downstream service
+    from being called at full rate while it is down. Cached exceptions are not
+    served stale.
+
+    When refresh_ahead is specified (a fraction of max_seconds, between 0 and
+    1), hot keys are refreshed before they expire, so that their callers never
+    wait for the function: a key read at least twice during the last
+    refresh_ahead part of the lifetime of its value is refreshed in background,
+    once, while its current value is still returned. Keys read less often are
+    left to expire.
+
+    When track_stats is True, the decorated function counts hits, misses and
+    calls to the wrapped function with their duration: use its stats() and
+    reset_stats() methods to read and reset statistics.
+    """
+    assert max_seconds > 0
+    assert wait_timeout is None or wait_timeout >= 0
+    assert stale_ttl is None or stale_ttl >= 0
+    assert error_ttl is None or error_ttl > 0
+    assert refresh_ahead is None or 0 < refresh_ahead < 1
+    if cache is None:
+        cache = Cache(500)
+    if not isinstance(cache_errors, tuple):
+        cache_errors = (cache_errors,)
+    if error_ttl is None:
+        error_ttl = max_seconds
+
+    if key is None:
+        get_key = make_key
+    else:
+        key_function = key
+
+        def get_key(args, kwargs):
+            return key_function(*args, **kwargs)
+
+    def lazy_decorator(fn):
+        setattr(fn, "cache", cache)
+        stats = StatsCounter() if track_stats else None
+
+        if iscoroutinefunction(fn):
+            wrapper = _get_lazy_async_wrapper(
+                fn,
+                max_seconds,
+                cache,
+                stale_ttl or 0,
+                stats,
+                get_key,
+                cache_errors,
+                error_ttl,
+                refresh_ahead,
+            )
+        else:
+            wrapper = _get_lazy_wrapper(
+                fn,
+                max_seconds,
+                cache,
+                stale_ttl or 0,
+                lock,
+                wait_timeout,
+                stats,
+                get_key,
+                cache_errors,
+                error_ttl,
+                refresh_ahead,
+            )
+
+        def get_stats() -> CacheStats:
+            return CacheStats() if stats is None else stats.snapshot()
+
+        def reset_stats() -> None:
+            if stats is not None:
+                stats.reset()
+
+        setattr(wrapper, "stats", get_stats)
+        setattr(wrapper, "reset_stats", reset_stats)
+        return wrapper
+
+    return lazy_decorator
+
+
+class _MethodCache:
+    """
+    Function decorated by lazy, with the cache of the method of an instance,
+    stored in the instance dictionary.
+    """
+
+    __slots__ = ("owner", "function")
+
+    def __init__(self, owner=None, function=None) -> None:
+        # the owner tells copies of an instance, sharing its dictionary items,
+        # apart from the instance itself
+        self.owner = None if owner is None else weakref.ref(owner)
+        self.function = function
+
+    def __reduce__(self):
+        # caches are not pickled, nor copied, with their instance
+        return (_MethodCache, ())
+
+
+class _BoundCachedMethod:
+    """
+    Method decorated by cached_method, bound to an instance: like a bound
+    method, it holds a reference to its instance. The cache, stats() and
+    reset_stats() attributes are the ones of the function decorated by lazy.
+    """
+
+    __slots__ = ("__self__", "__func__")
+
+    def __init__(self, instance, function) -> None:
+        self.__self__ = instance
+        self.__func__ = function
+
+    def __call__(self, *args, **kwargs):
+        return self.__func__(self.__self__, *args, **kwargs)
+
+    def __getattr__(self, name: str):
+        if name in _BoundCachedMethod.__slots__:
+            raise AttributeError(name)
+        return getattr(self.__func__, name)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, _BoundCachedMethod):
+            return NotImplemented
+        return self.__self__ is other.__self__ and self.__func__ is other.__func__
+
+    def __hash__(self) -> int:
+        return hash((id(self.__self__), self.__func__))
+
+    def __repr__(self) -> str:
+        return (
+            f"<bound cached method {self.__func__.__qualname__} of {self.__self__!r}>"
+        )
+
+
+class CachedMethod:
+    """
+    Descriptor of a method decorated by cached_method: when the method is first
+    accessed on an instance, creates a function decorated by lazy, with its own
+    cache, and stores it in the instance dictionary. The function is called with
+    the instance as first argument, which is not part of cache keys, so caches
+    do not keep references to their instance.
+    """
+
+    def __init__(
+        self, method, max_seconds: float, max_size: int, options: dict[str, Any]
+    ) -> None:
+        functools.update_wrapper(self, method)  # type: ignore[arg-type]
+        self._method = method
+        self._max_seconds = max_seconds
+        self._max_size = max_size
+        self._options = options
+        self._set_attribute(method.__name__)
+
+    def __set_name__(self, owner, name: str) -> None:
+        self._set_attribute(name)
+
+    def _set_attribute(self, name: str) -> None:
+        self._attribute = f"__cached_method_{name}"
+
+    def _create_function(self):
+        options = dict(self._options)
+        key_function = options.pop("key", None)
+
+        if key_function is None:
+
+            def get_key(instance, *args, **kwargs):
+                return make_key(args, kwargs)
+
+        else:
+
+            def get_key(instance, *args, **kwargs):
+                return key_function(*args, **kwargs)
+
+        return lazy(self._max_seconds, Cache(self._max_size), key=get_key, **options)(
+            self._method
+        )
+
+    def _get_function(self, instance):
+        try:
+            instance_dict = instance.__dict__
+        except AttributeError:
+            raise TypeError(
+                f"cached_method requires instances of {type(instance).__name__} "
+                "to have a __dict__ attribute."
+            ) from None
+        method_cache = instance_dict.get(self._attribute)
+        if (
+            method_cache is None
+            or method_cache.owner is None
+            or method_cache.owner() is not instance
+        ):
+            method_cache = _MethodCache(instance, self._create_function())
+            instance_dict[self._attribute] = method_cache
+        return method_cache.function
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return _BoundCachedMethod(instance, self._get_function(instance))
+
+    def __call__(self, instance, *args, **kwargs):
+        # calls through the class, like Class.method(instance, ...)
+        return self._get_function(instance)(instance, *args, **kwargs)
+
+
+def cached_method(
+    max_seconds: float = 1, max_size: int = 500, **kwargs: Any
+) -> "Callable[[Callable], CachedMethod]":
+    """
+    Wraps a method so that it is called up to once every max_seconds, by input
+    arguments, like lazy, using a cache for each instance, of max size max_size.
+    The instance is not part of cache keys, and the cache of an instance is
+    freed with the instance, since caches do not keep references to it.
+    Other keyword arguments are passed to lazy.
+
+    Coroutine functions are supported. Use the cache, stats() and reset_stats()
+    attributes of the method of an instance to access its cache and statistics.
+    """
+    assert max_seconds > 0
+    assert max_size > 0
+    assert "cache" not in kwargs, "cached_method creates a cache for each instance"
+
+    def cached_method_decorator(method) -> CachedMethod:
+        return CachedMethod(method, max_seconds, max_size, kwargs)
+
+    return cached_method_decorator
+
+
+def _get_cached_entries(cache, keys: list) -> dict:
+    if hasattr(cache, "get_many"):
+        return cache.get_many(keys)
+    return {key: cache[key] for key in keys if key in cache}
+
+
+def _set_cached_entries(cache, entries: dict) -> None:
+    if hasattr(cache, "set_many"):
+        cache.set_many(entries)
+    else:
+        cache.update(entries)
+
+
+def lazy_many(
+    max_seconds: int = 1, cache=None, *, error_ttl: float | None = None
+) -> "FuncDecoType":
+    """
+    Wraps a function that loads many values at once, called with a list of keys
+    and returning a mapping of values by key, so that values are loaded up to
+    once every max_seconds, by key.
+
+    The decorated function is called with an iterable of keys and returns a
+    dictionary of values by key, in the same order. The wrapped function is
+    called once, only with the keys that are missing or expired in the cache.
+    Keys missing from the mapping it returns are not cached, and are not
+    included in the result.
+
+    Values are stored in the cache like lazy stores the results of a function
+    of one argument, so a cache can be shared with a function decorated by lazy
+    that loads a single value. Exceptions cached by lazy (see cache_errors) are
+    raised again for error_ttl seconds (by default, max_seconds), then their
+    keys are loaded again.
+
+    Coroutine functions are supported.
+    """
+    assert max_seconds > 0
+    assert error_ttl is None or error_ttl > 0
+    if cache is None:
+        cache = Cache(500)
+    if error_ttl is None:
+        error_ttl = max_seconds
+
+    def split(keys, now) -> tuple[dict, list]:
+        found = {}
+        missing = []
+        entries = _get_cached_entries(cache, [(key,) for key in keys])
+        for key in keys:
+            entry = entries.get((key,))
+            if entry is None:
+                missing.append(key)
+                continue
+            value, updated_at = entry
+            if value.__class__ is _CachedError:
+                if now - updated_at <= error_ttl:
+                    value.throw()
+                missing.append(key)
+            elif now - updated_at <= max_seconds:
+                found[key] = value
+            else:
+                missing.append(key)
+        return found, missing
+
+    def store(keys, found, loaded, now) -> dict:
+        _set_cached_entries(
+            cache, {(key,): (value, now) for key, value in loaded.items()}
+        )
+        found.update(loaded)
+        return {key: found[key] for key in keys if key in found}
+
+    def lazy_many_decorator(fn):
+        setattr(fn, "cache", cache)
+
+        if iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(keys):
+                keys = list(dict.fromkeys(keys))
+                now = time.time()
+                found, missing = split(keys, now)
+                if not missing:
+                    return found
+                return store(keys, found, await fn(missing), now)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(keys):
+            keys = list(dict.fromkeys(keys))
+            now = time.time()
+            found, missing = split(keys, now)
+            if not missing:
+                return found
+            return store(keys, found, fn(missing), now)
+
+        return wrapper
+
+    return lazy_many_decorator
@@ -0,0 +1,402 @@
+"""
+Caches storing items on disk, to keep expensive results that do not fit in
+memory: DiskCache stores pickled items in an append-only file read through a
+memory map, TieredCache combines an in-memory Cache with a DiskCache, moving
+items evicted from memory to disk.
+
+Files are read using pickle: never open files from untrusted sources.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Generic, Iterator, TypeVar
+
+from .cache import Cache
+
+T = TypeVar("T")
+
+# file header: magic, identifier of the file, changed when the file is rewritten
+_FILE_HEADER = struct.Struct("<4s16s")
+_MAGIC = b"EDC1"
+# record header: flags, key size, value size
+_HEADER = struct.Struct("<BII")
+_TOMBSTONE = 1
+
+
+class DiskCache(Generic[T]):
+    """
+    Cache storing pickled items in an append-only file. Setting an item appends
+    a record to the file, deleting an item appends a tombstone record, reading
+    an item reads its value through a memory map of the file, so reading items
+    recently written or read is a read from the operating system page cache.
+
+    Keys are indexed in memory, with the position of their records in the file,
+    and the index is saved next to the file (path + ".index") when the cache is
+    closed or compacted. Opening an existing file restores the index, reading
+    only the records appended after the index was saved. The file starts with
+    an identifier, changed when the file is rewritten: an index saved for a
+    different file is ignored, and the whole file is read instead.
+
+    When the file grows beyond max_file_size bytes, it is compacted: records of
+    items that are still in the cache are copied to a new file, discarding the
+    least recently used items until the size of the items is at most
+    max_file_size * compact_ratio.
+
+    Instances of this class can be used as cache of the lazy decorator.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_file_size: int = 64 * 1024 * 1024,
+        *,
+        compact_ratio: float = 0.5,
+    ) -> None:
+        assert max_file_size > 0
+        assert 0 < compact_ratio <= 1
+        self._path = path
+        self._index_path = path + ".index"
+        self.max_file_size = max_file_size
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        # key -> (record offset, key size, value size), least recently used first
+        self._index: OrderedDict[Any, tuple[int, int, int]] = OrderedDict()
+        self._live_size = 0
+        self._map: mmap.mmap | None = None
+        self._file = open(path, "a+b")
+        self._file_id = b""
+        self._restore_index()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def file_size(self) -> int:
+        return self._file.tell()
+
+    @property
+    def live_size(self) -> int:
+        """Returns the size in bytes of the records of the items in the cache."""
+        return self._live_size
+
+    def __repr__(self) -> str:
+        return f"<DiskCache {len(self)} at {self._path}>"
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __enter__(self) -> "DiskCache[T]":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _write_file_header(self, file) -> None:
+        self._file_id = os.urandom(16)
+        file.write(_FILE_HEADER.pack(_MAGIC, self._file_id))
+
+    def _restore_index(self) -> None:
+        end = self._file.seek(0, os.SEEK_END)
+        if end < _FILE_HEADER.size:
+            # new file, or file of a process that stopped while creating it
+            self._file.truncate(0)
+            self._write_file_header(self._file)
+            self._file.flush()
+            return
+        self._file.seek(0)
+        magic, self._file_id = _FILE_HEADER.unpack(self._file.read(_FILE_HEADER.size))
+        if magic != _MAGIC:
+            self._file.close()
+            raise ValueError(f"The file {self._path} is not a disk cache.")
+
+        start = _FILE_HEADER.size
+        try:
+            with open(self._index_path, "rb") as index_file:
+                file_id, size, entries = pickle.load(index_file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            pass
+        else:
+            # the index of another file, for example of the file replaced by a
+            # compaction interrupted before saving its index, is ignored
+            if file_id == self._file_id and start <= size <= end:
+                start = size
+                for key, offset, key_size, value_size in entries:
+                    self._add(key, offset, key_size, value_size)
+        self._scan(start, end)
+
+    def _scan(self, position: int, end: int) -> None:
+        """Reads records from the given position, adding them to the index."""
+        self._file.seek(position)
+        while position + _HEADER.size <= end:
+            flags, key_size, value_size = _HEADER.unpack(self._file.read(_HEADER.size))
+            record_size = _HEADER.size + key_size + value_size
+            if position + record_size > end:
+                break
+            key = pickle.loads(self._file.read(key_size))
+            self._discard(key)
+            if not flags & _TOMBSTONE:
+                self._add(key, position, key_size, value_size)
+            self._file.seek(value_size, os.SEEK_CUR)
+            position += record_size
+
+        if position < end:
+            # incomplete record, written by a process that stopped while writing
+            self._file.truncate(position)
+        self._file.seek(0, os.SEEK_END)
+
+    def _add(self, key, offset: int, key_size: int, value_size: int) -> None:
+        self._index[key] = (offset, key_size, value_size)
+        self._live_size += _HEADER.size + key_size + value_size
+
+    def _discard(self, key) -> bool:
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return False
+        self._live_size -= _HEADER.size + entry[1] + entry[2]
+        return True
+
+    def _append(self, flags: int, key_data: bytes, value_data: bytes) -> int:
+        offset = self._file.tell()
+        self._file.write(
+            _HEADER.pack(flags, len(key_data), len(value_data)) + key_data + value_data
+        )
+        # written data must be visible to the memory map
+        self._file.flush()
+        return offset
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._map is None or offset + size > len(self._map):
+            # the file grew since it was mapped
+            self._unmap()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset : offset + size]
+
+    def _unmap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __getitem__(self, key) -> T:
+        with self._lock:
+            offset, key_size, value_size = self._index[key]
+            self._index.move_to_end(key)
+            data = self._read(offset + _HEADER.size + key_size, value_size)
+        return pickle.loads(data)
+
+    def __setitem__(self, key, value: T) -> None:
+        key_data = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        value_data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._discard(key)
+            offset = self._append(0, key_data, value_data)
+            self._add(key, offset, len(key_data), len(value_data))
+            if self.file_size > self.max_file_size:
+                self.compact()
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            if not self._discard(key):
+                raise KeyError(key)
+            self._append(_TOMBSTONE, pickle.dumps(key, pickle.HIGHEST_PROTOCOL), b"")
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        for key in list(self._index):
+            try:
+                yield key, self[key]
+            except KeyError:
+                continue
+
+    def get(self, key, default=None) -> T:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def set(self, key, value: T) -> None:
+        self[key] = value
+
+    def keys(self) -> Iterator[Any]:
+        return iter(list(self._index))
+
+    def values(self) -> Iterator[T]:
+        for _, value in self:
+            yield value
+
+    def compact(self) -> None:
+        """
+        Rewrites the file keeping only the records of the items in the cache, and
+        discarding the least recently used items if their size exceeds
+        max_file_size * compact_ratio.
+        """
+        with self._lock:
+            max_live_size = self.max_file_size * self.compact_ratio
+            while self._index and self._live_size > max_live_size:
+                self._discard(next(iter(self._index)))
+
+            temp_path = self._path + ".compact"
+            entries = list(self._index.items())
+            self._index.clear()
+            self._live_size = 0
+            with open(temp_path, "wb") as temp_file:
+                self._write_file_header(temp_file)
+                for key, (offset, key_size, value_size) in entries:
+                    new_offset = temp_file.tell()
+                    record_size = _HEADER.size + key_size + value_size
+                    temp_file.write(self._read(offset, record_size))
+                    self._add(key, new_offset, key_size, value_size)
+
+            self._unmap()
+            self._file.close()
+            # the index of the previous file must never be used for the new one
+            try:
+                os.remove(self._index_path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, self._path)
+            self._file = open(self._path, "a+b")
+            self._save_index()
+
+    def _save_index(self) -> None:
+        entries = [
+            (key, offset, key_size, value_size)
+            for key, (offset, key_size, value_size) in self._index.items()
+        ]
+        temp_path = self._index_path + ".tmp"
+        with open(temp_path, "wb") as index_file:
+            pickle.dump(
+                (self._file_id, self.file_size, entries),
+                index_file,
+                pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temp_path, self._index_path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._index.clear()
+            self._live_size = 0
+            self._unmap()
+            self._file.truncate(0)
+            self._file.seek(0)
+            self._write_file_header(self._file)
+            self._file.flush()
+            self._save_index()
+
+    def close(self) -> None:
+        """Saves the index of the cache and closes its file."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._save_index()
+            self._unmap()
+            self._file.close()
+
+
+class TieredCache(Generic[T]):
+    """
+    Two tier cache: items are kept in memory, in a Cache, and items evicted from
+    memory are moved to a DiskCache instead of being discarded. Items read from
+    disk are moved back to memory.
+
+    Items are written to disk only when they are evicted from memory, and items
+    moved back to memory from disk are not written again when they are evicted
+    again without changes.
+
+    Instances of this class can be used as cache of the lazy decorator.
+    """
+
+    def __init__(self, disk: DiskCache[T], memory: Cache[T] | None = None) -> None:
+        if memory is None:
+            memory = Cache(500)
+        assert memory.on_evict is None, "the memory cache must not have on_evict"
+        memory.on_evict = self._spill
+        self._memory = memory
+        self._disk = disk
+        # keys of items in memory whose value is equal to the one on disk
+        self._clean: set[Any] = set()
+
+    @property
+    def memory(self) -> Cache[T]:
+        return self._memory
+
+    @property
+    def disk(self) -> DiskCache[T]:
+        return self._disk
+
+    def __repr__(self) -> str:
+        return f"<TieredCache {len(self)} at {id(self)}>"
+
+    def __len__(self) -> int:
+        return len(self._memory) + sum(
+            1 for key in self._disk.keys() if key not in self._memory
+        )
+
+    def _spill(self, key, value: T) -> None:
+        if key in self._clean:
+            self._clean.discard(key)
+            if key in self._disk:
+                return
+        self._disk[key] = value
+
+    def __getitem__(self, key) -> T:
+        try:
+            return self._memory[key]
+        except KeyError:
+            value = self._disk[key]
+        self._memory[key] = value
+        self._clean.add(key)
+        return value
+
+    def __setitem__(self, key, value: T) -> None:
+        self._clean.discard(key)
+        self._memory[key] = value
+        if key in self._disk:
+            # the value on disk is obsolete
+            del self._disk[key]
+
+    def __delitem__(self, key) -> None:
+        self._clean.discard(key)
+        found = False
+        if key in self._memory:
+            del self._memory[key]
+            found = True
+        if key in self._disk:
+            del self._disk[key]
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._memory or key in self._disk
+
+    def get(self, key, default=None) -> T:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def set(self, key, value: T) -> None:
+        self[key] = value
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._disk.clear()
+        self._clean.clear()
+
+    def close(self) -> None:
+        """
+        Moves the items in memory to disk and closes the disk cache, so items
+        are available the next time the file is opened.
+        """
+        for key, value in list(self._memory):
+            self._spill(key, value)
+        self._memory.clear()
+        self._clean.clear()
+        self._disk.close()
@@ -0,0 +1,80 @@
+from typing import Any, Hashable
+
+# keys made of at least this number of items cache their hash
+_MEMOIZED_HASH_MIN_SIZE = 4
+
+
+class _KwargsMarker:
+    """Separates positional arguments from keyword arguments in cache keys."""
+
+
+class _HashedKey(tuple):
+    """
+    Tuple that stores its hash, so that keys made of many items are hashed once,
+    even if they are looked up several times.
+    """
+
+    _hash: int
+
+    def __new__(cls, items: tuple, key_hash: int) -> "_HashedKey":
+        key = super().__new__(cls, items)
+        key._hash = key_hash
+        return key
+
+    def __hash__(self) -> int:  # type: ignore[override]
+        return self._hash
+
+    def __reduce__(self):
+        # hashes of strings differ across processes: never pickle the hash
+        return (tuple, (tuple(self),))
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Returns a hashable representation of common unhashable objects: lists,
+    dictionaries, sets and bytearrays. Other objects are returned as they are.
+    """
+    if isinstance(value, tuple):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, list):
+        return (list, tuple(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return (dict, _sorted(tuple((k, _freeze(v)) for k, v in value.items())))
+    if isinstance(value, (set, frozenset)):
+        return (set, _sorted(tuple(_freeze(item) for item in value)))
+    if isinstance(value, bytearray):
+        return (bytearray, bytes(value))
+    return value
+
+
+def _sorted(items: tuple) -> tuple | frozenset:
+    try:
+        return tuple(sorted(items))
+    except TypeError:
+        # items that cannot be compared
+        return frozenset(items)
+
+
+def make_key(args: tuple, kwargs: dict[str, Any]) -> Hashable:
+    """
+    Returns a cache key for a function called with the given positional and
+    keyword arguments. Without keyword arguments, the key is the tuple of
+    positional arguments. Keyword arguments are sorted by name, so their order
+    does not matter; an argument passed by position and by name produces
+    different keys.
+
+    Lists, dictionaries, sets and bytearrays are converted to hashable
+    equivalents, so they can be used as arguments. Keys made of many items cache
+    their hash, so they are hashed once even if looked up several times.
+    """
+    key = args
+    if kwargs:
+        key = args + (_KwargsMarker,) + tuple(sorted(kwargs.items()))
+    try:
+        key_hash = hash(key)
+    except TypeError:
+        key = _freeze(key)
+        key_hash = hash(key)
+    if len(key) >= _MEMOIZED_HASH_MIN_SIZE:
+        return _HashedKey(key, key_hash)
+    return key
@@ -0,0 +1,246 @@
+"""
+Loader batching the keys requested by concurrent callers, to load them with a
+single call of a function loading many values at once.
+"""
+
+import asyncio
+import threading
+import time
+from inspect import iscoroutinefunction
+from typing import Any, Callable, Generic, Iterable, Mapping, TypeVar
+
+from .cache import _MISSING, Cache
+from .decorators import _get_cached_entries, _set_cached_entries
+
+T = TypeVar("T")
+
+BatchFunction = Callable[[list[Any]], Any]
+
+
+class _Batch:
+    """Keys requested by threads, loaded with a single call of batch_fn."""
+
+    __slots__ = ("keys", "results", "error", "done")
+
+    def __init__(self) -> None:
+        self.keys: dict[Any, None] = {}
+        self.results: Mapping[Any, Any] = {}
+        self.error: BaseException | None = None
+        self.done = threading.Event()
+
+
+class BatchLoader(Generic[T]):
+    """
+    Loads values by key with a function that loads many values at once, called
+    with a list of keys and returning a mapping of values by key, batching the
+    keys requested by concurrent callers: many lookups of single keys, performed
+    by different coroutines or threads, result in a single call of the batch
+    function, for example a single database query instead of one per key.
+
+    Coroutines use load and load_many: keys requested during the same iteration
+    of the event loop are loaded together. The batch function can be a
+    coroutine function or a synchronous function.
+
+    Threads use load_sync and load_many_sync: the first thread requesting a key
+    that is not cached waits window seconds to collect the keys requested by
+    other threads, then calls the batch function, which must be synchronous.
+
+    Loaded values are stored in the cache (by default a LRU cache of max size
+    500; use an ExpiringCache to let values expire), so each key is loaded once
+    while it is cached. Keys being loaded are not requested again by other
+    callers, which wait for the batch that is loading them. Batches are split
+    in calls of up to max_batch_size keys, if specified. Keys missing from the
+    mapping returned by the batch function are not cached: load raises KeyError
+    for them, load_many does not include them in its result. Exceptions raised
+    by the batch function are raised to all the callers waiting for the batch.
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFunction,
+        cache=None,
+        *,
+        max_batch_size: int | None = None,
+        window: float = 0.001,
+    ) -> None:
+        assert max_batch_size is None or max_batch_size > 0
+        assert window >= 0
+        self._batch_fn = batch_fn
+        self._cache = Cache(500) if cache is None else cache
+        self.max_batch_size = max_batch_size
+        self.window = window
+        # asyncio: futures of the keys being collected, and of all the keys
+        # being collected or loaded
+        self._collecting: dict[Any, asyncio.Future] = {}
+        self._futures: dict[Any, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # threads: batch being collected, and batches of the keys being loaded
+        self._lock = threading.Lock()
+        self._batch: _Batch | None = None
+        self._batches: dict[Any, _Batch] = {}
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def _chunks(self, keys: list[Any]) -> list[list[Any]]:
+        size = self.max_batch_size or len(keys)
+        return [keys[index : index + size] for index in range(0, len(keys), size)]
+
+    def _store(self, values: Mapping[Any, T], keys: list[Any]) -> None:
+        loaded = {key: values[key] for key in keys if key in values}
+        if loaded:
+            _set_cached_entries(self._cache, loaded)
+
+    # asyncio
+
+    async def load(self, key) -> T:
+        """Returns the value of a key, loading it in a batch if it is not cached."""
+        values = await self.load_many([key])
+        try:
+            return values[key]
+        except KeyError:
+            raise KeyError(key) from None
+
+    async def load_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the values of the given keys, loading the keys
+        that are not cached in a batch. Keys that cannot be loaded are not
+        included in the returned dictionary.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = _get_cached_entries(self._cache, keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        futures = [self._get_future(key) for key in missing]
+        # a caller being cancelled must not cancel the batch other callers await
+        results = await asyncio.shield(asyncio.gather(*futures, return_exceptions=True))
+        for key, result in zip(missing, results):
+            if result is _MISSING:
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            found[key] = result
+        return {key: found[key] for key in keys if key in found}
+
+    def _get_future(self, key) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._collecting:
+                # dispatch after the callbacks ready in this iteration of the loop
+                loop.call_soon(self._dispatch)
+            self._collecting[key] = future
+        return future
+
+    def _dispatch(self) -> None:
+        batch, self._collecting = self._collecting, {}
+        for keys in self._chunks(list(batch)):
+            task = asyncio.get_running_loop().create_task(self._load_batch(keys))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, keys: list[Any]) -> None:
+        try:
+            if iscoroutinefunction(self._batch_fn):
+                values = await self._batch_fn(keys)
+            else:
+                values = self._batch_fn(keys)
+            self._store(values, keys)
+        except BaseException as error:
+            for key in keys:
+                future = self._futures.pop(key)
+                if not future.done():
+                    future.set_exception(error)
+            if not isinstance(error, Exception):
+                raise
+            return
+
+        for key in keys:
+            future = self._futures.pop(key)
+            if future.done():
+                continue
+            # keys that cannot be loaded are told apart from KeyError raised by
+            # the batch function
+            future.set_result(values.get(key, _MISSING))
+
+    # threads
+
+    def load_sync(self, key) -> T:
+        """
+        Returns the value of a key, loading it in a batch if it is not cached,
+        blocking the calling thread.
+        """
+        values = self.load_many_sync([key])
+        try:
+            return values[key]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def load_many_sync(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the values of the given keys, loading the keys
+        that are not cached in a batch, blocking the calling thread. Keys that
+        cannot be loaded are not included in the returned dictionary.
+        """
+        assert not iscoroutinefunction(
+            self._batch_fn
+        ), "threads require a synchronous batch function"
+        keys = list(dict.fromkeys(keys))
+        found = _get_cached_entries(self._cache, keys)
+        missing = [key for key in keys if key not in found]
+        if not missing:
+            return found
+
+        with self._lock:
+            batches = {}
+            own_batch = None
+            for key in missing:
+                batch = self._batches.get(key)
+                if batch is None:
+                    if self._batch is None:
+                        # this thread collects the keys of the next batch
+                        own_batch = self._batch = _Batch()
+                    batch = self._batches[key] = self._batch
+                    batch.keys[key] = None
+                batches[id(batch)] = batch
+
+        if own_batch is not None:
+            self._run_batch(own_batch)
+
+        for batch in batches.values():
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+        for batch in batches.values():
+            for key in missing:
+                if key in batch.results:
+                    found[key] = batch.results[key]
+        return {key: found[key] for key in keys if key in found}
+
+    def _run_batch(self, batch: _Batch) -> None:
+        if self.window:
+            time.sleep(self.window)
+        with self._lock:
+            # keys requested from now on go to a new batch
+            self._batch = None
+        keys = list(batch.keys)
+        try:
+            results: dict[Any, Any] = {}
+            for chunk in self._chunks(keys):
+                values = self._batch_fn(chunk)
+                self._store(values, chunk)
+                results.update((key, values[key]) for key in chunk if key in values)
+            batch.results = results
+        except BaseException as error:
+            batch.error = error
+            if not isinstance(error, Exception):
+                raise
+        finally:
+            with self._lock:
+                for key in keys:
+                    del self._batches[key]
+            batch.done.set()
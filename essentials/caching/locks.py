@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class KeyLocks:
+    """
+    Set of locks by key, used to let a single thread at a time work on a given
+    key. Locks are created on demand and discarded when no thread uses them.
+    """
+
+    __slots__ = ("_guard", "_locks")
+
+    def __init__(self) -> None:
+        self._guard = threading.Lock()
+        # key -> [lock, number of threads using the lock]
+        self._locks: dict[Any, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @contextmanager
+    def acquire(self, key, timeout: float | None = None) -> Iterator[bool]:
+        """
+        Acquires the lock for the given key, waiting up to timeout seconds, or
+        indefinitely if timeout is None. Yields a value indicating whether the
+        lock was acquired.
+        """
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+
+        lock = entry[0]
+        acquired = lock.acquire(timeout=-1 if timeout is None else timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                lock.release()
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
@@ -0,0 +1,295 @@
+"""
+Cache partitioned across several nodes by consistent hashing, so that adding or
+removing a node moves only the keys of a fraction of the ring.
+"""
+
+import pickle
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect
+from typing import Any, Generic, Iterable, Mapping, TypeVar
+
+from .cache import _MISSING, Cache
+from .shared import _encode_key, _hash_key
+
+T = TypeVar("T")
+
+
+class HashRing:
+    """
+    Consistent hash ring: each node is placed on the ring at replicas points
+    (virtual nodes), multiplied by its weight, and each key belongs to the node
+    of the first point following the hash of the key. Adding or removing a node
+    moves only the keys between its points and the previous ones, about
+    1 / number of nodes of all keys, and virtual nodes spread keys evenly.
+
+    Hashes are stable across processes, so processes sharing the same nodes
+    route keys to the same nodes, and equal keys are routed to the same node.
+    Keys must be None, numbers, strings, bytes, or tuples of them, like the keys
+    of SharedMemoryCache; other keys raise TypeError.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100) -> None:
+        assert replicas > 0
+        self.replicas = replicas
+        self._weights: dict[str, int] = {}
+        # sorted points of the ring, and the nodes owning them; replaced as a
+        # whole when nodes change, so that lookups need no lock
+        self._ring: tuple[list[int], list[str]] = ([], [])
+        for node in nodes:
+            self._weights[node] = 1
+        self._build()
+
+    @property
+    def nodes(self) -> list[str]:
+        return list(self._weights)
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._weights
+
+    def _build(self) -> None:
+        points = sorted(
+            (_hash_key(f"{node}#{index}".encode()), node)
+            for node, weight in self._weights.items()
+            for index in range(self.replicas * weight)
+        )
+        self._ring = ([point for point, _ in points], [node for _, node in points])
+
+    def add(self, node: str, weight: int = 1) -> None:
+        assert weight > 0
+        self._weights[node] = weight
+        self._build()
+
+    def remove(self, node: str) -> None:
+        del self._weights[node]
+        self._build()
+
+    def get_node(self, key) -> str:
+        """Returns the node of a key."""
+        return self.get_node_by_hash(_hash_key(_encode_key(key)))
+
+    def get_node_by_hash(self, key_hash: int) -> str:
+        points, owners = self._ring
+        if not points:
+            raise KeyError("The hash ring has no nodes.")
+        index = bisect(points, key_hash)
+        return owners[index % len(points)]
+
+
+class CacheTransport(ABC):
+    """
+    Base class for clients of cache nodes used by PartitionedCache, for example
+    a client of a remote cache server. Operations work on many keys at once, so
+    that keys of the same node are sent with a single request.
+    """
+
+    @abstractmethod
+    def get_many(self, keys: list[Any]) -> dict[Any, Any]:
+        """Returns a dictionary of the values found in the cache, by key."""
+
+    @abstractmethod
+    def set_many(self, items: dict[Any, Any]) -> None:
+        """Sets many items in the cache."""
+
+    @abstractmethod
+    def delete_many(self, keys: list[Any]) -> int:
+        """Removes many items from the cache, returning the number of removed items."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Removes all the items of the cache."""
+
+
+class LocalTransport(CacheTransport):
+    """
+    Cache node in the current process, used as stand-in for remote nodes in
+    tests and development. Values are stored pickled, like a remote node would
+    store them, so that callers receive copies of the values they set.
+    """
+
+    def __init__(self, cache: Cache | None = None, *, serialize: bool = True) -> None:
+        self.cache = Cache(500) if cache is None else cache
+        self.serialize = serialize
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: list[Any]) -> dict[Any, Any]:
+        with self._lock:
+            self.requests += 1
+            found = self.cache.get_many(keys)
+        if self.serialize:
+            return {key: pickle.loads(value) for key, value in found.items()}
+        return found
+
+    def set_many(self, items: dict[Any, Any]) -> None:
+        if self.serialize:
+            items = {
+                key: pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                for key, value in items.items()
+            }
+        with self._lock:
+            self.requests += 1
+            self.cache.set_many(items)
+
+    def delete_many(self, keys: list[Any]) -> int:
+        with self._lock:
+            self.requests += 1
+            return self.cache.delete_many(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.cache.clear()
+
+
+class PartitionedCache(Generic[T]):
+    """
+    Cache distributing items across several nodes, each accessed through a
+    CacheTransport, using a consistent hash ring with virtual nodes: each key
+    is stored in a single node, and adding or removing a node moves only a
+    fraction of the keys to other nodes. Operations on many keys send a single
+    request to each node.
+
+    When near_cache is specified (for example, an ExpiringCache with a short
+    max_age), values read from nodes are kept in it and read from it first,
+    avoiding requests to nodes for hot keys. Items set or deleted through this
+    instance are updated in the near cache too, but changes made by other
+    clients are seen only when near items expire.
+
+    Instances of this class can be used as cache of the lazy decorator.
+    """
+
+    def __init__(
+        self,
+        nodes: Mapping[str, CacheTransport],
+        *,
+        replicas: int = 100,
+        near_cache: Cache[T] | None = None,
+    ) -> None:
+        self._transports = dict(nodes)
+        self._ring = HashRing(self._transports, replicas)
+        self._near_cache = near_cache
+        self._near_lock = threading.Lock()
+
+    @property
+    def ring(self) -> HashRing:
+        return self._ring
+
+    @property
+    def near_cache(self) -> Cache[T] | None:
+        return self._near_cache
+
+    @property
+    def nodes(self) -> dict[str, CacheTransport]:
+        return dict(self._transports)
+
+    def __repr__(self) -> str:
+        return f"<PartitionedCache {len(self._transports)} nodes at {id(self)}>"
+
+    def add_node(self, name: str, transport: CacheTransport, weight: int = 1) -> None:
+        """
+        Adds a node to the ring. Keys moved to the new node are missing until
+        they are set again.
+        """
+        self._transports[name] = transport
+        self._ring.add(name, weight)
+
+    def remove_node(self, name: str) -> None:
+        """
+        Removes a node from the ring. Its keys are moved to other nodes, where
+        they are missing until they are set again.
+        """
+        self._ring.remove(name)
+        del self._transports[name]
+
+    def get_node(self, key) -> str:
+        """Returns the name of the node of a key."""
+        return self._ring.get_node(key)
+
+    def _group(self, keys: Iterable[Any]) -> dict[str, list[Any]]:
+        groups: dict[str, list[Any]] = {}
+        for key in keys:
+            groups.setdefault(self._ring.get_node(key), []).append(key)
+        return groups
+
+    def _near_get_many(self, keys: list[Any]) -> dict[Any, T]:
+        if self._near_cache is None:
+            return {}
+        with self._near_lock:
+            return self._near_cache.get_many(keys)
+
+    def _near_set_many(self, items: dict[Any, T]) -> None:
+        if self._near_cache is not None and items:
+            with self._near_lock:
+                self._near_cache.set_many(items)
+
+    def get_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the items found in the cache, by key. Missing keys
+        are not included in the returned dictionary.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = self._near_get_many(keys)
+        loaded: dict[Any, T] = {}
+        for node, node_keys in self._group(
+            key for key in keys if key not in found
+        ).items():
+            loaded.update(self._transports[node].get_many(node_keys))
+        self._near_set_many(loaded)
+        found.update(loaded)
+        return {key: found[key] for key in keys if key in found}
+
+    def set_many(self, items: Mapping[Any, T] | Iterable[tuple[Any, T]]) -> None:
+        """Sets many items in the cache, from a mapping or from (key, value) pairs."""
+        if not isinstance(items, Mapping):
+            items = dict(items)
+        for node, node_keys in self._group(items).items():
+            self._transports[node].set_many({key: items[key] for key in node_keys})
+        self._near_set_many(dict(items))
+
+    def delete_many(self, keys: Iterable[Any]) -> int:
+        """
+        Removes many items from the cache, ignoring missing keys. Returns the
+        number of removed items.
+        """
+        keys = list(dict.fromkeys(keys))
+        if self._near_cache is not None:
+            with self._near_lock:
+                self._near_cache.delete_many(keys)
+        return sum(
+            self._transports[node].delete_many(node_keys)
+            for node, node_keys in self._group(keys).items()
+        )
+
+    def __getitem__(self, key) -> T:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None) -> T:
+        return self.get_many([key]).get(key, default)
+
+    def set(self, key, value: T) -> None:
+        self.set_many({key: value})
+
+    def __setitem__(self, key, value: T) -> None:
+        self.set_many({key: value})
+
+    def __delitem__(self, key) -> None:
+        if not self.delete_many([key]):
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.get_many([key])
+
+    def clear(self) -> None:
+        """Removes all the items of all the nodes, and of the near cache."""
+        for transport in self._transports.values():
+            transport.clear()
+        if self._near_cache is not None:
+            with self._near_lock:
+                self._near_cache.clear()
@@ -0,0 +1,442 @@
+"""
+Eviction policies for Cache and ExpiringCache.
+
+By default, caches evict the least recently used items, using the order of their
+internal OrderedDict. Other policies can be configured by instance or by name,
+for example Cache(1000, policy="sieve"), and keep their own bookkeeping of keys:
+caches notify them of accesses, insertions and removals, and ask them which key
+to evict when they are full.
+"""
+
+from abc import abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from essentials.registry import Registry
+
+# marks the ends of linked lists, since None is a valid cache key
+_NIL: Any = object()
+
+
+class EvictionPolicy(Registry):
+    """
+    Base class for eviction policies. An instance of policy can be used by a
+    single cache.
+
+    Implementations must not return the last inserted key from evict(), unless it
+    is the only key in the cache or it is rejected by an admission filter: caches
+    call evict() after inserting new items.
+    """
+
+    def resize(self, capacity: int) -> None:
+        """Called when the maximum number of items of the cache is set."""
+
+    @abstractmethod
+    def access(self, key: Hashable) -> None:
+        """Called when an item is read or updated."""
+
+    @abstractmethod
+    def insert(self, key: Hashable) -> None:
+        """Called when a new item is added to the cache."""
+
+    @abstractmethod
+    def remove(self, key: Hashable) -> None:
+        """Called when an item is removed from the cache, not by eviction."""
+
+    @abstractmethod
+    def evict(self) -> Hashable:
+        """Forgets and returns the key of the item that must be evicted."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Called when the cache is cleared."""
+
+
+def get_policy(value: "EvictionPolicy | str | dict | None") -> EvictionPolicy | None:
+    """
+    Returns an instance of EvictionPolicy from an instance, a type name like
+    "sieve", or a configuration dictionary like {"type": "tinylfu", "window": 0.02}.
+    None and "lru" stand for the default LRU policy, handled by caches directly.
+    """
+    if value is None or value == "lru":
+        return None
+    if isinstance(value, EvictionPolicy):
+        return value
+    policy = EvictionPolicy.from_configuration(value)
+    assert isinstance(policy, EvictionPolicy)
+    return policy
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Evicts the least frequently used item, and among items with the same number
+    of accesses the least recently inserted or promoted one. Operations are O(1).
+    """
+
+    type_name = "lfu"
+
+    def __init__(self) -> None:
+        self._frequencies: dict[Any, int] = {}
+        # items by number of accesses; dicts keep insertion order
+        self._buckets: dict[int, dict[Any, None]] = {}
+        self._min_frequency = 0
+        self._newest: Any = _NIL
+
+    def _unlink(self, key, frequency: int) -> None:
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+            if self._min_frequency == frequency:
+                self._min_frequency = min(self._buckets, default=0)
+
+    def access(self, key) -> None:
+        frequency = self._frequencies[key]
+        bucket = self._buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[frequency]
+            if self._min_frequency == frequency:
+                self._min_frequency = frequency + 1
+        frequency += 1
+        self._frequencies[key] = frequency
+        self._buckets.setdefault(frequency, {})[key] = None
+
+    def insert(self, key) -> None:
+        self._frequencies[key] = 1
+        self._buckets.setdefault(1, {})[key] = None
+        self._min_frequency = 1
+        self._newest = key
+
+    def remove(self, key) -> None:
+        self._unlink(key, self._frequencies.pop(key))
+
+    def evict(self):
+        candidates = iter(self._buckets[self._min_frequency])
+        key = next(candidates)
+        if key is self._newest and len(self._frequencies) > 1:
+            key = next(candidates, _NIL)
+            if key is _NIL:
+                next_frequency = min(
+                    f for f in self._buckets if f != self._min_frequency
+                )
+                key = next(iter(self._buckets[next_frequency]))
+        self.remove(key)
+        return key
+
+    def clear(self) -> None:
+        self._frequencies.clear()
+        self._buckets.clear()
+        self._min_frequency = 0
+        self._newest = _NIL
+
+
+class SievePolicy(EvictionPolicy):
+    """
+    SIEVE eviction: items stay in insertion order and hits only mark them as
+    visited, without reordering. A hand moves from the oldest to the newest
+    items, clearing visited marks, and evicts the first item not visited.
+
+    See: SIEVE is Simpler than LRU (Zhang et al., NSDI 2024).
+    """
+
+    type_name = "sieve"
+
+    def __init__(self) -> None:
+        # doubly linked list of keys, from the oldest (tail) to the newest (head)
+        self._newer: dict[Any, Any] = {}
+        self._older: dict[Any, Any] = {}
+        self._head: Any = _NIL
+        self._tail: Any = _NIL
+        self._hand: Any = _NIL
+        self._visited: set[Any] = set()
+
+    def access(self, key) -> None:
+        self._visited.add(key)
+
+    def insert(self, key) -> None:
+        self._older[key] = self._head
+        self._newer[key] = _NIL
+        if self._head is _NIL:
+            self._tail = key
+        else:
+            self._newer[self._head] = key
+        self._head = key
+
+    def remove(self, key) -> None:
+        newer = self._newer.pop(key)
+        older = self._older.pop(key)
+        if self._hand is key:
+            self._hand = newer
+        if newer is _NIL:
+            self._head = older
+        else:
+            self._older[newer] = older
+        if older is _NIL:
+            self._tail = newer
+        else:
+            self._newer[older] = newer
+        self._visited.discard(key)
+
+    def evict(self):
+        visited = self._visited
+        key = self._tail if self._hand is _NIL else self._hand
+        while True:
+            if key is _NIL:
+                key = self._tail
+            if key in visited:
+                visited.discard(key)
+            elif key is not self._head or self._head is self._tail:
+                break
+            # the newest item is protected, and it is always the last one before
+            # the hand returns to the tail
+            key = self._newer[key]
+        self._hand = self._newer[key]
+        self.remove(key)
+        return key
+
+    def clear(self) -> None:
+        self._newer.clear()
+        self._older.clear()
+        self._visited.clear()
+        self._head = self._tail = self._hand = _NIL
+
+
+class ARCPolicy(EvictionPolicy):
+    """
+    Adaptive Replacement Cache: balances between recency and frequency keeping
+    two LRU lists of items seen once (T1) and at least twice (T2), and two lists
+    of recently evicted keys (B1, B2) used to adapt the target size of T1.
+
+    See: ARC: A Self-Tuning, Low Overhead Replacement Cache (Megiddo, Modha, 2003).
+    """
+
+    type_name = "arc"
+
+    def __init__(self) -> None:
+        self._capacity = 1
+        self._target = 0.0
+        self._t1: OrderedDict[Any, None] = OrderedDict()
+        self._t2: OrderedDict[Any, None] = OrderedDict()
+        self._b1: OrderedDict[Any, None] = OrderedDict()
+        self._b2: OrderedDict[Any, None] = OrderedDict()
+        self._hit_b2 = False
+        self._newest: Any = _NIL
+
+    def resize(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._target = min(self._target, capacity)
+
+    def access(self, key) -> None:
+        if key in self._t1:
+            del self._t1[key]
+            self._t2[key] = None
+        else:
+            self._t2.move_to_end(key)
+
+    def insert(self, key) -> None:
+        b1, b2 = self._b1, self._b2
+        self._hit_b2 = False
+        if key in b1:
+            self._target = min(self._capacity, self._target + max(len(b2) / len(b1), 1))
+            del b1[key]
+            self._t2[key] = None
+        elif key in b2:
+            self._target = max(0, self._target - max(len(b1) / len(b2), 1))
+            del b2[key]
+            self._t2[key] = None
+            self._hit_b2 = True
+        else:
+            self._t1[key] = None
+        self._newest = key
+
+        # keep the history of evicted keys bounded by the capacity
+        while b1 and len(self._t1) + len(b1) > self._capacity:
+            b1.popitem(last=False)
+        while b2 and len(self._t1) + len(self._t2) + len(b1) + len(b2) > (
+            2 * self._capacity
+        ):
+            b2.popitem(last=False)
+
+    def remove(self, key) -> None:
+        if key in self._t1:
+            del self._t1[key]
+        else:
+            del self._t2[key]
+
+    def _least_recent(self, items: OrderedDict) -> Any:
+        keys = iter(items)
+        key = next(keys, _NIL)
+        if key is self._newest:
+            key = next(keys, _NIL)
+        return key
+
+    def evict(self):
+        t1_size = len(self._t1)
+        if t1_size and (
+            t1_size > self._target or (self._hit_b2 and t1_size == self._target)
+        ):
+            key = self._least_recent(self._t1)
+            if key is not _NIL:
+                del self._t1[key]
+                self._b1[key] = None
+                return key
+
+        key = self._least_recent(self._t2)
+        if key is not _NIL:
+            del self._t2[key]
+            self._b2[key] = None
+            return key
+
+        key = self._least_recent(self._t1)
+        if key is _NIL:
+            # the newest item is the only item
+            key = self._newest
+            self.remove(key)
+            return key
+        del self._t1[key]
+        self._b1[key] = None
+        return key
+
+    def clear(self) -> None:
+        for items in (self._t1, self._t2, self._b1, self._b2):
+            items.clear()
+        self._target = 0.0
+        self._newest = _NIL
+
+
+class FrequencySketch:
+    """
+    Count-min sketch estimating how often keys were seen, with four rows of
+    counters saturating at 15. Counters are halved after a number of increments
+    proportional to the capacity, so that old popularity fades away.
+    """
+
+    __slots__ = ("_mask", "_width", "_table", "_additions", "_sample_size")
+
+    _SEEDS = (
+        0x9E3779B97F4A7C15,
+        0xC2B2AE3D27D4EB4F,
+        0x165667B19E3779F9,
+        0xD6E8FEB86659FD93,
+    )
+
+    def __init__(self, capacity: int) -> None:
+        self._width = 1 << max(4, (4 * max(1, capacity) - 1).bit_length())
+        self._mask = self._width - 1
+        self._table = bytearray(4 * self._width)
+        self._additions = 0
+        self._sample_size = 10 * max(1, capacity)
+
+    def _indexes(self, key) -> list[int]:
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        width, mask = self._width, self._mask
+        return [
+            row * width + ((((h * seed) & 0xFFFFFFFFFFFFFFFF) >> 32) & mask)
+            for row, seed in enumerate(self._SEEDS)
+        ]
+
+    def increment(self, key) -> None:
+        table = self._table
+        added = False
+        for index in self._indexes(key):
+            if table[index] < 15:
+                table[index] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self._sample_size:
+                self._age()
+
+    def frequency(self, key) -> int:
+        table = self._table
+        return min(table[index] for index in self._indexes(key))
+
+    def _age(self) -> None:
+        self._table = bytearray(count >> 1 for count in self._table)
+        self._additions //= 2
+
+
+class TinyLFUPolicy(EvictionPolicy):
+    """
+    W-TinyLFU eviction: new items enter a small LRU window; items leaving the
+    window are admitted to the main segmented LRU only if they are estimated to
+    be accessed more frequently than the item the main area would evict. This
+    protects the cache from scans and one-hit wonders, and keeps popular items.
+
+    See: TinyLFU: A Highly Efficient Cache Admission Policy (Einziger et al.).
+    """
+
+    type_name = "tinylfu"
+
+    def __init__(self, window: float = 0.01, protected: float = 0.8) -> None:
+        assert 0 < window < 1
+        assert 0 < protected < 1
+        self._window_ratio = window
+        self._protected_ratio = protected
+        self._window: OrderedDict[Any, None] = OrderedDict()
+        self._probation: OrderedDict[Any, None] = OrderedDict()
+        self._protected: OrderedDict[Any, None] = OrderedDict()
+        self.resize(500)
+
+    def resize(self, capacity: int) -> None:
+        self._window_capacity = max(1, int(capacity * self._window_ratio))
+        self._main_capacity = max(1, capacity - self._window_capacity)
+        self._protected_capacity = max(
+            1, int(self._main_capacity * self._protected_ratio)
+        )
+        self._sketch = FrequencySketch(capacity)
+
+    def access(self, key) -> None:
+        self._sketch.increment(key)
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self._protected_capacity:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+        else:
+            self._protected.move_to_end(key)
+
+    def insert(self, key) -> None:
+        self._sketch.increment(key)
+        window = self._window
+        window[key] = None
+        # while the cache is filling, items leaving the window move to probation
+        while len(window) > self._window_capacity and (
+            len(self._probation) + len(self._protected) < self._main_capacity
+        ):
+            candidate, _ = window.popitem(last=False)
+            self._probation[candidate] = None
+
+    def remove(self, key) -> None:
+        for items in (self._window, self._probation, self._protected):
+            if key in items:
+                del items[key]
+                return
+
+    def evict(self):
+        if len(self._window) > self._window_capacity:
+            candidate, _ = self._window.popitem(last=False)
+            main = self._probation or self._protected
+            if not main:
+                return candidate
+            victim = next(iter(main))
+            # admission: the candidate replaces the victim only if more popular
+            if self._sketch.frequency(candidate) > self._sketch.frequency(victim):
+                del main[victim]
+                self._probation[candidate] = None
+                return victim
+            return candidate
+
+        for items in (self._probation, self._protected, self._window):
+            if items:
+                key, _ = items.popitem(last=False)
+                return key
+        raise KeyError("evict from empty policy")
+
+    def clear(self) -> None:
+        for items in (self._window, self._probation, self._protected):
+            items.clear()
@@ -0,0 +1,254 @@
+import threading
+from typing import Any, Callable, Generic, Iterable, Iterator, Mapping, TypeVar
+
+from .cache import _MISSING, Cache, ExpiringCache
+from .locks import KeyLocks
+from .stats import CacheStats
+
+T = TypeVar("T")
+ShardFactory = Callable[[int], Cache[T]]
+
+
+class ShardedCache(Generic[T]):
+    """
+    Thread-safe cache that distributes keys across a number of shards, each
+    protected by its own lock. Threads working on keys that belong to different
+    shards never contend for the same lock. On builds with the GIL this is not
+    faster than a Cache protected by a single lock, since the GIL serializes
+    threads anyway; see benchmarks/sharded_cache.py.
+
+    Each shard is an ordinary Cache (by default an LRU Cache); use the factory
+    parameter to create different kinds of shards, for example ExpiringCache.
+    Statistics are the sum of the statistics of all shards.
+
+    Each shard holds up to max_size / shards items, rounded up, so the cache can
+    hold slightly more than max_size items, up to shards - 1 more.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 500,
+        shards: int = 16,
+        factory: ShardFactory | None = None,
+        *,
+        track_stats: bool = False,
+    ) -> None:
+        assert shards > 0
+        assert max_size >= shards, "max_size must be at least equal to shards"
+        if factory is None:
+
+            def factory(shard_size: int) -> Cache[T]:
+                return Cache(shard_size, track_stats=track_stats)
+
+        self._count = int(shards)
+        self._max_size = int(max_size)
+        self._shards: tuple[Cache[T], ...] = tuple(
+            factory(self._shard_size(max_size)) for _ in range(self._count)
+        )
+        self._locks = tuple(threading.Lock() for _ in range(self._count))
+        self._key_locks = KeyLocks()
+        for shard, lock in zip(self._shards, self._locks):
+            if isinstance(shard, ExpiringCache) and shard._refresh_lock is None:
+                # items refreshed in background are set holding the shard lock
+                shard._refresh_lock = lock
+
+    @classmethod
+    def with_max_age(
+        cls, max_age: float, max_size: int = 500, shards: int = 16, **kwargs: Any
+    ) -> "ShardedCache":
+        """
+        Returns an instance of ShardedCache whose shards are ExpiringCache
+        invalidating items set more than a given number of seconds ago.
+        Other keyword arguments are passed to the constructor of the shards.
+        """
+        return cls(
+            max_size,
+            shards,
+            lambda shard_size: ExpiringCache.with_max_age(
+                max_age, shard_size, **kwargs
+            ),
+        )
+
+    def _shard_size(self, max_size: int) -> int:
+        return -(-int(max_size) // self._count)
+
+    def _locate(self, key) -> tuple[Cache[T], threading.Lock]:
+        index = hash(key) % self._count
+        return self._shards[index], self._locks[index]
+
+    @property
+    def shards(self) -> int:
+        return self._count
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, value: int) -> None:
+        assert value >= self._count
+        self._max_size = int(value)
+        shard_size = self._shard_size(value)
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.max_size = shard_size
+                shard._check_size()
+
+    @property
+    def weight(self) -> int:
+        return sum(shard.weight for shard in self._shards)
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self) == 0
+
+    def stats(self) -> CacheStats:
+        total = CacheStats()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                total += shard.stats()
+        return total
+
+    def reset_stats(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.reset_stats()
+
+    def values(self) -> Iterable[T]:
+        for _, value in self:
+            yield value
+
+    def keys(self) -> Iterable[Any]:
+        for key, _ in self:
+            yield key
+
+    def __repr__(self) -> str:
+        return f"<ShardedCache {len(self)} at {id(self)}>"
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def get(self, key, default=None) -> T:
+        shard, lock = self._locate(key)
+        with lock:
+            return shard.get(key, default)
+
+    def set(self, key, value, **options: Any) -> None:
+        """
+        Sets an item in its shard, with the given options of the set method of
+        the shards (for example tags, or ttl for ExpiringCache shards).
+        """
+        shard, lock = self._locate(key)
+        with lock:
+            shard.set(key, value, **options)
+
+    def get_or_create(self, key, factory: Callable[[], T], **options: Any) -> T:
+        """
+        Returns the value of a key, or creates it calling factory() and sets it
+        in the cache, with the given options of set.
+
+        Concurrent threads creating the value of the same key wait for the first
+        one to complete, so that factory is called once for a key at a time.
+        The lock of the shard is not held while calling factory. Exceptions
+        raised by factory are propagated and nothing is cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._key_locks.acquire(key):
+            # another thread might have created the value while this one was
+            # waiting for the lock
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            value = factory()
+            self.set(key, value, **options)
+        return value
+
+    def invalidate_tag(self, tag) -> int:
+        """
+        Removes the items set with the given tag from all shards, returning the
+        number of removed items.
+        """
+        removed = 0
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                removed += shard.invalidate_tag(tag)
+        return removed
+
+    def _group(self, keys: Iterable[Any]) -> dict[int, list[Any]]:
+        groups: dict[int, list[Any]] = {}
+        for key in keys:
+            groups.setdefault(hash(key) % self._count, []).append(key)
+        return groups
+
+    def get_many(self, keys: Iterable[Any]) -> dict[Any, T]:
+        """
+        Returns a dictionary of the items found in the cache, by key. Keys are
+        grouped by shard, so the lock of each shard is acquired once.
+        """
+        found: dict[Any, T] = {}
+        for index, shard_keys in self._group(keys).items():
+            with self._locks[index]:
+                found.update(self._shards[index].get_many(shard_keys))
+        return found
+
+    def set_many(
+        self, items: Mapping[Any, T] | Iterable[tuple[Any, T]], **options: Any
+    ) -> None:
+        """
+        Sets many items, with the given options of the set_many method of the
+        shards (for example tags, or ttl for ExpiringCache shards). Items are
+        grouped by shard, so the lock of each shard is acquired once.
+        """
+        if isinstance(items, Mapping):
+            items = items.items()
+        groups: dict[int, list[tuple[Any, T]]] = {}
+        for key, value in items:
+            groups.setdefault(hash(key) % self._count, []).append((key, value))
+        for index, shard_items in groups.items():
+            with self._locks[index]:
+                self._shards[index].set_many(shard_items, **options)
+
+    def delete_many(self, keys: Iterable[Any]) -> int:
+        removed = 0
+        for index, shard_keys in self._group(keys).items():
+            with self._locks[index]:
+                removed += self._shards[index].delete_many(shard_keys)
+        return removed
+
+    def __getitem__(self, key) -> T:
+        shard, lock = self._locate(key)
+        with lock:
+            return shard[key]
+
+    def __setitem__(self, key, value: T) -> None:
+        shard, lock = self._locate(key)
+        with lock:
+            shard[key] = value
+
+    def __delitem__(self, key) -> None:
+        shard, lock = self._locate(key)
+        with lock:
+            del shard[key]
+
+    def __contains__(self, key) -> bool:
+        shard, lock = self._locate(key)
+        with lock:
+            return key in shard
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        """
+        Iterates through cached items, one shard at a time. Each shard is copied
+        while holding its lock, so iterating is safe while other threads modify
+        the cache.
+        """
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                items = list(shard)
+            yield from items
+
+    def clear(self) -> None:
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
@@ -0,0 +1,397 @@
+"""
+Cache stored in shared memory, so that processes running on the same host (for
+example, the workers of a pre-fork web server) share cached items instead of
+keeping a copy of them in each process.
+"""
+
+import multiprocessing
+import pickle
+import struct
+import sys
+from hashlib import blake2b
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Generic, Iterator, Sequence, TypeVar
+
+from .keys import _KwargsMarker
+
+T = TypeVar("T")
+
+_MAGIC = b"ESC1"
+# magic, number of sets, ways, slot size
+_TABLE_HEADER = struct.Struct("<4sIII")
+# state, referenced, key size, value size, key hash
+_SLOT_HEADER = struct.Struct("<BBxxIIQ")
+_EMPTY = 0
+_USED = 1
+
+
+_LENGTH = struct.Struct("<I")
+_FLOAT = struct.Struct("<d")
+# types used as markers in keys made by make_key
+_KEY_MARKERS = (_KwargsMarker, list, dict, set, bytearray)
+
+
+def _hash_key(key_data: bytes) -> int:
+    # the built-in hash of strings differs across processes
+    return int.from_bytes(blake2b(key_data, digest_size=8).digest(), "little")
+
+
+def _encode_key(key: Any) -> bytes:
+    """
+    Returns the canonical encoding of a key, equal for keys that are equal:
+    unlike pickle, whose output depends on the identity of objects, on the
+    order of dictionaries, and on types of equal numbers. Supported keys are
+    None, numbers, strings, bytes, and tuples of them; integral floats and
+    booleans are encoded like the equal integers.
+    """
+    parts: list[bytes] = []
+    _encode_into(key, parts)
+    return b"".join(parts)
+
+
+def _encode_into(key: Any, parts: list[bytes]) -> None:
+    if key is None:
+        parts.append(b"N")
+    elif isinstance(key, float) and key.is_integer():
+        _encode_into(int(key), parts)
+    elif isinstance(key, int):
+        data = str(int(key)).encode()
+        parts += (b"i", _LENGTH.pack(len(data)), data)
+    elif isinstance(key, float):
+        parts += (b"f", _FLOAT.pack(key))
+    elif isinstance(key, str):
+        data = key.encode("utf-8", "surrogatepass")
+        parts += (b"s", _LENGTH.pack(len(data)), data)
+    elif isinstance(key, bytes):
+        parts += (b"b", _LENGTH.pack(len(key)), key)
+    elif isinstance(key, tuple):
+        parts += (b"t", _LENGTH.pack(len(key)))
+        for item in key:
+            _encode_into(item, parts)
+    elif isinstance(key, type) and key in _KEY_MARKERS:
+        parts += (b"m", bytes((_KEY_MARKERS.index(key),)))
+    else:
+        raise TypeError(
+            f"Keys of type {type(key).__name__} are not supported: use None, "
+            "numbers, strings, bytes, or tuples of them."
+        )
+
+
+def _decode_key(data: bytes) -> Any:
+    """Returns the key encoded by _encode_key."""
+    key, _ = _decode_from(memoryview(data), 0)
+    return key
+
+
+def _decode_from(data: memoryview, offset: int) -> tuple[Any, int]:
+    tag = data[offset : offset + 1]
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"f":
+        return _FLOAT.unpack_from(data, offset)[0], offset + _FLOAT.size
+    if tag == b"m":
+        return _KEY_MARKERS[data[offset]], offset + 1
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    if tag == b"t":
+        items = []
+        for _ in range(length):
+            item, offset = _decode_from(data, offset)
+            items.append(item)
+        return tuple(items), offset
+    end = offset + length
+    value = bytes(data[offset:end])
+    if tag == b"i":
+        return int(value), end
+    if tag == b"s":
+        return value.decode("utf-8", "surrogatepass"), end
+    return value, end
+
+
+class SharedMemoryCache(Generic[T]):
+    """
+    Cache storing pickled items in a fixed-size hash table in shared memory.
+
+    The table is made of sets of slots (ways slots per set), each slot holding
+    one item of up to slot_size bytes, including its encoded key and pickled
+    value. The set of a key is determined by a stable hash of the key, and when
+    a set is full one of its items is evicted using the clock algorithm: items
+    read since the hand of the clock last passed over them get a second chance.
+    The cache holds up to max_size items, rounded up to a multiple of ways.
+
+    Keys must be None, numbers, strings, bytes, or tuples of them (like the keys
+    made by the lazy decorator), since keys are found by an encoding that is
+    the same for equal keys; other keys raise TypeError. Integral floats and
+    booleans are the same keys as the equal integers, and are returned as such
+    when iterating.
+
+    Sets are protected by a number of multiprocessing locks. Processes share
+    the cache when they inherit it from the process that created it (for
+    example, creating the cache before a pre-fork server forks its workers), or
+    when they receive it as argument of a multiprocessing.Process. Other
+    processes can attach to the same shared memory by name, passing the same
+    locks.
+
+    The process that created the cache should call unlink() when the cache is
+    not needed anymore, to release the shared memory.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        slot_size: int = 1024,
+        *,
+        name: str | None = None,
+        ways: int = 8,
+        locks: int | Sequence[Any] = 16,
+    ) -> None:
+        assert max_size > 0
+        assert 0 < ways < 256
+        assert slot_size > _SLOT_HEADER.size
+        sets = -(-max_size // ways)
+        size = _TABLE_HEADER.size + sets + sets * ways * slot_size
+        memory = SharedMemory(name, create=True, size=size)
+        assert memory.buf is not None
+        _TABLE_HEADER.pack_into(memory.buf, 0, _MAGIC, sets, ways, slot_size)
+        memory.buf[_TABLE_HEADER.size : size] = bytes(size - _TABLE_HEADER.size)
+        if isinstance(locks, int):
+            assert locks > 0
+            self._setup(memory, [multiprocessing.Lock() for _ in range(locks)], True)
+        else:
+            self._setup(memory, locks, True)
+
+    def _setup(self, memory: SharedMemory, locks: Sequence[Any], owner: bool) -> None:
+        assert memory.buf is not None
+        magic, sets, ways, slot_size = _TABLE_HEADER.unpack_from(memory.buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"The shared memory {memory.name} is not a cache.")
+        self._memory = memory
+        self._buf = memory.buf
+        self._locks = tuple(locks)
+        self._owner = owner
+        self._sets = sets
+        self._ways = ways
+        self._slot_size = slot_size
+        self._max_data_size = slot_size - _SLOT_HEADER.size
+        # a clock hand for each set, followed by the slots
+        self._hands_offset = _TABLE_HEADER.size
+        self._slots_offset = _TABLE_HEADER.size + sets
+
+    @classmethod
+    def attach(cls, name: str, locks: Sequence[Any]) -> "SharedMemoryCache":
+        """
+        Returns an instance of SharedMemoryCache using the shared memory with the
+        given name, created by another instance in a process that is not a parent
+        of this process. Locks must be the locks of the instance that created the
+        shared memory.
+        """
+        return cls._attach(name, locks, False)
+
+    @classmethod
+    def _attach(
+        cls, name: str, locks: Sequence[Any], child: bool
+    ) -> "SharedMemoryCache":
+        if sys.version_info >= (3, 13):
+            memory = SharedMemory(name, track=False)
+        else:
+            memory = SharedMemory(name)
+            if not child:
+                # only the process that created the shared memory must destroy
+                # it; child processes share the resource tracker of their parent
+                resource_tracker.unregister(
+                    memory._name, "shared_memory"  # type: ignore[attr-defined]
+                )
+        instance = cls.__new__(cls)
+        instance._setup(memory, locks, owner=False)
+        return instance
+
+    def __reduce__(self):
+        # used to pass the cache to child processes started by multiprocessing
+        return (SharedMemoryCache._attach, (self.name, self._locks, True))
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    @property
+    def locks(self) -> tuple[Any, ...]:
+        return self._locks
+
+    @property
+    def max_size(self) -> int:
+        return self._sets * self._ways
+
+    @property
+    def slot_size(self) -> int:
+        return self._slot_size
+
+    def __repr__(self) -> str:
+        return f"<SharedMemoryCache {self.name}>"
+
+    def __enter__(self) -> "SharedMemoryCache[T]":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+        if self._owner:
+            self.unlink()
+
+    def _locate(self, key_data: bytes) -> tuple[int, int, Any]:
+        key_hash = _hash_key(key_data)
+        index = key_hash % self._sets
+        return key_hash, index, self._locks[index % len(self._locks)]
+
+    def _slot_offset(self, index: int, way: int) -> int:
+        return self._slots_offset + (index * self._ways + way) * self._slot_size
+
+    def _find(self, index: int, key_hash: int, key_data: bytes) -> int:
+        """Returns the offset of the slot of the given key, or -1."""
+        buf = self._buf
+        for way in range(self._ways):
+            offset = self._slot_offset(index, way)
+            state, _, key_size, _, slot_hash = _SLOT_HEADER.unpack_from(buf, offset)
+            if (
+                state == _USED
+                and slot_hash == key_hash
+                and key_size == len(key_data)
+                and buf[
+                    offset + _SLOT_HEADER.size : offset + _SLOT_HEADER.size + key_size
+                ]
+                == key_data
+            ):
+                return offset
+        return -1
+
+    def _victim(self, index: int) -> int:
+        """Returns the offset of a free slot of a set, evicting an item if needed."""
+        buf = self._buf
+        for way in range(self._ways):
+            offset = self._slot_offset(index, way)
+            if buf[offset] == _EMPTY:
+                return offset
+        hand_offset = self._hands_offset + index
+        way = buf[hand_offset] % self._ways
+        while True:
+            offset = self._slot_offset(index, way)
+            way = (way + 1) % self._ways
+            if buf[offset + 1]:
+                # referenced since the last pass: second chance
+                buf[offset + 1] = 0
+                continue
+            buf[hand_offset] = way
+            return offset
+
+    def __getitem__(self, key) -> T:
+        key_data = _encode_key(key)
+        key_hash, index, lock = self._locate(key_data)
+        buf = self._buf
+        with lock:
+            offset = self._find(index, key_hash, key_data)
+            if offset == -1:
+                raise KeyError(key)
+            _, _, key_size, value_size, _ = _SLOT_HEADER.unpack_from(buf, offset)
+            buf[offset + 1] = 1
+            start = offset + _SLOT_HEADER.size + key_size
+            value_data = bytes(buf[start : start + value_size])
+        return pickle.loads(value_data)
+
+    def __setitem__(self, key, value: T) -> None:
+        key_data = _encode_key(key)
+        value_data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(key_data) + len(value_data) > self._max_data_size:
+            raise ValueError(
+                f"The item is too large for the cache: {len(key_data)} bytes for "
+                f"the key and {len(value_data)} bytes for the value exceed the size "
+                f"of slots ({self._max_data_size} bytes)."
+            )
+        key_hash, index, lock = self._locate(key_data)
+        buf = self._buf
+        with lock:
+            offset = self._find(index, key_hash, key_data)
+            if offset == -1:
+                offset = self._victim(index)
+            start = offset + _SLOT_HEADER.size
+            buf[start : start + len(key_data)] = key_data
+            start += len(key_data)
+            buf[start : start + len(value_data)] = value_data
+            _SLOT_HEADER.pack_into(
+                buf, offset, _USED, 0, len(key_data), len(value_data), key_hash
+            )
+
+    def __delitem__(self, key) -> None:
+        key_data = _encode_key(key)
+        key_hash, index, lock = self._locate(key_data)
+        with lock:
+            offset = self._find(index, key_hash, key_data)
+            if offset == -1:
+                raise KeyError(key)
+            self._buf[offset] = _EMPTY
+
+    def __contains__(self, key) -> bool:
+        key_data = _encode_key(key)
+        key_hash, index, lock = self._locate(key_data)
+        with lock:
+            return self._find(index, key_hash, key_data) != -1
+
+    def _iter_set(self, index: int) -> list[tuple[bytes, bytes]]:
+        buf = self._buf
+        items = []
+        with self._locks[index % len(self._locks)]:
+            for way in range(self._ways):
+                offset = self._slot_offset(index, way)
+                state, _, key_size, value_size, _ = _SLOT_HEADER.unpack_from(
+                    buf, offset
+                )
+                if state == _USED:
+                    start = offset + _SLOT_HEADER.size
+                    end = start + key_size
+                    items.append(
+                        (bytes(buf[start:end]), bytes(buf[end : end + value_size]))
+                    )
+        return items
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        """
+        Iterates through cached items, one set at a time: items can be modified
+        by other processes while iterating.
+        """
+        for index in range(self._sets):
+            for key_data, value_data in self._iter_set(index):
+                yield _decode_key(key_data), pickle.loads(value_data)
+
+    def __len__(self) -> int:
+        return sum(len(self._iter_set(index)) for index in range(self._sets))
+
+    def get(self, key, default=None) -> T:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def set(self, key, value: T) -> None:
+        self[key] = value
+
+    def keys(self) -> Iterator[Any]:
+        for key, _ in self:
+            yield key
+
+    def values(self) -> Iterator[T]:
+        for _, value in self:
+            yield value
+
+    def clear(self) -> None:
+        buf = self._buf
+        for index in range(self._sets):
+            with self._locks[index % len(self._locks)]:
+                for way in range(self._ways):
+                    buf[self._slot_offset(index, way)] = _EMPTY
+
+    def close(self) -> None:
+        """Closes the access of this process to the shared memory."""
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Destroys the shared memory: call once, when no process needs it."""
+        self._memory.unlink()
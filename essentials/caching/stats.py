@@ -0,0 +1,109 @@
+from dataclasses import dataclass, fields
+from time import perf_counter
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """Snapshot of the statistics of a cache, or of a function decorated by lazy."""
+
+    hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    evictions: int = 0
+    loads: int = 0
+    load_time: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_ratio(self) -> float:
+        requests = self.requests
+        return self.hits / requests if requests else 0.0
+
+    @property
+    def average_load_time(self) -> float:
+        return self.load_time / self.loads if self.loads else 0.0
+
+    def __add__(self, other: "CacheStats") -> "CacheStats":
+        if not isinstance(other, CacheStats):
+            return NotImplemented
+        return CacheStats(
+            *(
+                getattr(self, field.name) + getattr(other, field.name)
+                for field in fields(self)
+            )
+        )
+
+
+@dataclass(frozen=True)
+class FlushStats:
+    """
+    Snapshot of the statistics of the flushes of a WriteBehindCache. Times are
+    in seconds.
+    """
+
+    flushes: int = 0
+    items: int = 0
+    errors: int = 0
+    flush_time: float = 0.0
+    last_flush_time: float = 0.0
+    max_flush_time: float = 0.0
+
+    @property
+    def average_flush_time(self) -> float:
+        return self.flush_time / self.flushes if self.flushes else 0.0
+
+
+class StatsCounter:
+    """
+    Mutable counters of cache operations. Caches keep a reference to an instance
+    of this class only when statistics are enabled, so that the cost of
+    statistics when disabled is a single comparison with None.
+    """
+
+    __slots__ = ("hits", "misses", "expirations", "evictions", "loads", "load_time")
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_time = 0.0
+
+    def measure_load(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Calls a function that loads a value, counting the call and its duration."""
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.loads += 1
+            self.load_time += perf_counter() - start
+
+    async def measure_load_async(
+        self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> T:
+        start = perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.loads += 1
+            self.load_time += perf_counter() - start
+
+    def snapshot(self) -> CacheStats:
+        return CacheStats(
+            self.hits,
+            self.misses,
+            self.expirations,
+            self.evictions,
+            self.loads,
+            self.load_time,
+        )
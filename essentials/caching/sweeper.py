@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, ContextManager
+
+from .background import logger
+from .cache import ExpiringCache
+from .sharded import ShardedCache
+
+
+class ExpirationSweeper:
+    """
+    Removes expired items from an ExpiringCache periodically, every interval
+    seconds, in a daemon thread (start) or in an asyncio task (start_task), so
+    that expired items do not wait to be read, or for the cache to be full, to
+    be removed.
+
+    Each sweep removes expired items in batches lasting about max_batch_time
+    seconds, releasing the cache between batches, so that sweeping never blocks
+    the application for long.
+
+    ExpiringCache is not thread-safe: when sweeping in a thread, pass the lock
+    that protects the cache, or sweep a ShardedCache whose shards are
+    ExpiringCache, which is swept one shard at a time using its locks.
+    """
+
+    def __init__(
+        self,
+        cache: ExpiringCache | ShardedCache,
+        interval: float = 1.0,
+        *,
+        max_batch_time: float = 0.002,
+        lock: ContextManager | None = None,
+    ) -> None:
+        assert interval > 0
+        assert max_batch_time > 0
+        self.interval = interval
+        self.max_batch_time = max_batch_time
+        self._targets: list[tuple[ExpiringCache, Any]]
+        if isinstance(cache, ShardedCache):
+            assert lock is None, "ShardedCache is swept using the locks of shards"
+            self._targets = list(zip(cache._shards, cache._locks))  # type: ignore
+            assert all(
+                isinstance(shard, ExpiringCache) for shard, _ in self._targets
+            ), "the shards of the cache must be instances of ExpiringCache"
+        else:
+            self._targets = [(cache, lock or nullcontext())]
+        self._reclaimed = 0
+        self._last_reclaimed = 0
+        self._sweeps = 0
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def reclaimed(self) -> int:
+        """Returns the number of expired items removed by all sweeps."""
+        return self._reclaimed
+
+    @property
+    def last_reclaimed(self) -> int:
+        """Returns the number of expired items removed by the last sweep."""
+        return self._last_reclaimed
+
+    @property
+    def sweeps(self) -> int:
+        return self._sweeps
+
+    @property
+    def running(self) -> bool:
+        if self._thread is not None:
+            return self._thread.is_alive()
+        return self._task is not None and not self._task.done()
+
+    def _sweep_batch(self, cache: ExpiringCache, lock: Any) -> int:
+        with lock:
+            return cache.remove_expired(self.max_batch_time)
+
+    def _completed(self, removed: int, started_at: float) -> int:
+        self._sweeps += 1
+        self._reclaimed += removed
+        self._last_reclaimed = removed
+        if removed:
+            logger.debug(
+                "Removed %s expired items from the cache in %.2f ms.",
+                removed,
+                (time.perf_counter() - started_at) * 1000,
+            )
+        return removed
+
+    def sweep(self) -> int:
+        """Removes expired items, returning the number of removed items."""
+        started_at = time.perf_counter()
+        removed = 0
+        for cache, lock in self._targets:
+            while True:
+                batch = self._sweep_batch(cache, lock)
+                removed += batch
+                if batch == 0 or self._stop_event.is_set():
+                    break
+        return self._completed(removed, started_at)
+
+    async def sweep_async(self) -> int:
+        """
+        Removes expired items, returning the number of removed items, yielding to
+        the event loop between batches.
+        """
+        started_at = time.perf_counter()
+        removed = 0
+        for cache, lock in self._targets:
+            while True:
+                batch = self._sweep_batch(cache, lock)
+                removed += batch
+                if batch == 0:
+                    break
+                await asyncio.sleep(0)
+        return self._completed(removed, started_at)
+
+    def start(self) -> None:
+        """Starts sweeping the cache in a daemon thread."""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="essentials-caching-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def start_task(self) -> asyncio.Task:
+        """Starts sweeping the cache in an asyncio task of the running loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+        return self._task
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stops sweeping the cache. When sweeping in a thread, waits up to timeout
+        seconds for the thread to complete the current batch.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:  # pragma: no cover
+                logger.exception("Failed to remove expired items from the cache.")
+
+    async def _run_async(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep_async()
+            except Exception:  # pragma: no cover
+                logger.exception("Failed to remove expired items from the cache.")
+
+    def __enter__(self) -> "ExpirationSweeper":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
@@ -0,0 +1,299 @@
+"""
+Cache writing changes to a persistent store in batches, after they are set in
+memory, instead of once for each change.
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+from inspect import iscoroutinefunction
+from typing import Any, Callable, Generic, Iterator, TypeVar
+
+from .background import logger, run_in_background
+from .cache import Cache
+from .stats import FlushStats
+
+T = TypeVar("T")
+
+Sink = Callable[[dict[Any, Any]], Any]
+
+
+class WriteBehindCache(Generic[T]):
+    """
+    Thread-safe cache that writes the items set in it to a sink in batches,
+    after they are set in memory (write-behind). The sink is a function, or a
+    coroutine function, called with a dictionary of the items to write, by key,
+    for example to save them to a database with a single bulk operation.
+
+    Items set again before they are written are coalesced: only their last
+    value is written, so items updated often (counters, sessions) cost one write
+    per flush instead of one write per update. Items are written:
+
+    - when the number of items to write reaches max_pending, in background (on
+      a thread pool for synchronous sinks, in an asyncio task for coroutine
+      sinks, if items are set in the event loop);
+    - every interval seconds, after calling start() (daemon thread) or
+      start_task() (asyncio task), or using the cache as context manager;
+    - when flush() or flush_async() are called;
+    - on shutdown: when the cache is closed with close() or aclose(), or when
+      exiting its context, or when the process exits after start().
+
+    Items evicted from memory before they are written are written anyway.
+    Deleting an item discards its pending write, but does not delete it from
+    the sink. When the sink fails, its items are kept to be written by the next
+    flush, unless they were set again in the meantime.
+
+    Flushes, written items, errors and flush durations are reported by
+    flush_stats().
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        cache: Cache[T] | None = None,
+        *,
+        max_pending: int = 100,
+        interval: float = 1.0,
+    ) -> None:
+        assert max_pending > 0
+        assert interval > 0
+        self._sink = sink
+        self._async_sink = iscoroutinefunction(sink)
+        self._cache: Cache[T] = Cache(500) if cache is None else cache
+        self.max_pending = max_pending
+        self.interval = interval
+        # items to write, by key
+        self._pending: dict[Any, T] = {}
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+        # a single flush at a time, so older values never overwrite newer ones
+        self._flush_lock = threading.Lock()
+        self._async_flush_lock: asyncio.Lock | None = None
+        self._flushes = 0
+        self._flushed_items = 0
+        self._errors = 0
+        self._flush_time = 0.0
+        self._last_flush_time = 0.0
+        self._max_flush_time = 0.0
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def cache(self) -> Cache[T]:
+        return self._cache
+
+    @property
+    def pending(self) -> int:
+        """Returns the number of items waiting to be written."""
+        return len(self._pending)
+
+    def flush_stats(self) -> FlushStats:
+        return FlushStats(
+            self._flushes,
+            self._flushed_items,
+            self._errors,
+            self._flush_time,
+            self._last_flush_time,
+            self._max_flush_time,
+        )
+
+    def __repr__(self) -> str:
+        return f"<WriteBehindCache {len(self)} at {id(self)}>"
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __getitem__(self, key) -> T:
+        with self._lock:
+            return self._cache[key]
+
+    def get(self, key, default=None) -> T:
+        with self._lock:
+            return self._cache.get(key, default)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._cache
+
+    def __iter__(self) -> Iterator[tuple[Any, T]]:
+        with self._lock:
+            return iter(list(self._cache))
+
+    def set(self, key, value: T, **options: Any) -> None:
+        """
+        Sets an item in the cache, with the given options of the set method of
+        the cache (for example ttl, for an ExpiringCache), and schedules its
+        write.
+        """
+        with self._lock:
+            self._cache.set(key, value, **options)
+            self._pending[key] = value
+            schedule = (
+                len(self._pending) >= self.max_pending and not self._flush_scheduled
+            )
+            if schedule:
+                self._flush_scheduled = True
+        if schedule:
+            self._schedule_flush()
+
+    def __setitem__(self, key, value: T) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            del self._cache[key]
+            self._pending.pop(key, None)
+
+    def _schedule_flush(self) -> None:
+        if not self._async_sink:
+            run_in_background(self._flush_quietly)
+            return
+        try:
+            run_in_background(self._flush_quietly_async)
+        except RuntimeError:
+            # no running event loop: items are written by the next flush
+            with self._lock:
+                self._flush_scheduled = False
+
+    def _take(self) -> dict[Any, T]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flush_scheduled = False
+        return batch
+
+    def _restore(self, batch: dict[Any, T]) -> None:
+        with self._lock:
+            self._errors += 1
+            for key, value in batch.items():
+                # values set while flushing are newer
+                self._pending.setdefault(key, value)
+
+    def _flushed(self, count: int, elapsed: float) -> None:
+        self._flushes += 1
+        self._flushed_items += count
+        self._flush_time += elapsed
+        self._last_flush_time = elapsed
+        self._max_flush_time = max(self._max_flush_time, elapsed)
+        logger.debug("Flushed %s items in %.2f ms.", count, elapsed * 1000)
+
+    def flush(self) -> int:
+        """
+        Writes the pending items to a synchronous sink, returning the number of
+        written items. Exceptions raised by the sink are propagated.
+        """
+        assert not self._async_sink, "use flush_async with coroutine sinks"
+        with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            started_at = time.perf_counter()
+            try:
+                self._sink(batch)
+            except BaseException:
+                self._restore(batch)
+                raise
+            self._flushed(len(batch), time.perf_counter() - started_at)
+        return len(batch)
+
+    async def flush_async(self) -> int:
+        """
+        Writes the pending items to the sink, returning the number of written
+        items. Exceptions raised by the sink are propagated.
+        """
+        if not self._async_sink:
+            return self.flush()
+        if self._async_flush_lock is None:
+            self._async_flush_lock = asyncio.Lock()
+        async with self._async_flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            started_at = time.perf_counter()
+            try:
+                await self._sink(batch)
+            except BaseException:
+                self._restore(batch)
+                raise
+            self._flushed(len(batch), time.perf_counter() - started_at)
+        return len(batch)
+
+    def _flush_quietly(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to write items of the cache to the sink.")
+
+    async def _flush_quietly_async(self) -> None:
+        try:
+            await self.flush_async()
+        except Exception:
+            logger.exception("Failed to write items of the cache to the sink.")
+
+    def start(self) -> None:
+        """
+        Starts writing pending items every interval seconds in a daemon thread,
+        and when the process exits.
+        """
+        assert not self._async_sink, "use start_task with coroutine sinks"
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="essentials-caching-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def start_task(self) -> asyncio.Task:
+        """
+        Starts writing pending items every interval seconds in an asyncio task
+        of the running loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run_async())
+        return self._task
+
+    def _stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            atexit.unregister(self.close)
+            self._thread.join()
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def close(self) -> None:
+        """Stops writing items periodically, and writes the pending items."""
+        self._stop()
+        self.flush()
+
+    async def aclose(self) -> None:
+        """Stops writing items periodically, and writes the pending items."""
+        self._stop()
+        await self.flush_async()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self._flush_quietly()
+
+    async def _run_async(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_quietly_async()
+
+    def __enter__(self) -> "WriteBehindCache[T]":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "WriteBehindCache[T]":
+        self.start_task()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.aclose()
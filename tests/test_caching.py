@@ -1,8 +1,22 @@
+import asyncio
+import math
+import threading
 import time
+from collections import OrderedDict
 
 import pytest
 
-from essentials.caching import Cache, ExpiringCache, lazy
+from essentials.caching import (
+    Cache,
+    CachedItem,
+    CompactExpiringCache,
+    ExpiringCache,
+    lazy,
+    lazy_many,
+)
+from essentials.exceptions import InvalidOperation
+
+from . import CrashTest
 
 
 @pytest.mark.parametrize("cache", [Cache(), ExpiringCache(lambda _: False)])
@@ -243,3 +257,1144 @@ def test_lazy_method_cache_depends_on_input_arguments_args():
     assert a is not b
     assert get_object("lorem", "ipsum") is a
     assert get_object("lorem", "ipsum", "dolor") is b
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_method():
+    i = 0
+
+    @lazy(0.05)
+    async def increase() -> int:
+        nonlocal i
+        i += 1
+        return i
+
+    for _ in range(10):
+        assert await increase() == 1
+
+    await asyncio.sleep(0.1)
+
+    for _ in range(10):
+        assert await increase() == 2
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_method_coalesces_concurrent_misses():
+    calls = 0
+
+    @lazy(100, {})
+    async def get_object(key):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return object()
+
+    results = await asyncio.gather(*[get_object("one") for _ in range(20)])
+
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert await get_object("one") is results[0]
+
+    other = await get_object("two")
+    assert calls == 2
+    assert other is not results[0]
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_method_exceptions_are_not_cached():
+    calls = 0
+
+    @lazy(100, {})
+    async def crashing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise CrashTest()
+
+    results = await asyncio.gather(
+        *[crashing() for _ in range(5)], return_exceptions=True
+    )
+
+    assert calls == 1
+    assert all(isinstance(result, CrashTest) for result in results)
+    assert crashing.cache == {}
+
+    with pytest.raises(CrashTest):
+        await crashing()
+
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_method_caller_cancellation_does_not_cancel_call():
+    @lazy(100, {})
+    async def get_value():
+        await asyncio.sleep(0.05)
+        return 10
+
+    first = asyncio.ensure_future(get_value())
+    second = asyncio.ensure_future(get_value())
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == 10
+    assert first.cancelled()
+
+
+def test_lazy_method_lock_calls_function_once_under_contention():
+    calls = 0
+    calls_lock = threading.Lock()
+    barrier = threading.Barrier(20)
+
+    @lazy(100, {}, lock=True)
+    def get_object():
+        nonlocal calls
+        with calls_lock:
+            calls += 1
+        time.sleep(0.05)
+        return object()
+
+    results = []
+
+    def work():
+        barrier.wait()
+        results.append(get_object())
+
+    threads = [threading.Thread(target=work) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == 1
+    assert len(results) == 20
+    assert all(result is results[0] for result in results)
+
+
+def test_lazy_method_lock_refreshes_expired_value_once():
+    calls = 0
+    barrier = threading.Barrier(10)
+
+    @lazy(0.05, {}, lock=True)
+    def increase():
+        nonlocal calls
+        calls += 1
+        time.sleep(0.02)
+        return calls
+
+    assert increase() == 1
+    time.sleep(0.1)
+
+    results = []
+
+    def work():
+        barrier.wait()
+        results.append(increase())
+
+    threads = [threading.Thread(target=work) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == 2
+    assert results == [2] * 10
+
+
+def test_lazy_method_lock_wait_timeout_returns_previous_value():
+    values = iter([1, 2])
+    started = threading.Event()
+
+    @lazy(0.1, {}, lock=True, wait_timeout=0.01)
+    def get_value():
+        value = next(values)
+        if value == 2:
+            started.set()
+            time.sleep(0.05)
+        return value
+
+    assert get_value() == 1
+    time.sleep(0.15)
+
+    refresher = threading.Thread(target=get_value)
+    refresher.start()
+    started.wait()
+
+    assert get_value() == 1
+
+    refresher.join()
+    assert get_value() == 2
+
+
+def test_lazy_method_stale_ttl_returns_stale_value_and_refreshes():
+    calls = 0
+    refreshed = threading.Event()
+
+    @lazy(0.05, {}, stale_ttl=10)
+    def increase():
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            refreshed.set()
+        return calls
+
+    assert increase() == 1
+    time.sleep(0.1)
+
+    # the expired value is returned immediately, while refreshing in background
+    assert increase() == 1
+    assert refreshed.wait(1)
+    time.sleep(0.01)
+    assert increase() == 2
+    assert calls == 2
+
+
+def test_lazy_method_stale_ttl_expired_grace_window():
+    calls = 0
+
+    @lazy(0.05, {}, stale_ttl=0.05)
+    def increase():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert increase() == 1
+    time.sleep(0.15)
+
+    assert increase() == 2
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_method_stale_ttl():
+    calls = 0
+
+    @lazy(0.05, {}, stale_ttl=10)
+    async def increase():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    assert await increase() == 1
+    await asyncio.sleep(0.1)
+
+    assert await increase() == 1
+    assert await increase() == 1
+    await asyncio.sleep(0.05)
+
+    assert await increase() == 2
+    assert calls == 2
+
+
+@pytest.mark.parametrize("lock", [False, True])
+def test_lazy_refresh_ahead_refreshes_hot_keys(lock):
+    calls = 0
+    refreshed = threading.Event()
+
+    @lazy(0.2, {}, refresh_ahead=0.5, lock=lock)
+    def increase():
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            refreshed.set()
+        return calls
+
+    assert increase() == 1
+    time.sleep(0.12)
+
+    # a second read in the last half of the lifetime of the value refreshes it
+    assert increase() == 1
+    assert increase() == 1
+    assert refreshed.wait(1)
+    time.sleep(0.01)
+    assert increase() == 2
+    assert increase() == 2
+    assert calls == 2
+
+
+def test_lazy_refresh_ahead_ignores_cold_keys():
+    calls = 0
+
+    @lazy(0.2, {}, refresh_ahead=0.5)
+    def increase():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert increase() == 1
+    time.sleep(0.12)
+
+    assert increase() == 1
+    time.sleep(0.02)
+    assert calls == 1
+    time.sleep(0.1)
+    assert increase() == 2
+
+
+def test_lazy_refresh_ahead_must_be_a_fraction():
+    with pytest.raises(AssertionError):
+        lazy(1, refresh_ahead=1)
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_refresh_ahead():
+    calls = 0
+
+    @lazy(0.2, {}, refresh_ahead=0.5)
+    async def increase():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    assert await increase() == 1
+    await asyncio.sleep(0.12)
+
+    assert await increase() == 1
+    assert await increase() == 1
+    await asyncio.sleep(0.03)
+
+    assert await increase() == 2
+    assert calls == 2
+
+
+def test_expiring_cache_stale_ttl_requires_refresh():
+    with pytest.raises(AssertionError):
+        ExpiringCache(lambda _: True, stale_ttl=1)
+
+
+def test_expiring_cache_stale_ttl():
+    refreshed = threading.Event()
+
+    def refresh(key):
+        refreshed.set()
+        return key.upper()
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh)
+    cache["foo"] = "Foo"
+    time.sleep(0.1)
+
+    assert cache["foo"] == "Foo"
+    assert refreshed.wait(1)
+    time.sleep(0.01)
+    assert cache["foo"] == "FOO"
+
+
+def test_expiring_cache_stale_ttl_window_elapsed():
+    def refresh(key):
+        raise CrashTest()
+
+    cache = ExpiringCache(lambda item: item.value > 1, stale_ttl=0.05, refresh=refresh)
+    cache["a"] = 2
+
+    assert cache["a"] == 2
+    time.sleep(0.1)
+
+    # the refresh failed and the grace window elapsed
+    with pytest.raises(KeyError):
+        cache["a"]
+    assert "a" not in cache
+
+
+@pytest.mark.asyncio
+async def test_expiring_cache_stale_ttl_async_refresh():
+    async def refresh(key):
+        await asyncio.sleep(0.01)
+        return key * 2
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh)
+    cache[2] = 0
+    await asyncio.sleep(0.1)
+
+    assert cache[2] == 0
+    await asyncio.sleep(0.05)
+    assert cache[2] == 4
+
+
+def test_expiring_cache_stale_ttl_async_refresh_outside_event_loop():
+    async def refresh(key):
+        return key * 2
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh)
+    cache[2] = 0
+    time.sleep(0.1)
+
+    # the refresh cannot be scheduled, the item is treated as expired
+    assert 2 not in cache
+    assert cache.get(2) is None
+    assert cache._refreshing == {}
+
+    async def read_stale():
+        cache[2] = 0
+        await asyncio.sleep(0.1)
+        assert cache[2] == 0
+        await asyncio.sleep(0.01)
+        return cache[2]
+
+    assert asyncio.run(read_stale()) == 4
+
+
+def test_expiring_cache_stale_ttl_refresh_holds_the_lock():
+    lock = threading.Lock()
+    refreshed = threading.Event()
+
+    def refresh(key):
+        refreshed.set()
+        return key.upper()
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh, lock=lock)
+    cache["foo"] = "Foo"
+    time.sleep(0.1)
+
+    with lock:
+        assert cache["foo"] == "Foo"
+        assert refreshed.wait(1)
+        time.sleep(0.02)
+        # the refreshed value waits for the lock
+        assert cache["foo"] == "Foo"
+    time.sleep(0.02)
+    with lock:
+        assert cache["foo"] == "FOO"
+
+
+@pytest.mark.parametrize("change", ["set", "delete", "invalidate_tag", "clear"])
+def test_expiring_cache_refresh_does_not_overwrite_changed_items(change):
+    started = threading.Event()
+    release = threading.Event()
+
+    def refresh(key):
+        started.set()
+        release.wait(1)
+        return "refreshed"
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh)
+    cache.set("a", "value", tags=["tag"])
+    time.sleep(0.1)
+
+    assert cache["a"] == "value"
+    assert started.wait(1)
+    if change == "set":
+        cache.set("a", "new value", ttl=10)
+    elif change == "delete":
+        del cache["a"]
+    elif change == "invalidate_tag":
+        cache.invalidate_tag("tag")
+    else:
+        cache.clear()
+    release.set()
+    time.sleep(0.05)
+
+    assert cache.get("a") == ("new value" if change == "set" else None)
+    assert cache._refreshing == {}
+
+
+def test_expiring_cache_max_age_purges_by_deadline():
+    cache = ExpiringCache.with_max_age(0.05, max_size=10)
+
+    assert cache.max_age == 0.05
+    assert cache.expiration_policy is None
+
+    for i in range(5):
+        cache[i] = i
+    time.sleep(0.1)
+    for i in range(5, 10):
+        cache[i] = i
+
+    # the cache is full: adding an item removes only the expired ones
+    cache[10] = 10
+
+    assert len(cache._bag) == 6
+    assert sorted(cache.keys()) == list(range(5, 11))
+
+
+def test_expiring_cache_max_age_updated_items_keep_latest_deadline():
+    cache = ExpiringCache.with_max_age(0.1, max_size=3)
+    cache["a"] = 1
+    cache["b"] = 2
+    time.sleep(0.06)
+    cache["a"] = 3
+    time.sleep(0.06)
+
+    cache["c"] = 4
+    cache["d"] = 5
+
+    assert "b" not in cache
+    assert cache["a"] == 3
+
+
+def test_expiring_cache_max_age_deadlines_heap_is_bounded():
+    cache = ExpiringCache.with_max_age(100, max_size=10)
+
+    for i in range(10_000):
+        cache[i % 20] = i
+
+    assert len(cache) == 10
+    assert len(cache._deadlines) <= 2 * 10 + 64 + 1
+
+
+def test_expiring_cache_max_age_and_policy():
+    cache = ExpiringCache(lambda item: item.value > 5, max_size=10, max_age=0.05)
+
+    for i in range(10):
+        cache[i] = i
+
+    assert 6 not in cache
+    assert 1 in cache
+
+    time.sleep(0.1)
+    assert 1 not in cache
+
+
+def test_cached_item_ttl():
+    item = CachedItem("foo", ttl=10)
+
+    assert item.ttl == 10
+    assert item.expires > time.monotonic() + 9
+
+    item.ttl = None
+    assert item.expires == math.inf
+
+    assert CachedItem("foo").expires == math.inf
+
+
+def test_expiring_cache_set_with_ttl():
+    cache = ExpiringCache()
+
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2, ttl=10)
+    cache.set("forever", 3)
+
+    assert cache["short"] == 1
+    time.sleep(0.1)
+
+    assert "short" not in cache
+    assert cache["long"] == 2
+    assert cache["forever"] == 3
+
+
+def test_expiring_cache_set_ttl_overrides_max_age():
+    cache = ExpiringCache.with_max_age(10, max_size=3)
+
+    cache["a"] = 1
+    cache.set("b", 2, ttl=0.05)
+    cache["c"] = 3
+    time.sleep(0.1)
+
+    # when full, items past their own deadline are removed first
+    cache["d"] = 4
+
+    assert "b" not in cache
+    assert sorted(cache.keys()) == ["a", "c", "d"]
+
+
+def test_expiring_cache_update_with_shorter_ttl():
+    cache = ExpiringCache(max_size=2)
+
+    cache.set("a", 1, ttl=10)
+    cache.set("a", 1, ttl=0.05)
+    cache.set("b", 2)
+    time.sleep(0.1)
+
+    cache.set("c", 3)
+
+    assert sorted(cache.keys()) == ["b", "c"]
+
+
+def test_expiring_cache_sliding_expiration():
+    cache = ExpiringCache.with_max_age(0.1, sliding=True)
+    cache["foo"] = "Foo"
+
+    assert cache.sliding is True
+
+    for _ in range(4):
+        time.sleep(0.05)
+        assert cache["foo"] == "Foo"
+
+    time.sleep(0.15)
+    assert "foo" not in cache
+
+
+def test_expiring_cache_sliding_expiration_reschedules_deadlines():
+    cache = ExpiringCache.with_max_age(0.1, max_size=2, sliding=True)
+    cache["a"] = 1
+    cache["b"] = 2
+    time.sleep(0.06)
+    assert cache["a"] == 1
+    time.sleep(0.06)
+
+    cache["c"] = 3
+
+    assert sorted(cache.keys()) == ["a", "c"]
+
+
+def test_expiring_cache_is_not_affected_by_system_time_changes(monkeypatch):
+    cache = ExpiringCache.with_max_age(10)
+    cache["foo"] = "Foo"
+
+    wall_clock = time.time() + 3600
+    monkeypatch.setattr(time, "time", lambda: wall_clock)
+
+    assert cache["foo"] == "Foo"
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_max_weight_default_weigher(cache_type):
+    cache = cache_type(max_size=100, max_weight=10)
+
+    cache["a"] = "1234"
+    cache["b"] = b"1234"
+    assert cache.weight == 8
+
+    cache["c"] = "123"
+    assert "a" not in cache
+    assert cache.weight == 7
+
+    cache["d"] = object()
+    assert cache.weight == 8
+    assert cache.max_weight == 10
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_max_weight_custom_weigher(cache_type):
+    cache = cache_type(max_weight=100, weigher=lambda key, value: value)
+
+    cache[1] = 40
+    cache[2] = 40
+    assert cache.weight == 80
+
+    # updating an item updates the total weight, evicting the LRU items
+    cache[1] = 70
+    assert 2 not in cache
+    assert cache.weight == 70
+
+    del cache[1]
+    assert cache.weight == 0
+
+    cache[3] = 30
+    cache.clear()
+    assert cache.weight == 0
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_max_weight_item_heavier_than_max_weight(cache_type):
+    cache = cache_type(max_weight=10)
+    cache["a"] = "12"
+    cache["b"] = "x" * 20
+
+    assert len(cache) == 0
+    assert cache.weight == 0
+
+
+def test_cache_weight_without_max_weight_is_count():
+    cache = Cache()
+    cache["a"] = "1234"
+
+    assert cache.max_weight is None
+    assert cache.weight == 1
+
+    with pytest.raises(InvalidOperation):
+        cache.max_weight = 10
+
+
+def test_cache_max_weight_setter():
+    cache = Cache(max_weight=10)
+    cache.max_weight = 20
+
+    assert cache.max_weight == 20
+
+
+def test_expiring_cache_max_weight_removes_expired_items_first():
+    cache = ExpiringCache(max_weight=10)
+    cache["a"] = "1234"
+    cache.set("b", "1234", ttl=0.05)
+    time.sleep(0.1)
+
+    cache["c"] = "1234"
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.weight == 8
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_get_many(cache_type):
+    cache = cache_type(max_size=3)
+    cache.set_many({"a": 1, "b": 2, "c": 3})
+
+    assert cache.get_many(["a", "c", "x"]) == {"a": 1, "c": 3}
+
+    # accessed items are moved to the end
+    cache["d"] = 4
+    assert "b" not in cache
+    assert list(cache.keys()) == ["a", "c", "d"]
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_set_many_evicts_once(cache_type, monkeypatch):
+    cache = cache_type(max_size=3)
+    calls = []
+    check_size = cache._check_size
+
+    def counting_check_size():
+        calls.append(1)
+        check_size()
+
+    monkeypatch.setattr(cache, "_check_size", counting_check_size)
+    cache.set_many((i, i) for i in range(5))
+
+    assert len(calls) == 1
+    assert list(cache.keys()) == [2, 3, 4]
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_cache_delete_many(cache_type):
+    cache = cache_type(max_weight=10)
+    cache.set_many([("a", "12345"), ("b", "123"), ("c", "1")])
+
+    assert cache.delete_many(["a", "c", "x"]) == 2
+    assert list(cache.keys()) == ["b"]
+    assert cache.weight == 3
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache, CompactExpiringCache])
+def test_cache_get_or_create(cache_type):
+    cache = cache_type(track_stats=True)
+    calls = []
+
+    def create():
+        calls.append(1)
+        return None
+
+    assert cache.get_or_create("a", create) is None
+    assert cache.get_or_create("a", create) is None
+    assert calls == [1]
+    assert cache.get("b") is None
+
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 2
+
+
+class _RacingBag(OrderedDict):
+    """Bag whose items are removed by another thread right after being read."""
+
+    def move_to_end(self, key, last=True):
+        del self[key]
+        super().move_to_end(key, last)
+
+
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache, CompactExpiringCache])
+def test_cache_get_treats_items_removed_concurrently_as_missing(cache_type):
+    cache = cache_type(track_stats=True)
+    cache["a"] = 1
+    cache._bag = _RacingBag(cache._bag)
+
+    assert cache.get("a", 0) == 0
+    assert "a" not in cache
+    assert cache.stats().misses == 1
+
+
+def test_lazy_with_items_removed_concurrently():
+    cache = Cache()
+    calls = []
+
+    @lazy(10, cache)
+    def get_value(value):
+        calls.append(value)
+        return value
+
+    assert get_value(1) == 1
+    cache._bag = _RacingBag(cache._bag)
+
+    assert get_value(1) == 1
+    assert calls == [1, 1]
+
+
+def test_cache_get_or_create_options():
+    cache = ExpiringCache()
+    cache.get_or_create("a", lambda: 1, ttl=0.05, tags=["numbers"])
+
+    assert cache._bag["a"].ttl == 0.05
+    assert cache.invalidate_tag("numbers") == 1
+
+
+def test_cache_get_or_create_does_not_cache_errors():
+    cache = Cache()
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        cache.get_or_create("a", fail)
+    assert "a" not in cache
+    assert len(cache._key_locks) == 0
+
+
+def test_cache_get_or_create_calls_factory_once_by_key():
+    cache = Cache()
+    calls = 0
+    started = threading.Event()
+
+    def create():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.05)
+        return calls
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_create("a", create))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == 1
+    assert results == [1, 1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_cache_aget_or_create():
+    cache = Cache()
+    calls = 0
+
+    async def create():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(
+        *[cache.aget_or_create("a", create) for _ in range(4)]
+    )
+
+    assert results == [1, 1, 1, 1]
+    assert await cache.aget_or_create("a", create) == 1
+    assert calls == 1
+    assert cache._creating == {}
+
+
+@pytest.mark.asyncio
+async def test_cache_aget_or_create_errors():
+    cache = ExpiringCache()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    results = await asyncio.gather(
+        cache.aget_or_create("a", fail),
+        cache.aget_or_create("a", fail),
+        return_exceptions=True,
+    )
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert calls == 1
+    assert "a" not in cache
+
+
+def test_expiring_cache_many_with_ttl():
+    cache = ExpiringCache(track_stats=True)
+    cache.set_many({"a": 1, "b": 2}, ttl=0.05)
+    cache.set("c", 3)
+    time.sleep(0.1)
+
+    assert cache.get_many(["a", "b", "c", "d"]) == {"c": 3}
+    assert len(cache) == 1
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 3
+    assert stats.expirations == 2
+
+
+def test_lazy_many():
+    calls = []
+
+    @lazy_many(10)
+    def get_values(keys):
+        calls.append(keys)
+        return {key: key * 2 for key in keys if key != 3}
+
+    assert get_values([1, 2, 3, 2]) == {1: 2, 2: 4}
+    assert get_values([4, 2, 1]) == {4: 8, 2: 4, 1: 2}
+    assert get_values([1, 4]) == {1: 2, 4: 8}
+
+    assert calls == [[1, 2, 3], [4]]
+
+
+def test_lazy_many_shares_cache_with_lazy():
+    cache = Cache()
+
+    @lazy(10, cache)
+    def get_value(key):
+        return f"single {key}"
+
+    @lazy_many(10, cache)
+    def get_values(keys):
+        return {key: f"many {key}" for key in keys}
+
+    assert get_value(1) == "single 1"
+    assert get_values([1, 2]) == {1: "single 1", 2: "many 2"}
+    assert get_value(2) == "many 2"
+
+
+def test_lazy_many_shares_cache_with_lazy_caching_errors():
+    cache = Cache()
+    calls = []
+
+    @lazy(10, cache, cache_errors=ConnectionError, error_ttl=0.05)
+    def get_value(key):
+        raise ConnectionError()
+
+    @lazy_many(10, cache, error_ttl=0.05)
+    def get_values(keys):
+        calls.append(keys)
+        return {key: key * 10 for key in keys}
+
+    with pytest.raises(ConnectionError):
+        get_value(1)
+    with pytest.raises(ConnectionError):
+        get_values([1, 2])
+
+    time.sleep(0.1)
+    assert get_values([1, 2]) == {1: 10, 2: 20}
+    assert calls == [[1, 2]]
+
+
+def test_lazy_many_expiration():
+    calls = []
+
+    @lazy_many(0.05, {})
+    def get_values(keys):
+        calls.append(keys)
+        return {key: key for key in keys}
+
+    get_values([1, 2])
+    time.sleep(0.1)
+    get_values([1, 2])
+
+    assert calls == [[1, 2], [1, 2]]
+
+
+@pytest.mark.asyncio
+async def test_lazy_many_async():
+    calls = []
+
+    @lazy_many(10)
+    async def get_values(keys):
+        await asyncio.sleep(0)
+        calls.append(keys)
+        return {key: -key for key in keys}
+
+    assert await get_values([1, 2]) == {1: -1, 2: -2}
+    assert await get_values([2, 3]) == {2: -2, 3: -3}
+    assert calls == [[1, 2], [3]]
+
+
+def test_cache_dump_and_load(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    cache = Cache(max_size=3)
+    for key in "abc":
+        cache[key] = key.upper()
+    cache["a"]
+    cache.dump(path)
+
+    restored = Cache(max_size=3)
+    assert restored.load(path) == 3
+    assert list(restored) == [("b", "B"), ("c", "C"), ("a", "A")]
+
+    smaller = Cache(max_size=2)
+    assert smaller.load(path) == 2
+    assert list(smaller.keys()) == ["c", "a"]
+
+
+def test_cache_load_invalid_file(tmp_path):
+    path = tmp_path / "cache.snapshot"
+    path.write_bytes(b"nope")
+
+    with pytest.raises(ValueError):
+        Cache().load(str(path))
+
+
+def test_expiring_cache_dump_and_load(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    cache = ExpiringCache(sliding=True)
+    cache.set("short", 1, ttl=0.05)
+    cache.set("long", 2, ttl=10)
+    cache.set("forever", 3)
+    cache.set("expired", 4, ttl=0)
+    cache.dump(path)
+    time.sleep(0.1)
+
+    restored = ExpiringCache()
+    assert restored.load(path) == 2
+    assert list(restored.keys()) == ["long", "forever"]
+
+    item = restored._bag["long"]
+    assert item.ttl == 10
+    assert item.expires - time.monotonic() < 9.9
+    assert restored._bag["forever"].expires == math.inf
+
+
+def test_expiring_cache_load_cache_snapshot(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    cache = Cache()
+    cache["a"] = 1
+    cache.dump(path)
+
+    restored = ExpiringCache.with_max_age(10)
+    assert restored.load(path) == 1
+    assert restored["a"] == 1
+    assert restored._bag["a"].ttl == 10
+
+
+def test_lazy_cache_warm_start(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    calls = []
+
+    def get_value(value):
+        calls.append(value)
+        return value * 2
+
+    first = lazy(10)(get_value)
+    first(1)
+    first(2)
+    first.cache.dump(path)
+
+    second = lazy(10)(get_value)
+    second.cache.load(path)
+
+    assert second(1) == 2
+    assert second(2) == 4
+    assert calls == [1, 2]
+
+
+def test_lazy_cache_errors():
+    calls = []
+
+    @lazy(10, cache_errors=ConnectionError, error_ttl=0.05)
+    def get_value(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise ConnectionError("Service unavailable")
+        return value
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            get_value(1)
+    assert calls == [1]
+
+    time.sleep(0.1)
+    with pytest.raises(ConnectionError):
+        get_value(1)
+    with pytest.raises(ConnectionError):
+        get_value(1)
+    assert calls == [1, 1]
+
+    time.sleep(0.1)
+    assert get_value(1) == 1
+    assert get_value(1) == 1
+    assert calls == [1, 1, 1]
+
+
+def test_lazy_cache_errors_by_type():
+    calls = []
+
+    @lazy(10, cache_errors=(ConnectionError, TimeoutError))
+    def get_value(value):
+        calls.append(value)
+        raise CrashTest()
+
+    for _ in range(2):
+        with pytest.raises(CrashTest):
+            get_value(1)
+    assert calls == [1, 1]
+
+
+def test_lazy_cached_error_traceback_does_not_grow():
+    @lazy(10, cache_errors=ValueError)
+    def get_value():
+        raise ValueError()
+
+    lengths = []
+    for _ in range(3):
+        try:
+            get_value()
+        except ValueError as error:
+            traceback = error.__traceback__
+            length = 0
+            while traceback is not None:
+                length += 1
+                traceback = traceback.tb_next
+            lengths.append(length)
+
+    assert lengths[1] == lengths[2]
+
+
+def test_lazy_cache_errors_with_lock():
+    calls = []
+
+    @lazy(10, cache_errors=ConnectionError, lock=True)
+    def get_value():
+        calls.append(1)
+        time.sleep(0.05)
+        raise ConnectionError()
+
+    def target():
+        with pytest.raises(ConnectionError):
+            get_value()
+
+    threads = [threading.Thread(target=target) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+
+
+def test_lazy_cache_errors_with_lock_timeout_ignores_expired_errors():
+    calls = []
+
+    @lazy(10, cache_errors=ConnectionError, error_ttl=0.05, lock=True, wait_timeout=0)
+    def get_value():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError()
+        time.sleep(0.05)
+        return len(calls)
+
+    with pytest.raises(ConnectionError):
+        get_value()
+    time.sleep(0.1)
+
+    refresher = threading.Thread(target=get_value)
+    refresher.start()
+    time.sleep(0.01)
+    # the expired error is not raised to the thread that stops waiting
+    assert get_value() == 3
+    refresher.join()
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_cache_errors():
+    calls = []
+
+    @lazy(10, cache_errors=ConnectionError, error_ttl=1)
+    async def get_value():
+        calls.append(1)
+        await asyncio.sleep(0)
+        raise ConnectionError()
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            await get_value()
+    assert calls == [1]
@@ -0,0 +1,138 @@
+import gc
+import time
+import tracemalloc
+
+import pytest
+
+from essentials.caching import CompactExpiringCache, ExpiringCache
+
+
+def test_compact_cache_set_get_delete():
+    cache: CompactExpiringCache = CompactExpiringCache.with_max_age(10)
+    cache["a"] = 1
+    cache.set("b", 2, ttl=20)
+    cache[None] = 3
+
+    assert cache["a"] == 1
+    assert cache["b"] == 2
+    assert cache[None] == 3
+    assert len(cache) == 3
+
+    del cache["a"]
+    assert "a" not in cache
+    with pytest.raises(KeyError):
+        cache["a"]
+    assert list(cache) == [("b", 2), (None, 3)]
+
+
+def test_compact_cache_reuses_slots():
+    cache: CompactExpiringCache = CompactExpiringCache(max_size=3)
+    for key in range(100):
+        cache[key] = key
+
+    assert list(cache) == [(97, 97), (98, 98), (99, 99)]
+    assert len(cache._values) == 4
+
+    cache.clear()
+    assert len(cache) == 0
+    assert len(cache._values) == 0
+
+
+def test_compact_cache_items_expire():
+    cache: CompactExpiringCache = CompactExpiringCache.with_max_age(0.01)
+    cache["a"] = 1
+    cache.set("b", 2, ttl=10)
+    cache.set("c", 3, ttl=0.01)
+
+    time.sleep(0.02)
+
+    assert "a" not in cache
+    assert cache.get("c") is None
+    assert cache["b"] == 2
+    assert cache.remove_expired() == 0
+    assert len(cache) == 1
+
+
+def test_compact_cache_remove_expired_ignores_reused_slots():
+    cache: CompactExpiringCache = CompactExpiringCache(max_size=10)
+    cache.set("a", 1, ttl=0.01)
+    del cache["a"]
+    # the slot of "a" is reused by an item that expires later
+    cache.set("b", 2, ttl=10)
+
+    time.sleep(0.02)
+
+    assert cache.remove_expired() == 0
+    assert cache["b"] == 2
+
+
+def test_compact_cache_sliding_expiration():
+    cache: CompactExpiringCache = CompactExpiringCache.with_max_age(0.05, sliding=True)
+    cache["a"] = 1
+
+    for _ in range(4):
+        time.sleep(0.02)
+        assert cache["a"] == 1
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+
+
+def test_compact_cache_expiration_policy():
+    cache: CompactExpiringCache = CompactExpiringCache(
+        lambda item: item.value > 10, max_size=10
+    )
+    cache.set_many({"a": 1, "b": 20, "c": 3})
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert len(cache) == 2
+
+
+def test_compact_cache_on_evict():
+    evicted = []
+    cache: CompactExpiringCache = CompactExpiringCache(
+        max_size=2, on_evict=lambda key, value: evicted.append((key, value))
+    )
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"]
+    cache["c"] = 3
+
+    assert evicted == [("b", 2)]
+    assert list(cache.keys()) == ["a", "c"]
+
+
+def test_compact_cache_snapshots_are_compatible(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    cache: CompactExpiringCache = CompactExpiringCache.with_max_age(10)
+    cache["a"] = 1
+    cache.set("b", 2, ttl=None)
+    cache.dump(path)
+
+    restored: ExpiringCache = ExpiringCache.with_max_age(10)
+    assert restored.load(path) == 2
+    assert restored._bag["a"].ttl == 10
+    restored.dump(path)
+
+    compact: CompactExpiringCache = CompactExpiringCache.with_max_age(10)
+    assert compact.load(path) == 2
+    assert list(compact) == [("a", 1), ("b", 2)]
+
+
+def _allocated(factory) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        cache = factory()
+        for key in range(10_000):
+            cache[key] = key
+        return tracemalloc.get_traced_memory()[0], cache
+    finally:
+        tracemalloc.stop()
+
+
+def test_compact_cache_uses_less_memory():
+    compact_size, _ = _allocated(lambda: CompactExpiringCache.with_max_age(60, 10_000))
+    size, _ = _allocated(lambda: ExpiringCache.with_max_age(60, 10_000))
+
+    assert compact_size < size * 0.8
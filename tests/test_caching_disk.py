@@ -0,0 +1,241 @@
+import os
+
+import pytest
+
+from essentials.caching import Cache, DiskCache, ExpiringCache, TieredCache, lazy
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.bin")
+
+
+def test_disk_cache_set_get(cache_path):
+    with DiskCache(cache_path) as cache:
+        cache["a"] = {"value": 1}
+        cache[("b", 2)] = [1, 2, 3]
+
+        assert cache["a"] == {"value": 1}
+        assert cache[("b", 2)] == [1, 2, 3]
+        assert cache.get("c") is None
+        assert len(cache) == 2
+
+        with pytest.raises(KeyError):
+            cache["c"]
+
+
+def test_disk_cache_delete_and_overwrite(cache_path):
+    with DiskCache(cache_path) as cache:
+        cache["a"] = 1
+        cache["a"] = 2
+        cache["b"] = 3
+        del cache["b"]
+
+        assert cache["a"] == 2
+        assert "b" not in cache
+        assert list(cache.keys()) == ["a"]
+
+        with pytest.raises(KeyError):
+            del cache["b"]
+
+
+def test_disk_cache_reopen(cache_path):
+    with DiskCache(cache_path) as cache:
+        for i in range(10):
+            cache[i] = str(i)
+        del cache[3]
+
+    with DiskCache(cache_path) as cache:
+        # records appended after the index was saved are read from the file
+        cache[10] = "10"
+        del cache[4]
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {i: str(i) for i in range(11) if i not in (3, 4)}
+
+
+def test_disk_cache_reopen_without_index(cache_path):
+    with DiskCache(cache_path) as cache:
+        cache["a"] = 1
+        cache["b"] = 2
+        del cache["a"]
+    os.remove(cache_path + ".index")
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {"b": 2}
+
+
+def test_disk_cache_ignores_incomplete_record(cache_path):
+    with DiskCache(cache_path) as cache:
+        cache["a"] = 1
+        cache["b"] = "x" * 100
+    with open(cache_path, "r+b") as cache_file:
+        cache_file.truncate(os.path.getsize(cache_path) - 10)
+    os.remove(cache_path + ".index")
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {"a": 1}
+        cache["c"] = 3
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {"a": 1, "c": 3}
+
+
+def test_disk_cache_compaction(cache_path):
+    with DiskCache(cache_path, max_file_size=2000) as cache:
+        for i in range(100):
+            cache[i] = "x" * 50
+            # item 0 is used often
+            cache[0]
+
+        assert cache.file_size <= 2000
+        assert cache.live_size <= cache.file_size
+        assert 0 in cache
+        assert 99 in cache
+        assert 1 not in cache
+
+
+def test_disk_cache_compaction_interrupted_before_saving_the_index(
+    cache_path, monkeypatch
+):
+    cache = DiskCache(cache_path, max_file_size=100_000)
+    for i in range(50):
+        cache[i] = str(i)
+    cache.close()
+
+    cache = DiskCache(cache_path, max_file_size=100_000)
+    for i in range(50):
+        cache[i] = str(i) * 10
+
+    def crash():
+        raise OSError("crash")
+
+    monkeypatch.setattr(cache, "_save_index", crash)
+    with pytest.raises(OSError):
+        cache.compact()
+    cache._file.close()
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {i: str(i) * 10 for i in range(50)}
+
+
+def test_disk_cache_ignores_the_index_of_another_file(cache_path):
+    with DiskCache(cache_path) as cache:
+        for i in range(10):
+            cache[i] = str(i)
+    with open(cache_path + ".index", "rb") as index_file:
+        previous_index = index_file.read()
+
+    with DiskCache(cache_path) as cache:
+        del cache[0]
+        cache.compact()
+        for i in range(10, 30):
+            cache[i] = str(i)
+    with open(cache_path + ".index", "wb") as index_file:
+        index_file.write(previous_index)
+
+    with DiskCache(cache_path) as cache:
+        assert dict(cache) == {i: str(i) for i in range(1, 30)}
+
+
+def test_disk_cache_rejects_other_files(cache_path):
+    with open(cache_path, "wb") as other_file:
+        other_file.write(b"not a disk cache file")
+
+    with pytest.raises(ValueError):
+        DiskCache(cache_path)
+
+
+def test_disk_cache_clear(cache_path):
+    with DiskCache(cache_path) as cache:
+        cache["a"] = 1
+        cache.clear()
+        cache["b"] = 2
+
+        assert cache.file_size > 0
+        assert dict(cache) == {"b": 2}
+
+
+def test_cache_on_evict():
+    evicted = []
+    cache = Cache(2, on_evict=lambda key, value: evicted.append((key, value)))
+    cache["a"] = 1
+    cache["b"] = 2
+    del cache["b"]
+    cache["c"] = 3
+    cache["d"] = 4
+
+    assert evicted == [("a", 1)]
+
+
+def test_expiring_cache_on_evict_receives_values():
+    evicted = []
+    cache = ExpiringCache(max_size=1, on_evict=lambda *args: evicted.append(args))
+    cache["a"] = 1
+    cache["b"] = 2
+
+    assert evicted == [("a", 1)]
+
+
+def test_tiered_cache(cache_path):
+    cache = TieredCache(DiskCache(cache_path), Cache(2))
+    for key in "abcd":
+        cache[key] = key.upper()
+
+    assert list(cache.memory.keys()) == ["c", "d"]
+    assert list(cache.disk.keys()) == ["a", "b"]
+    assert len(cache) == 4
+
+    # items read from disk are moved back to memory
+    assert cache["a"] == "A"
+    assert list(cache.memory.keys()) == ["d", "a"]
+    assert "c" in cache.disk
+
+    del cache["a"]
+    assert "a" not in cache
+    assert cache.get("a") is None
+    cache.close()
+
+    cache = TieredCache(DiskCache(cache_path), Cache(2))
+    assert cache["b"] == "B"
+    assert cache["c"] == "C"
+    assert cache["d"] == "D"
+    assert "a" not in cache
+    cache.close()
+
+
+def test_tiered_cache_does_not_rewrite_clean_items(cache_path):
+    cache = TieredCache(DiskCache(cache_path), Cache(1))
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"]
+    size = cache.disk.file_size
+
+    cache["b"]
+
+    assert cache.disk.file_size == size
+
+
+def test_tiered_cache_set_replaces_disk_value(cache_path):
+    cache = TieredCache(DiskCache(cache_path), Cache(1))
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["a"] = 3
+
+    assert "a" not in cache.disk
+    cache["b"]
+    assert cache.disk["a"] == 3
+
+
+def test_lazy_with_tiered_cache(cache_path):
+    calls = []
+
+    @lazy(10, TieredCache(DiskCache(cache_path), Cache(1)))
+    def render(name):
+        calls.append(name)
+        return f"<p>{name}</p>"
+
+    assert render("a") == "<p>a</p>"
+    assert render("b") == "<p>b</p>"
+    assert render("a") == "<p>a</p>"
+    assert calls == ["a", "b"]
@@ -0,0 +1,130 @@
+import pickle
+
+import pytest
+
+from essentials.caching import Cache, lazy, make_key
+
+
+def test_make_key_positional_arguments():
+    assert make_key((1, "a"), {}) == (1, "a")
+    assert make_key((), {}) == ()
+
+
+def test_make_key_keyword_arguments_order():
+    assert make_key((1,), {"a": 1, "b": 2}) == make_key((1,), {"b": 2, "a": 1})
+    assert make_key((1,), {"a": 1}) != make_key((1, 1), {})
+    assert make_key((1,), {"a": 1}) != make_key((1, "a", 1), {})
+
+
+def test_make_key_unhashable_arguments():
+    key = make_key(([1, 2], {"b": [3], "a": {4}}), {"c": bytearray(b"x")})
+    hash(key)
+
+    assert key == make_key(([1, 2], {"a": {4}, "b": [3]}), {"c": bytearray(b"x")})
+    assert make_key(([1, 2],), {}) != make_key(((1, 2),), {})
+    assert make_key(({1: 1},), {}) != make_key(({1: 2},), {})
+
+
+def test_make_key_unsupported_argument():
+    class Unhashable:
+        __hash__ = None  # type: ignore
+
+    with pytest.raises(TypeError):
+        make_key((Unhashable(),), {})
+
+
+def test_make_key_memoizes_hash_of_wide_keys():
+    hashes = []
+
+    class Argument:
+        def __hash__(self):
+            hashes.append(1)
+            return 1
+
+    key = make_key((Argument(), 1, 2, 3, 4), {})
+    cache = Cache()
+    cache[key] = 1
+    cache[key]
+    cache.get(key)
+
+    assert len(hashes) == 1
+    assert key == (key[0], 1, 2, 3, 4)
+
+
+def test_make_key_pickle_returns_tuple():
+    key = make_key((1, 2, 3, 4), {"a": 1})
+    restored = pickle.loads(pickle.dumps(key))
+
+    assert type(restored) is tuple
+    assert restored == key
+    assert hash(restored) == hash(key)
+
+
+def test_lazy_keyword_arguments():
+    calls = []
+
+    @lazy(10)
+    def get_value(a, b=0, *, c=0):
+        calls.append((a, b, c))
+        return a + b + c
+
+    assert get_value(1, b=2, c=3) == 6
+    assert get_value(1, c=3, b=2) == 6
+    assert get_value(1, 2, c=3) == 6
+    assert calls == [(1, 2, 3), (1, 2, 3)]
+
+
+def test_lazy_unhashable_arguments():
+    calls = []
+
+    @lazy(10)
+    def total(values, options=None):
+        calls.append(values)
+        return sum(values)
+
+    assert total([1, 2, 3], options={"a": 1}) == 6
+    assert total([1, 2, 3], options={"a": 1}) == 6
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("args", [(1, 2), ([1], 2), (1, 2, 3, 4, 5)])
+def test_lazy_positional_arguments_use_the_keys_of_make_key(args):
+    calls = []
+
+    @lazy(10)
+    def get_value(*args, **kwargs):
+        calls.append(args)
+        return len(calls)
+
+    assert get_value(*args) == 1
+    assert get_value(*args) == 1
+    assert make_key(args, {}) in get_value.cache
+    assert calls == [args]
+
+
+def test_lazy_key_function():
+    calls = []
+
+    @lazy(10, key=lambda user, **kwargs: user["id"])
+    def get_user_name(user, upper=False):
+        calls.append(user)
+        return user["name"].upper() if upper else user["name"]
+
+    assert get_user_name({"id": 1, "name": "a"}) == "a"
+    assert get_user_name({"id": 1, "name": "b"}, upper=True) == "a"
+    assert 1 in get_user_name.cache
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_keyword_arguments():
+    calls = []
+
+    @lazy(10)
+    async def get_value(a, *, b):
+        calls.append((a, b))
+        return a * b
+
+    assert await get_value(2, b=[3][0]) == 6
+    assert await get_value(2, b=3) == 6
+    assert calls == [(2, 3)]
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from essentials.caching import BatchLoader, ExpiringCache
+
+
+class Repository:
+    def __init__(self) -> None:
+        self.calls: list[list[int]] = []
+
+    def get_users(self, ids: list[int]) -> dict[int, str]:
+        self.calls.append(ids)
+        return {id: f"user {id}" for id in ids if id < 100}
+
+    async def get_users_async(self, ids: list[int]) -> dict[int, str]:
+        await asyncio.sleep(0.01)
+        return self.get_users(ids)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("coroutine", [False, True])
+async def test_batch_loader_batches_keys_of_the_same_loop_iteration(coroutine):
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(
+        repository.get_users_async if coroutine else repository.get_users
+    )
+
+    users = await asyncio.gather(*[loader.load(id) for id in [1, 2, 3, 2]])
+
+    assert users == ["user 1", "user 2", "user 3", "user 2"]
+    assert repository.calls == [[1, 2, 3]]
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_memoizes_values():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(repository.get_users_async)
+
+    assert await loader.load_many([1, 2]) == {1: "user 1", 2: "user 2"}
+    assert await loader.load_many([2, 3, 1]) == {2: "user 2", 3: "user 3", 1: "user 1"}
+    assert await loader.load(3) == "user 3"
+
+    assert repository.calls == [[1, 2], [3]]
+    assert loader.cache[1] == "user 1"
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_waits_for_keys_being_loaded():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(repository.get_users_async)
+
+    first = asyncio.ensure_future(loader.load(1))
+    await asyncio.sleep(0.001)
+    # the batch of key 1 is in progress
+    assert await loader.load_many([1, 2]) == {1: "user 1", 2: "user 2"}
+    assert await first == "user 1"
+
+    assert repository.calls == [[1], [2]]
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_missing_keys():
+    loader: BatchLoader[str] = BatchLoader(Repository().get_users)
+
+    assert await loader.load_many([1, 200]) == {1: "user 1"}
+    with pytest.raises(KeyError):
+        await loader.load(200)
+    assert 200 not in loader.cache
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_max_batch_size():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(repository.get_users, max_batch_size=2)
+
+    await asyncio.gather(*[loader.load(id) for id in range(5)])
+
+    assert repository.calls == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_errors_are_raised_to_all_callers():
+    calls = 0
+
+    async def fail(keys):
+        nonlocal calls
+        calls += 1
+        raise ValueError("service unavailable")
+
+    loader: BatchLoader[str] = BatchLoader(fail)
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), return_exceptions=True
+    )
+
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert calls == 1
+    # errors are not cached
+    with pytest.raises(ValueError):
+        await loader.load(1)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_key_errors_of_the_batch_function():
+    def fail(keys):
+        raise KeyError("x")
+
+    loader: BatchLoader[str] = BatchLoader(fail)
+
+    with pytest.raises(KeyError) as error:
+        await loader.load_many([1, 2])
+    assert error.value.args == ("x",)
+    with pytest.raises(KeyError) as error:
+        await loader.load(1)
+    assert error.value.args == ("x",)
+    with pytest.raises(KeyError) as error:
+        loader.load_sync(1)
+    assert error.value.args == ("x",)
+
+
+@pytest.mark.asyncio
+async def test_batch_loader_caller_cancellation():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(repository.get_users_async)
+
+    cancelled = asyncio.ensure_future(loader.load(1))
+    other = asyncio.ensure_future(loader.load(1))
+    await asyncio.sleep(0.001)
+    cancelled.cancel()
+
+    assert await other == "user 1"
+    assert repository.calls == [[1]]
+
+
+def test_batch_loader_batches_keys_requested_by_threads():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(repository.get_users, window=0.05)
+    barrier = threading.Barrier(4)
+
+    def load(id):
+        barrier.wait()
+        return loader.load_sync(id)
+
+    with ThreadPoolExecutor(4) as executor:
+        users = list(executor.map(load, [1, 2, 3, 4]))
+
+    assert users == ["user 1", "user 2", "user 3", "user 4"]
+    assert len(repository.calls) == 1
+    assert sorted(repository.calls[0]) == [1, 2, 3, 4]
+
+    assert loader.load_many_sync([4, 5, 200]) == {4: "user 4", 5: "user 5"}
+    assert repository.calls[1:] == [[5, 200]]
+    with pytest.raises(KeyError):
+        loader.load_sync(200)
+
+
+def test_batch_loader_threads_wait_for_keys_being_loaded():
+    calls = []
+
+    def slow(keys):
+        calls.append(keys)
+        time.sleep(0.05)
+        return {key: key * 2 for key in keys}
+
+    loader: BatchLoader[int] = BatchLoader(slow, window=0)
+    first = threading.Thread(target=loader.load_sync, args=(1,))
+    first.start()
+    time.sleep(0.01)
+
+    assert loader.load_many_sync([1, 2]) == {1: 2, 2: 4}
+    first.join()
+    assert calls == [[1], [2]]
+
+
+def test_batch_loader_threads_errors():
+    def fail(keys):
+        raise ValueError("service unavailable")
+
+    loader: BatchLoader[int] = BatchLoader(fail, window=0)
+
+    with pytest.raises(ValueError):
+        loader.load_sync(1)
+    assert len(loader._batches) == 0
+
+
+def test_batch_loader_threads_require_synchronous_batch_function():
+    loader: BatchLoader[str] = BatchLoader(Repository().get_users_async)
+
+    with pytest.raises(AssertionError):
+        loader.load_sync(1)
+
+
+def test_batch_loader_with_expiring_cache():
+    repository = Repository()
+    loader: BatchLoader[str] = BatchLoader(
+        repository.get_users, ExpiringCache.with_max_age(0.01), window=0
+    )
+
+    assert loader.load_sync(1) == "user 1"
+    assert loader.load_sync(1) == "user 1"
+    time.sleep(0.02)
+    assert loader.load_sync(1) == "user 1"
+    assert repository.calls == [[1], [1]]
@@ -0,0 +1,173 @@
+import asyncio
+import copy
+import gc
+import pickle
+import weakref
+
+import pytest
+
+from essentials.caching import CachedMethod, cached_method
+
+
+class Repository:
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    @cached_method(10, max_size=2)
+    def get_item(self, item_id, *, upper=False):
+        self.calls.append(item_id)
+        value = f"{self.name}:{item_id}"
+        return value.upper() if upper else value
+
+    @cached_method(10)
+    async def get_item_async(self, item_id):
+        await asyncio.sleep(0)
+        self.calls.append(item_id)
+        return f"{self.name}:{item_id}"
+
+
+def test_cached_method():
+    repository = Repository("a")
+
+    assert repository.get_item(1) == "a:1"
+    assert repository.get_item(1) == "a:1"
+    assert repository.get_item(1, upper=True) == "A:1"
+    assert repository.calls == [1, 1]
+
+
+def test_cached_method_cache_per_instance():
+    first = Repository("a")
+    second = Repository("b")
+
+    assert first.get_item(1) == "a:1"
+    assert second.get_item(1) == "b:1"
+    for i in range(10):
+        second.get_item(i)
+
+    # one instance does not evict the items of another instance
+    assert first.get_item(1) == "a:1"
+    assert first.calls == [1]
+    assert len(first.get_item.cache) == 1
+    assert len(second.get_item.cache) == 2
+    assert first.get_item == first.get_item
+    assert first.get_item.cache is first.get_item.cache
+
+
+def test_cached_method_frees_instances():
+    repository = Repository("a")
+    repository.get_item(1)
+    reference = weakref.ref(repository)
+
+    del repository
+    gc.collect()
+
+    assert reference() is None
+
+
+def test_cached_method_instances_freed_without_gc():
+    repository = Repository("a")
+    repository.get_item(1)
+    reference = weakref.ref(repository)
+
+    gc.disable()
+    try:
+        del repository
+        assert reference() is None
+    finally:
+        gc.enable()
+
+
+def test_cached_method_descriptor():
+    assert isinstance(Repository.get_item, CachedMethod)
+    assert Repository.get_item.__name__ == "get_item"
+
+
+def test_cached_method_requires_dict():
+    class Slotted:
+        __slots__ = ()
+
+        @cached_method(10)
+        def get_value(self):
+            return 1
+
+    with pytest.raises(TypeError):
+        Slotted().get_value()
+
+
+def test_cached_method_options():
+    class Service:
+        def __init__(self):
+            self.calls = 0
+
+        @cached_method(10, cache_errors=ConnectionError, track_stats=True)
+        def get_value(self):
+            self.calls += 1
+            raise ConnectionError()
+
+    service = Service()
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            service.get_value()
+
+    assert service.calls == 1
+    assert service.get_value.stats().hits == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_method_async():
+    repository = Repository("a")
+
+    results = await asyncio.gather(*[repository.get_item_async(1) for _ in range(3)])
+
+    assert results == ["a:1"] * 3
+    assert await repository.get_item_async(1) == "a:1"
+    assert repository.calls == [1]
+
+
+def test_cached_method_temporary_instances():
+    assert Repository("a").get_item(1) == "a:1"
+
+    get_item = Repository("b").get_item
+    gc.collect()
+    assert get_item(1) == "b:1"
+    assert get_item(1) == "b:1"
+    assert get_item.__self__.calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_cached_method_async_temporary_instances():
+    assert await Repository("a").get_item_async(1) == "a:1"
+
+
+def test_cached_method_called_through_the_class():
+    repository = Repository("a")
+
+    assert Repository.get_item(repository, 1) == "a:1"
+    assert repository.get_item(1) == "a:1"
+    assert repository.calls == [1]
+
+
+def test_cached_method_copies():
+    repository = Repository("a")
+    assert repository.get_item(1) == "a:1"
+
+    copied = copy.copy(repository)
+    copied.name = "b"
+    assert copied.get_item(1) == "b:1"
+    assert repository.get_item(1) == "a:1"
+
+    deep_copied = copy.deepcopy(repository)
+    deep_copied.name = "c"
+    assert deep_copied.get_item(1) == "c:1"
+
+
+def test_cached_method_pickle():
+    repository = Repository("a")
+    repository.get_item(1)
+
+    restored = pickle.loads(pickle.dumps(repository))
+    restored.name = "b"
+
+    assert restored.get_item(1) == "b:1"
+    assert repository.get_item(1) == "a:1"
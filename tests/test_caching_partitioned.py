@@ -0,0 +1,187 @@
+from collections import Counter
+
+import pytest
+
+from essentials.caching import (
+    Cache,
+    CacheTransport,
+    ExpiringCache,
+    HashRing,
+    LocalTransport,
+    PartitionedCache,
+    lazy,
+)
+
+
+def test_hash_ring_spreads_keys_evenly():
+    ring = HashRing(["a", "b", "c", "d"])
+
+    counts = Counter(ring.get_node(key) for key in range(10_000))
+
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert all(1500 < count < 3500 for count in counts.values())
+
+
+def test_hash_ring_adding_a_node_moves_few_keys():
+    ring = HashRing(["a", "b", "c", "d"])
+    before = {key: ring.get_node(key) for key in range(10_000)}
+
+    ring.add("e")
+    after = {key: ring.get_node(key) for key in range(10_000)}
+
+    moved = [key for key in before if before[key] != after[key]]
+    # keys move only to the new node
+    assert all(after[key] == "e" for key in moved)
+    assert 1000 < len(moved) < 3000
+
+    ring.remove("e")
+    assert {key: ring.get_node(key) for key in range(10_000)} == before
+
+
+def test_hash_ring_weights():
+    ring = HashRing(["a"])
+    ring.add("b", weight=3)
+
+    counts = Counter(ring.get_node(key) for key in range(10_000))
+
+    assert counts["b"] > 2 * counts["a"]
+
+
+def test_hash_ring_is_stable():
+    assert HashRing(["a", "b", "c"]).get_node("key") == HashRing(
+        ["c", "b", "a"]
+    ).get_node("key")
+
+
+def test_hash_ring_routes_equal_keys_to_the_same_node():
+    ring = HashRing(["n0", "n1", "n2"])
+    a = "user" + str(42)
+    b = "".join(["user", "42"])
+
+    assert ring.get_node((a, a)) == ring.get_node((a, b))
+    assert ring.get_node(1) == ring.get_node(1.0) == ring.get_node(True)
+
+
+def test_hash_ring_without_nodes():
+    with pytest.raises(KeyError):
+        HashRing().get_node("key")
+
+
+def test_partitioned_cache():
+    nodes = {name: LocalTransport() for name in ["a", "b", "c"]}
+    cache: PartitionedCache[int] = PartitionedCache(nodes)
+
+    cache["x"] = 1
+    cache.set_many({key: key for key in range(100)})
+
+    assert cache["x"] == 1
+    assert "x" in nodes[cache.get_node("x")].cache
+    assert cache.get("y") is None
+    with pytest.raises(KeyError):
+        cache["y"]
+    assert cache.get_many(range(98, 102)) == {98: 98, 99: 99}
+    assert all(len(node.cache) > 0 for node in nodes.values())
+
+    del cache["x"]
+    assert "x" not in cache
+    assert cache.delete_many([1, 2, "y"]) == 2
+
+    cache.clear()
+    assert all(len(node.cache) == 0 for node in nodes.values())
+
+
+def test_partitioned_cache_sends_one_request_per_node():
+    nodes = {name: LocalTransport() for name in ["a", "b"]}
+    cache: PartitionedCache[int] = PartitionedCache(nodes)
+
+    cache.set_many({key: key for key in range(100)})
+    cache.get_many(range(100))
+
+    assert [node.requests for node in nodes.values()] == [2, 2]
+
+
+def test_partitioned_cache_values_are_copies():
+    cache: PartitionedCache[list] = PartitionedCache({"a": LocalTransport()})
+    value = [1]
+    cache["x"] = value
+    value.append(2)
+
+    assert cache["x"] == [1]
+
+
+def test_partitioned_cache_add_and_remove_nodes():
+    cache: PartitionedCache[int] = PartitionedCache(
+        {name: LocalTransport() for name in ["a", "b", "c"]}
+    )
+    cache.set_many({key: key for key in range(1000)})
+
+    cache.add_node("d", LocalTransport())
+    assert len(cache.get_many(range(1000))) > 600
+
+    cache.remove_node("d")
+    assert len(cache.get_many(range(1000))) == 1000
+    assert list(cache.nodes) == ["a", "b", "c"]
+
+
+def test_partitioned_cache_near_cache():
+    node = LocalTransport()
+    cache: PartitionedCache[int] = PartitionedCache({"a": node}, near_cache=Cache(10))
+    cache["x"] = 1
+    node.requests = 0
+
+    assert cache["x"] == 1
+    assert cache.get_many(["x"]) == {"x": 1}
+    assert node.requests == 0
+
+    # values read from nodes are kept in the near cache
+    node.cache.clear()
+    node.set_many({"y": 2})
+    assert cache["y"] == 2
+    assert cache["y"] == 2
+    assert node.requests == 2
+
+    del cache["y"]
+    assert "y" not in cache
+    assert "y" not in node.cache
+
+
+def test_partitioned_cache_near_cache_expiration():
+    node = LocalTransport()
+    cache: PartitionedCache[int] = PartitionedCache(
+        {"a": node}, near_cache=ExpiringCache.with_max_age(0)
+    )
+    cache["x"] = 1
+    node.set_many({"x": 2})
+
+    assert cache["x"] == 2
+
+
+def test_partitioned_cache_as_lazy_cache():
+    calls = 0
+    cache: PartitionedCache = PartitionedCache(
+        {name: LocalTransport() for name in ["a", "b"]}
+    )
+
+    @lazy(10, cache)
+    def double(value):
+        nonlocal calls
+        calls += 1
+        return value * 2
+
+    assert [double(i) for i in range(10)] == [double(i) for i in range(10)]
+    assert calls == 10
+
+
+def test_cache_transports_must_implement_clear():
+    class Transport(CacheTransport):
+        def get_many(self, keys):
+            return {}
+
+        def set_many(self, items):
+            pass
+
+        def delete_many(self, keys):
+            return 0
+
+    with pytest.raises(TypeError):
+        Transport()  # type: ignore[abstract]
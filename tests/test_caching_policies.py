@@ -0,0 +1,198 @@
+import random
+
+import pytest
+
+from essentials.caching import (
+    ARCPolicy,
+    Cache,
+    ExpiringCache,
+    LFUPolicy,
+    SievePolicy,
+    TinyLFUPolicy,
+)
+from essentials.registry import TypeNotFoundException
+
+POLICIES = ["lfu", "sieve", "arc", "tinylfu"]
+
+
+@pytest.mark.parametrize(
+    "name,policy_type",
+    [
+        ("lfu", LFUPolicy),
+        ("sieve", SievePolicy),
+        ("arc", ARCPolicy),
+        ("tinylfu", TinyLFUPolicy),
+    ],
+)
+def test_policy_by_name(name, policy_type):
+    cache = Cache(10, policy=name)
+
+    assert isinstance(cache.policy, policy_type)
+
+
+def test_policy_by_configuration():
+    cache = Cache(100, policy={"type": "tinylfu", "window": 0.1})
+
+    assert isinstance(cache.policy, TinyLFUPolicy)
+    assert cache.policy._window_capacity == 10
+
+
+def test_policy_lru_is_default():
+    assert Cache().policy is None
+    assert Cache(policy="lru").policy is None
+
+
+def test_policy_not_found():
+    with pytest.raises(TypeNotFoundException):
+        Cache(policy="nope")
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+@pytest.mark.parametrize("cache_type", [Cache, ExpiringCache])
+def test_policy_keeps_max_size(policy, cache_type):
+    cache = cache_type(max_size=50, policy=policy)
+    rnd = random.Random(7)
+
+    for _ in range(5000):
+        key = int(rnd.paretovariate(1.2)) % 200
+        if cache.get(key) is None:
+            cache[key] = key
+        if rnd.random() < 0.05 and key in cache:
+            del cache[key]
+        assert len(cache) <= 50
+
+    # keys evicted by the policy are always keys of the cache
+    for key, value in cache:
+        assert key == value
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_policy_does_not_evict_inserted_item(policy):
+    cache = Cache(max_size=3, policy=policy)
+    for i in range(3):
+        cache[i] = i
+        cache[i]
+
+    cache["new"] = 1
+
+    assert cache["new"] == 1
+    assert len(cache) == 3
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_policy_clear_and_delete(policy):
+    cache = Cache(max_size=5, policy=policy)
+    for i in range(5):
+        cache[i] = i
+    del cache[2]
+    cache.clear()
+
+    for i in range(20):
+        cache[i] = i
+
+    assert len(cache) == 5
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_policy_with_max_weight(policy):
+    cache = Cache(max_weight=10, policy=policy)
+    for i in range(20):
+        cache[i] = "12"
+
+    assert cache.weight <= 10
+    assert len(cache) == 5
+
+
+def test_lfu_policy_keeps_frequently_used_items():
+    cache = Cache(max_size=3, policy="lfu")
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["c"] = 3
+    for _ in range(3):
+        cache["a"]
+        cache["c"]
+
+    cache["d"] = 4
+
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+
+
+def test_sieve_policy_keeps_visited_items_without_reordering():
+    cache = Cache(max_size=3, policy="sieve")
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["c"] = 3
+    cache["a"]
+
+    cache["d"] = 4
+
+    assert "b" not in cache
+    assert list(cache.keys()) == ["a", "c", "d"]
+
+    cache["e"] = 5
+
+    # the hand continues from where it stopped
+    assert "c" not in cache
+    assert "a" in cache
+
+
+def test_arc_policy_adapts_to_frequency():
+    cache = Cache(max_size=4, policy="arc")
+    for key in "abcd":
+        cache[key] = key
+    cache["a"]
+    cache["b"]
+
+    # items seen once are evicted before items seen twice
+    for key in "efgh":
+        cache[key] = key
+
+    assert "a" in cache
+    assert "b" in cache
+
+    # keys evicted recently and requested again return in the frequency list
+    cache["e"] = "e"
+    assert "e" in cache
+    assert len(cache) == 4
+
+
+def test_tinylfu_policy_resists_scans():
+    cache = Cache(max_size=100, policy="tinylfu")
+    hot = [f"hot_{i}" for i in range(50)]
+
+    for _ in range(5):
+        for key in hot:
+            if cache.get(key) is None:
+                cache[key] = key
+
+    for i in range(1000):
+        cache[f"scan_{i}"] = i
+
+    # frequency estimates can collide, nearly all popular items must survive
+    assert sum(1 for key in hot if key in cache) >= 45
+
+
+def test_lru_is_not_scan_resistant():
+    cache = Cache(max_size=100)
+    hot = [f"hot_{i}" for i in range(50)]
+
+    for _ in range(5):
+        for key in hot:
+            if cache.get(key) is None:
+                cache[key] = key
+
+    for i in range(1000):
+        cache[f"scan_{i}"] = i
+
+    assert not any(key in cache for key in hot)
+
+
+def test_policy_supports_none_key():
+    cache = Cache(max_size=2, policy="sieve")
+    cache[None] = 1
+    cache[1] = 1
+    cache[2] = 2
+
+    assert None not in cache
+    assert len(cache) == 2
@@ -0,0 +1,215 @@
+import threading
+import time
+
+import pytest
+
+from essentials.caching import Cache, ExpiringCache, ShardedCache
+
+
+def test_sharded_cache_getitem_throws_keyerror():
+    cache = ShardedCache()
+
+    with pytest.raises(KeyError):
+        cache["cat"]
+
+
+def test_sharded_cache_set_get():
+    cache = ShardedCache()
+    cache.set("cat", "Celine")
+    cache["dog"] = "Rex"
+
+    assert cache.get("cat") == "Celine"
+    assert cache["dog"] == "Rex"
+    assert cache.get("fish") is None
+    assert "cat" in cache
+    assert "fish" not in cache
+
+
+def test_sharded_cache_delitem_and_clear():
+    cache = ShardedCache()
+    for i in range(10):
+        cache[i] = i
+
+    del cache[3]
+    assert 3 not in cache
+    assert len(cache) == 9
+    assert not cache.is_empty
+
+    cache.clear()
+    assert cache.is_empty
+
+
+def test_sharded_cache_distributes_keys():
+    cache = ShardedCache(max_size=1000, shards=8)
+    for i in range(800):
+        cache[i] = i
+
+    assert len(cache) == 800
+    assert all(len(shard) > 0 for shard in cache._shards)
+    assert sorted(cache.keys()) == list(range(800))
+    assert sorted(cache.values()) == list(range(800))
+
+
+def test_sharded_cache_max_size():
+    cache = ShardedCache(max_size=40, shards=4)
+
+    assert cache.max_size == 40
+    assert cache.shards == 4
+
+    for i in range(1000):
+        cache[i] = i
+
+    assert len(cache) <= 40
+
+    cache.max_size = 8
+    assert cache.max_size == 8
+    assert len(cache) <= 8
+
+
+def test_sharded_cache_max_size_keeps_the_requested_value():
+    cache = ShardedCache(max_size=10, shards=4)
+
+    assert cache.max_size == 10
+    # each shard holds up to max_size / shards items, rounded up
+    assert all(shard.max_size == 3 for shard in cache._shards)
+
+
+def test_sharded_cache_factory():
+    cache = ShardedCache(
+        max_size=20, shards=2, factory=lambda size: ExpiringCache(lambda _: False, size)
+    )
+
+    assert all(isinstance(shard, ExpiringCache) for shard in cache._shards)
+    assert all(shard.max_size == 10 for shard in cache._shards)
+
+
+def test_sharded_cache_with_max_age():
+    cache = ShardedCache.with_max_age(0.05, max_size=32, shards=4)
+    cache["foo"] = "Foo"
+
+    assert cache["foo"] == "Foo"
+
+    time.sleep(0.1)
+
+    assert "foo" not in cache
+
+
+def test_sharded_cache_with_max_age_refresh_holds_the_shard_lock():
+    refreshed = threading.Event()
+
+    def refresh(key):
+        refreshed.set()
+        return key.upper()
+
+    cache = ShardedCache.with_max_age(
+        0.05, max_size=32, shards=4, stale_ttl=10, refresh=refresh
+    )
+    assert all(
+        shard._refresh_lock is lock  # type: ignore[attr-defined]
+        for shard, lock in zip(cache._shards, cache._locks)
+    )
+    cache["foo"] = "Foo"
+    time.sleep(0.1)
+
+    shard, lock = cache._locate("foo")
+    with lock:
+        assert shard["foo"] == "Foo"
+        assert refreshed.wait(1)
+        time.sleep(0.02)
+        assert shard["foo"] == "Foo"
+    time.sleep(0.02)
+    assert cache["foo"] == "FOO"
+
+
+def test_sharded_cache_set_options():
+    cache = ShardedCache.with_max_age(10, max_size=32, shards=4)
+    cache.set("foo", "Foo", ttl=0.05)
+    cache.set("ufo", "Ufo", tags=["x"])
+
+    assert cache["foo"] == "Foo"
+    time.sleep(0.1)
+    assert "foo" not in cache
+
+    assert cache.invalidate_tag("x") == 1
+    assert "ufo" not in cache
+
+
+def test_sharded_cache_get_or_create():
+    cache = ShardedCache.with_max_age(10, max_size=32, shards=4)
+    calls = []
+    started = threading.Event()
+
+    def factory():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "Foo"
+
+    thread = threading.Thread(target=cache.get_or_create, args=("foo", factory))
+    thread.start()
+    assert started.wait(1)
+    # the lock of the shard is not held while calling factory
+    cache["bar"] = "Bar"
+    assert cache.get_or_create("foo", factory) == "Foo"
+    thread.join()
+
+    assert calls == [1]
+    assert cache.get_or_create("ufo", lambda: "Ufo", ttl=0.05) == "Ufo"
+    time.sleep(0.1)
+    assert "ufo" not in cache
+
+
+def test_sharded_cache_get_or_create_does_not_cache_errors():
+    cache = ShardedCache()
+
+    def factory():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        cache.get_or_create("foo", factory)
+
+    assert "foo" not in cache
+    assert cache.get_or_create("foo", lambda: "Foo") == "Foo"
+
+
+def test_sharded_cache_repr():
+    cache = ShardedCache()
+    cache["foo"] = ...
+
+    assert repr(cache) == f"<ShardedCache 1 at {id(cache)}>"
+
+
+def test_sharded_cache_multithreaded():
+    cache = ShardedCache(max_size=256, shards=8)
+    errors = []
+
+    def work(offset: int):
+        try:
+            for i in range(2000):
+                key = (offset + i) % 512
+                cache[key] = key
+                value = cache.get(key)
+                assert value is None or value == key
+                if i % 7 == 0:
+                    list(cache)
+        except Exception as exc:  # pragma: no cover
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work, args=(n * 31,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(cache) <= cache.max_size
+    assert all(isinstance(shard, Cache) for shard in cache._shards)
+
+
+def test_sharded_cache_many():
+    cache = ShardedCache(max_size=64, shards=4)
+    cache.set_many({i: str(i) for i in range(20)})
+
+    assert cache.get_many([1, 5, 30]) == {1: "1", 5: "5"}
+    assert cache.delete_many(range(10)) == 10
+    assert len(cache) == 10
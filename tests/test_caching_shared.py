@@ -0,0 +1,176 @@
+import multiprocessing
+import subprocess
+import sys
+
+import pytest
+
+from essentials.caching import SharedMemoryCache, lazy
+
+
+@pytest.fixture
+def cache():
+    with SharedMemoryCache(64, 256) as cache:
+        yield cache
+
+
+def fill_cache(cache: SharedMemoryCache, worker: int) -> None:
+    for i in range(10):
+        cache[(worker, i)] = {"worker": worker, "value": i}
+
+
+def test_shared_memory_cache_set_get(cache):
+    cache["a"] = [1, 2, 3]
+    cache[("b", 1)] = "B"
+
+    assert cache["a"] == [1, 2, 3]
+    assert cache[("b", 1)] == "B"
+    assert cache.get("c") is None
+    assert "a" in cache
+    assert len(cache) == 2
+
+    with pytest.raises(KeyError):
+        cache["c"]
+
+
+def test_shared_memory_cache_overwrite_and_delete(cache):
+    cache["a"] = 1
+    cache["a"] = 2
+    del cache["a"]
+
+    assert "a" not in cache
+    assert len(cache) == 0
+
+    with pytest.raises(KeyError):
+        del cache["a"]
+
+
+def test_shared_memory_cache_clear(cache):
+    for i in range(10):
+        cache[i] = i
+    cache.clear()
+
+    assert len(cache) == 0
+
+
+def test_shared_memory_cache_item_too_large(cache):
+    with pytest.raises(ValueError):
+        cache["a"] = "x" * 300
+
+
+def test_shared_memory_cache_clock_eviction():
+    with SharedMemoryCache(4, 128, ways=4, locks=1) as cache:
+        for i in range(4):
+            cache[i] = i
+        cache[0]
+        cache[2]
+
+        cache[4] = 4
+        cache[5] = 5
+
+        # items read recently get a second chance
+        assert sorted(cache.keys()) == [0, 2, 4, 5]
+        assert cache.max_size == 4
+
+
+def test_shared_memory_cache_max_size_rounds_up():
+    with SharedMemoryCache(10, 128, ways=4) as cache:
+        for i in range(100):
+            cache[i] = i
+
+        assert cache.max_size == 12
+        assert len(cache) <= 12
+
+
+def test_shared_memory_cache_attach(cache):
+    cache["a"] = 1
+    # a process that is not a child of this process
+    script = (
+        "import threading\n"
+        "from essentials.caching import SharedMemoryCache\n"
+        f"cache = SharedMemoryCache.attach({cache.name!r}, [threading.Lock()])\n"
+        "cache['b'] = cache['a'] + 1\n"
+        "cache.close()\n"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+    assert cache["b"] == 2
+
+
+def test_shared_memory_cache_across_processes():
+    context = multiprocessing.get_context()
+    locks = [context.Lock() for _ in range(4)]
+
+    with SharedMemoryCache(64, 256, locks=locks) as cache:
+        workers = [
+            context.Process(target=fill_cache, args=(cache, worker))
+            for worker in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert len(cache) == 30
+        assert cache[(2, 5)] == {"worker": 2, "value": 5}
+
+
+def test_lazy_with_shared_memory_cache(cache):
+    calls = []
+
+    @lazy(10, cache)
+    def get_value(value):
+        calls.append(value)
+        return value * 2
+
+    assert get_value(2) == 4
+    assert get_value(2) == 4
+    assert calls == [2]
+
+
+def test_shared_memory_cache_equal_keys(cache):
+    a = "user" + str(42)
+    b = "".join(["user", "42"])
+    assert a is not b
+
+    cache[(a, a)] = "old"
+    cache[(a, b)] = "new"
+    assert cache[(a, a)] == "new"
+    assert len(cache) == 1
+
+    del cache[(b, b)]
+    assert cache.get((a, a)) is None
+
+    cache[1] = "one"
+    assert cache[1.0] == "one"
+    assert cache[True] == "one"
+    assert list(cache) == [(1, "one")]
+
+
+def test_shared_memory_cache_keys_round_trip(cache):
+    keys = [None, -12345678901234567890, 0.5, "è", b"\x00", ("a", (1, b"b"), ())]
+    for index, key in enumerate(keys):
+        cache[key] = index
+
+    assert sorted(cache, key=lambda item: item[1]) == [
+        (key, index) for index, key in enumerate(keys)
+    ]
+
+
+def test_shared_memory_cache_unsupported_keys(cache):
+    with pytest.raises(TypeError):
+        cache[object()] = 1
+    with pytest.raises(TypeError):
+        cache[frozenset([1])]
+
+
+def test_lazy_with_shared_memory_cache_and_keyword_arguments(cache):
+    calls = []
+
+    @lazy(10, cache)
+    def get_value(value, *, factor=2, options=None):
+        calls.append(value)
+        return value * factor
+
+    assert get_value(2, factor=3, options={"a": [1]}) == 6
+    assert get_value(2, options={"a": [1]}, factor=3) == 6
+    assert calls == [2]
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from essentials.caching import Cache, CacheStats, ExpiringCache, ShardedCache, lazy
+
+
+@pytest.mark.parametrize(
+    "cache",
+    [
+        Cache(max_size=2, track_stats=True),
+        ExpiringCache(max_size=2, track_stats=True),
+    ],
+)
+def test_cache_stats(cache: Cache):
+    cache["a"] = 1
+    cache["b"] = 2
+
+    assert cache["a"] == 1
+    assert cache.get("a") == 1
+    assert cache.get("c") is None
+
+    cache["c"] = 3
+
+    stats = cache.stats()
+    assert stats == CacheStats(hits=2, misses=1, evictions=1)
+    assert stats.requests == 3
+    assert stats.hit_ratio == 2 / 3
+
+    cache.reset_stats()
+    assert cache.stats() == CacheStats()
+
+
+def test_cache_stats_disabled_by_default():
+    cache = Cache()
+    cache["a"] = 1
+    cache.get("a")
+    cache.get("b")
+
+    assert cache.track_stats is False
+    assert cache.stats() == CacheStats()
+
+    cache.track_stats = True
+    cache.get("a")
+    assert cache.stats().hits == 1
+
+    cache.track_stats = False
+    assert cache.stats() == CacheStats()
+
+
+def test_expiring_cache_stats_expirations():
+    cache = ExpiringCache.with_max_age(0.05, max_size=3, track_stats=True)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache["c"] = 3
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    cache["d"] = 4
+    cache["e"] = 5
+
+    stats = cache.stats()
+    assert stats.misses == 1
+    assert stats.expirations == 3
+    assert stats.evictions == 0
+
+
+def test_expiring_cache_contains_does_not_count():
+    cache = ExpiringCache(track_stats=True)
+    cache["a"] = 1
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats() == CacheStats()
+
+
+def test_sharded_cache_stats():
+    cache = ShardedCache(max_size=8, shards=4, track_stats=True)
+    for i in range(4):
+        cache[i] = i
+    for i in range(8):
+        cache.get(i)
+
+    assert cache.stats() == CacheStats(hits=4, misses=4)
+
+    cache.reset_stats()
+    assert cache.stats() == CacheStats()
+
+
+def test_cache_stats_sum():
+    assert CacheStats(1, 2, 3, 4, 5, 0.5) + CacheStats(1, 1, 1, 1, 1, 0.5) == (
+        CacheStats(2, 3, 4, 5, 6, 1.0)
+    )
+    assert CacheStats(loads=2, load_time=1.0).average_load_time == 0.5
+    assert CacheStats().hit_ratio == 0.0
+
+
+def test_lazy_stats():
+    @lazy(0.05, track_stats=True)
+    def get_value(value):
+        time.sleep(0.01)
+        return value
+
+    for _ in range(3):
+        get_value(1)
+    get_value(2)
+    time.sleep(0.1)
+    get_value(1)
+
+    stats = get_value.stats()
+    assert stats.hits == 2
+    assert stats.misses == 3
+    assert stats.expirations == 1
+    assert stats.loads == 3
+    assert stats.load_time >= 0.03
+
+    get_value.reset_stats()
+    assert get_value.stats() == CacheStats()
+
+
+def test_lazy_stats_disabled_by_default():
+    @lazy(1)
+    def get_value():
+        return 1
+
+    get_value()
+
+    assert get_value.stats() == CacheStats()
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_stats():
+    @lazy(10, track_stats=True)
+    async def get_value():
+        await asyncio.sleep(0.01)
+        return 1
+
+    await asyncio.gather(*[get_value() for _ in range(5)])
+    await get_value()
+
+    stats = get_value.stats()
+    assert stats.misses == 5
+    assert stats.hits == 1
+    assert stats.loads == 1
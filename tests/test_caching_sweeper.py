@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from essentials.caching import ExpirationSweeper, ExpiringCache, ShardedCache
+
+
+def test_remove_expired():
+    cache = ExpiringCache.with_max_age(0.05, track_stats=True)
+    for i in range(10):
+        cache[i] = i
+    cache.set("long", 1, ttl=10)
+    time.sleep(0.1)
+
+    assert cache.remove_expired() == 10
+    assert list(cache.keys()) == ["long"]
+    assert cache.stats().expirations == 10
+
+
+def test_remove_expired_keeps_items_served_stale():
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=lambda key: key)
+    cache["a"] = 1
+    time.sleep(0.1)
+
+    assert cache.remove_expired() == 0
+    assert "a" in cache._bag
+
+
+def test_remove_expired_by_policy_resumes():
+    cache = ExpiringCache(lambda item: item.value % 2 == 0, max_size=10_000)
+    for i in range(5000):
+        cache[i] = i
+
+    removed = 0
+    calls = 0
+    while len(cache) > 2500:
+        removed += cache.remove_expired(max_time=0.0001)
+        calls += 1
+
+    assert removed == 2500
+    assert calls > 1
+
+
+def test_sweeper_sweep():
+    cache = ExpiringCache.with_max_age(0.05)
+    for i in range(100):
+        cache[i] = i
+    time.sleep(0.1)
+    sweeper = ExpirationSweeper(cache, max_batch_time=0.00001)
+
+    assert sweeper.sweep() == 100
+    assert len(cache) == 0
+    assert sweeper.reclaimed == 100
+    assert sweeper.last_reclaimed == 100
+    assert sweeper.sweep() == 0
+    assert sweeper.reclaimed == 100
+    assert sweeper.last_reclaimed == 0
+    assert sweeper.sweeps == 2
+
+
+def test_sweeper_thread():
+    lock = threading.Lock()
+    cache = ExpiringCache.with_max_age(0.02)
+    with lock:
+        for i in range(10):
+            cache[i] = i
+
+    with ExpirationSweeper(cache, 0.01, lock=lock) as sweeper:
+        assert sweeper.running
+        time.sleep(0.1)
+        with lock:
+            assert len(cache._bag) == 0
+
+    assert not sweeper.running
+    assert sweeper.reclaimed == 10
+
+
+def test_sweeper_sharded_cache():
+    cache = ShardedCache.with_max_age(0.02, max_size=64, shards=4)
+    for i in range(20):
+        cache[i] = i
+    time.sleep(0.05)
+
+    sweeper = ExpirationSweeper(cache)
+
+    assert sweeper.sweep() == 20
+
+
+def test_sweeper_sharded_cache_requires_expiring_shards():
+    with pytest.raises(AssertionError):
+        ExpirationSweeper(ShardedCache())
+
+
+@pytest.mark.asyncio
+async def test_sweeper_task():
+    cache = ExpiringCache.with_max_age(0.02)
+    for i in range(10):
+        cache[i] = i
+
+    sweeper = ExpirationSweeper(cache, 0.01)
+    task = sweeper.start_task()
+    assert sweeper.running
+    await asyncio.sleep(0.1)
+    sweeper.stop()
+    await asyncio.sleep(0)
+
+    assert task.done()
+    assert not sweeper.running
+    assert len(cache._bag) == 0
+    assert sweeper.reclaimed == 10
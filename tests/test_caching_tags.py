@@ -0,0 +1,148 @@
+import threading
+import time
+
+import pytest
+
+from essentials.caching import Cache, ExpiringCache, ShardedCache
+
+CACHE_TYPES = [Cache, ExpiringCache]
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+def test_invalidate_tag(cache_type):
+    cache = cache_type()
+    cache.set("a", 1, tags=["tenant:1"])
+    cache.set("b", 2, tags=["tenant:1", "users"])
+    cache.set("c", 3, tags=["tenant:2", "users"])
+    cache.set("d", 4)
+
+    assert cache.invalidate_tag("tenant:1") == 2
+    assert list(cache.keys()) == ["c", "d"]
+    assert cache.invalidate_tag("tenant:1") == 0
+    assert cache.invalidate_tag("users") == 1
+    assert list(cache.keys()) == ["d"]
+    assert cache._tags == {}
+    assert cache._key_tags == {}
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+def test_set_replaces_tags(cache_type):
+    cache = cache_type()
+    cache.set("a", 1, tags=["x"])
+    cache.set("a", 2, tags=["y"])
+
+    assert cache.invalidate_tag("x") == 0
+    assert "a" in cache
+
+    cache["a"] = 3
+    assert cache.invalidate_tag("y") == 0
+    assert cache["a"] == 3
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+def test_tags_index_follows_eviction(cache_type):
+    cache = cache_type(max_size=2)
+    for i in range(5):
+        cache.set(i, i, tags=["all", f"item:{i}"])
+
+    assert cache._tags == {"all": {3, 4}, "item:3": {3}, "item:4": {4}}
+    assert cache.invalidate_tag("all") == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+def test_tags_index_follows_delete_and_clear(cache_type):
+    cache = cache_type()
+    cache.set("a", 1, tags=["x"])
+    cache.set("b", 2, tags=["x"])
+    del cache["a"]
+
+    assert cache._tags == {"x": {"b"}}
+
+    cache.clear()
+    assert cache._tags == {}
+    assert cache._key_tags == {}
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+def test_set_many_with_tags(cache_type):
+    cache = cache_type()
+    cache.set_many({"a": 1, "b": 2}, tags=["x"])
+    cache.set_many({"c": 3})
+
+    assert cache.invalidate_tag("x") == 2
+    assert list(cache.keys()) == ["c"]
+
+
+def test_tags_index_follows_expiration():
+    cache = ExpiringCache(max_size=2)
+    cache.set("a", 1, ttl=0.01, tags=["x"])
+    cache.set("b", 2, tags=["x"])
+    time.sleep(0.05)
+
+    assert cache.get("a") is None
+    assert cache._tags == {"x": {"b"}}
+
+
+def test_sharded_cache_invalidate_tag():
+    cache = ShardedCache(max_size=64, shards=4)
+    for i in range(20):
+        cache.set(i, i, tags=["even" if i % 2 == 0 else "odd"])
+
+    assert cache.invalidate_tag("even") == 10
+    assert sorted(cache.keys()) == list(range(1, 20, 2))
+
+
+def test_refreshed_items_keep_their_tags():
+    release = threading.Event()
+    refreshed = threading.Event()
+
+    def refresh(key):
+        release.wait(1)
+        refreshed.set()
+        return key.upper()
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=10, refresh=refresh)
+    cache.set("a", "a", tags=["tenant:1"])
+    time.sleep(0.1)
+
+    assert cache["a"] == "a"
+    release.set()
+    assert refreshed.wait(1)
+    time.sleep(0.02)
+    assert cache["a"] == "A"
+    assert cache._key_tags == {"a": frozenset(["tenant:1"])}
+    assert cache.invalidate_tag("tenant:1") == 1
+    assert "a" not in cache
+
+
+def test_expired_tagged_items_are_not_restored_by_refresh():
+    release = threading.Event()
+
+    def refresh(key):
+        release.wait(1)
+        return key.upper()
+
+    cache = ExpiringCache.with_max_age(0.05, stale_ttl=0.05, refresh=refresh)
+    cache.set("a", "a", tags=["tenant:1"])
+    time.sleep(0.07)
+
+    assert cache["a"] == "a"
+    time.sleep(0.05)
+    # the stale window elapsed while refreshing
+    assert "a" not in cache
+    release.set()
+    time.sleep(0.02)
+    assert "a" not in cache
+    assert cache._tags == {}
+
+
+def test_sharded_cache_set_many_options():
+    cache = ShardedCache.with_max_age(10, max_size=64, shards=4)
+    cache.set_many({i: i for i in range(10)}, tags=["x"])
+    cache.set_many({"a": 1, "b": 2}, ttl=0.05)
+
+    assert cache.invalidate_tag("x") == 10
+    assert sorted(cache.keys()) == ["a", "b"]
+    time.sleep(0.1)
+    assert "a" not in cache
@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+
+from essentials.caching import ExpiringCache, WriteBehindCache
+
+
+class Store:
+    def __init__(self) -> None:
+        self.batches: list[dict] = []
+        self.fail = False
+
+    def write(self, items: dict) -> None:
+        if self.fail:
+            raise ConnectionError()
+        self.batches.append(items)
+
+    async def write_async(self, items: dict) -> None:
+        await asyncio.sleep(0.001)
+        self.write(items)
+
+
+def test_write_behind_cache_coalesces_changes():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(store.write)
+
+    for i in range(10):
+        cache["counter"] = i
+    cache["other"] = 1
+
+    assert cache["counter"] == 9
+    assert cache.pending == 2
+    assert store.batches == []
+
+    assert cache.flush() == 2
+    assert store.batches == [{"counter": 9, "other": 1}]
+    assert cache.pending == 0
+    assert cache.flush() == 0
+
+
+def test_write_behind_cache_flushes_when_max_pending_is_reached():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(store.write, max_pending=3)
+
+    for i in range(3):
+        cache[i] = i
+
+    for _ in range(100):
+        if store.batches:
+            break
+        time.sleep(0.01)
+    assert store.batches == [{0: 0, 1: 1, 2: 2}]
+
+
+def test_write_behind_cache_flushes_periodically_and_on_close():
+    store = Store()
+
+    with WriteBehindCache(store.write, interval=0.02) as cache:
+        cache["a"] = 1
+        time.sleep(0.1)
+        assert store.batches == [{"a": 1}]
+        cache["b"] = 2
+
+    assert store.batches == [{"a": 1}, {"b": 2}]
+
+
+def test_write_behind_cache_writes_evicted_items():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(
+        store.write, ExpiringCache(max_size=2)
+    )
+    cache.set("a", 1, ttl=10)
+    cache["b"] = 2
+    cache["c"] = 3
+
+    assert "a" not in cache
+    cache.flush()
+    assert store.batches == [{"a": 1, "b": 2, "c": 3}]
+
+
+def test_write_behind_cache_delete_discards_pending_write():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(store.write)
+    cache["a"] = 1
+    cache["b"] = 2
+    del cache["a"]
+
+    cache.flush()
+    assert store.batches == [{"b": 2}]
+
+
+def test_write_behind_cache_keeps_items_when_the_sink_fails():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(store.write)
+    cache["a"] = 1
+    cache["b"] = 1
+    store.fail = True
+
+    with pytest.raises(ConnectionError):
+        cache.flush()
+
+    store.fail = False
+    cache["a"] = 2
+    assert cache.flush() == 2
+    assert store.batches == [{"a": 2, "b": 1}]
+
+    stats = cache.flush_stats()
+    assert stats.flushes == 1
+    assert stats.items == 2
+    assert stats.errors == 1
+
+
+def test_write_behind_cache_flush_stats():
+    def slow_write(items):
+        time.sleep(0.01)
+
+    cache: WriteBehindCache[int] = WriteBehindCache(slow_write)
+    for i in range(2):
+        cache["a"] = i
+        cache.flush()
+
+    stats = cache.flush_stats()
+    assert stats.flushes == 2
+    assert stats.items == 2
+    assert stats.last_flush_time >= 0.01
+    assert stats.max_flush_time >= stats.last_flush_time
+    assert stats.average_flush_time == pytest.approx(stats.flush_time / 2)
+
+
+@pytest.mark.asyncio
+async def test_write_behind_cache_async_sink():
+    store = Store()
+
+    async with WriteBehindCache(store.write_async, max_pending=2) as cache:
+        cache["a"] = 1
+        cache["b"] = 2
+        await asyncio.sleep(0.05)
+        assert store.batches == [{"a": 1, "b": 2}]
+        cache["c"] = 3
+
+    assert store.batches == [{"a": 1, "b": 2}, {"c": 3}]
+    assert cache.flush_stats().flushes == 2
+
+
+@pytest.mark.asyncio
+async def test_write_behind_cache_async_periodic_flush():
+    store = Store()
+    cache: WriteBehindCache[int] = WriteBehindCache(store.write_async, interval=0.02)
+    cache.start_task()
+    cache["a"] = 1
+
+    await asyncio.sleep(0.1)
+    assert store.batches == [{"a": 1}]
+    await cache.aclose()
+
+
+def test_write_behind_cache_async_sink_requires_flush_async():
+    cache: WriteBehindCache[int] = WriteBehindCache(Store().write_async)
+    cache["a"] = 1
+
+    with pytest.raises(AssertionError):
+        cache.flush()
+    assert cache.pending == 1